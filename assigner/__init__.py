@@ -1 +1,2 @@
-from .assigner import Assigner
\ No newline at end of file
+from .assigner import Assigner
+from .color_engine import get_beyblade_colors, get_crops_colors
\ No newline at end of file
@@ -1,22 +1,39 @@
-from sklearn.cluster import KMeans
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import profiler
+from .color_engine import get_beyblade_colors, get_nearest_teams
 
 class Assigner:
-    def __init__(self):
+    def __init__(self, color_method='fast', min_votes=3, vote_decay=0.9, recheck_interval=30, num_teams=2):
         # Initialize dictionaries to store beyblade colors and assignments
         self.beyblade_colors = {}
         self.beyblade_assigner_dict = {}
-    
+        self.color_method = color_method  # 'fast' masked mean colors or 'kmeans' per-crop clustering
+        self.min_votes = min_votes  # Votes a track needs before its team is cached
+        self.vote_decay = vote_decay  # Decay of older votes so a swapped track id can flip team
+        self.recheck_interval = recheck_interval  # Calls between re-checks of a cached track
+        self.track_votes = {}  # Decayed team votes per track id
+        self.track_vote_counts = {}  # Votes since the team of a track was last in doubt
+        self.track_checked = {}  # Call counter value of the last vote per track id
+        self.frame_count = 0  # Number of get_beyblade_teams calls
+        self.num_teams = num_teams  # Number of team colors clustered from the beyblades
+
     def get_clustering_model(self, image):
         # Reshape the image into a 2D array for clustering
         image_2d = image.reshape(-1, 3)
 
         # Perform K-means clustering with 2 clusters
+        from sklearn.cluster import KMeans
         kmeans = KMeans(n_clusters=2, init="k-means++", n_init=1)
         kmeans.fit(image_2d)
 
         return kmeans
 
     def get_beyblade_color(self, frame, bbox):
+        if self.color_method == 'fast':
+            return get_beyblade_colors(frame, [bbox])[0]
+
         # Extract the region of interest from the frame using bounding box
         image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
 
@@ -41,36 +58,78 @@ class Assigner:
 
         return beyblade_color
 
+    def get_beyblade_colors(self, frame, bboxes):
+        # Colors of several bboxes of a frame, in one vectorized pass for the fast method
+        if self.color_method == 'fast':
+            return get_beyblade_colors(frame, bboxes)
+        return np.array([self.get_beyblade_color(frame, bbox) for bbox in bboxes]).reshape(-1, 3)
+
     def assign_beyblade_color(self, frame, beyblade_detections):
-        # List to store detected beyblade colors
-        beyblade_colors = []
-        for _, beyblade_detection in beyblade_detections.items():
-            bbox = beyblade_detection["bbox"]
-            beyblade_color = self.get_beyblade_color(frame, bbox)
-            beyblade_colors.append(beyblade_color)
+        # Detected beyblade colors
+        bboxes = [beyblade_detection["bbox"] for beyblade_detection in beyblade_detections.values()]
+        self.fit_team_colors(self.get_beyblade_colors(frame, bboxes))
+
+    def fit_team_colors(self, beyblade_colors):
+        # Cluster the colors of the beyblades of one frame into the team colors
+        beyblade_colors = np.asarray(beyblade_colors, dtype=np.float64).reshape(-1, 3)
 
-        # Perform K-means clustering on the detected beyblade colors
-        kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10)
-        kmeans.fit(beyblade_colors)
+        # Perform K-means clustering on the detected beyblade colors, seeded so team labels are stable between runs.
+        # sklearn is imported on first use, it is the slowest import of the analysis
+        from sklearn.cluster import KMeans
+        kmeans = KMeans(n_clusters=self.num_teams, init="k-means++", n_init=10, random_state=0)
+        with profiler.stage('team_kmeans'):
+            kmeans.fit(beyblade_colors)
 
         # Store the clustering model and assign cluster centers to beyblades
         self.kmeans = kmeans
-        self.beyblade_colors[1] = kmeans.cluster_centers_[0]
-        self.beyblade_colors[2] = kmeans.cluster_centers_[1]
+        for team, center in enumerate(kmeans.cluster_centers_, start=1):
+            self.beyblade_colors[team] = center
+
+    def get_beyblade_teams(self, frame, beyblade_ids, beyblade_bboxes, beyblade_colors=None):
+        # Teams of all beyblades of a frame. Colors are only computed, in one batch, for tracks
+        # without enough votes yet and for cached tracks that are due for a re-check. Colors that
+        # were already measured (e.g. by sharded workers) can be given instead of the frame
+        self.frame_count += 1
+        pending = [i for i, beyblade_id in enumerate(beyblade_ids)
+                   if beyblade_id not in self.beyblade_assigner_dict
+                   or self.frame_count - self.track_checked[beyblade_id] >= self.recheck_interval]
+
+        profiler.count('team_cache_hits', len(beyblade_ids) - len(pending))
+        profiler.count('team_color_checks', len(pending))
+        if pending:
+            if beyblade_colors is not None:
+                colors = np.asarray(beyblade_colors, dtype=np.float64)[pending]
+            else:
+                with profiler.stage('team_colors'):
+                    colors = self.get_beyblade_colors(frame, [beyblade_bboxes[i] for i in pending])
+            for i, team in zip(pending, get_nearest_teams(colors, self.beyblade_colors)):
+                self.add_vote(beyblade_ids[i], team)
+
+        return [self.beyblade_assigner_dict.get(beyblade_id) or self.get_voted_team(beyblade_id)
+                for beyblade_id in beyblade_ids]
+
+    def add_vote(self, beyblade_id, team):
+        # Add a decayed vote for a track and cache its team once it has min_votes votes
+        votes = self.track_votes.setdefault(beyblade_id, {key: 0.0 for key in self.beyblade_colors})
+        for key in votes:
+            votes[key] *= self.vote_decay
+        votes[team] += 1.0
+        self.track_vote_counts[beyblade_id] = self.track_vote_counts.get(beyblade_id, 0) + 1
+        self.track_checked[beyblade_id] = self.frame_count
+
+        # A re-check that disagrees (e.g. ByteTrack swapped ids) drops the cached team,
+        # so the track is voted on every frame again until it is conclusive
+        if beyblade_id in self.beyblade_assigner_dict and team != self.beyblade_assigner_dict[beyblade_id]:
+            del self.beyblade_assigner_dict[beyblade_id]
+            self.track_vote_counts[beyblade_id] = 0
+        elif self.track_vote_counts[beyblade_id] >= self.min_votes:
+            self.beyblade_assigner_dict[beyblade_id] = self.get_voted_team(beyblade_id)
+
+    def get_voted_team(self, beyblade_id):
+        # Team with the most votes for a track
+        votes = self.track_votes[beyblade_id]
+        return max(votes, key=votes.get)
 
     def get_beyblade_team(self, frame, beyblade_bbox, beyblade_id):
-        # Check if beyblade has already been assigned a team
-        if beyblade_id in self.beyblade_assigner_dict:
-            return self.beyblade_assigner_dict[beyblade_id]
-
-        # Get the beyblade's color from the bounding box
-        beyblade_color = self.get_beyblade_color(frame, beyblade_bbox)
-
-        # Predict which team the beyblade belongs to using K-means
-        beyblade_id = self.kmeans.predict(beyblade_color.reshape(1, -1))[0]
-        beyblade_id += 1
-
-        # Store the assignment of beyblade to a specific team
-        self.beyblade_assigner_dict[beyblade_id] = beyblade_id
-
-        return beyblade_id
+        # Single beyblade version of get_beyblade_teams
+        return self.get_beyblade_teams(frame, [beyblade_id], [beyblade_bbox])[0]
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+
+def get_crops(frame, bboxes, size=16):
+    # Crop every bbox from the frame and resize the crops to a common size x size grid
+    crops = np.zeros((len(bboxes), size, size, 3), dtype=np.float32)
+    height, width = frame.shape[:2]
+    for i, bbox in enumerate(bboxes):
+        x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+        x2, y2 = min(width, int(bbox[2])), min(height, int(bbox[3]))
+        if x2 > x1 and y2 > y1:
+            crops[i] = cv2.resize(frame[y1:y2, x1:x2], (size, size), interpolation=cv2.INTER_AREA)
+    return crops
+
+def get_crops_colors(crops):
+    # Foreground color of a stack of (N, size, size, 3) crops in one vectorized pass:
+    # the background is the median border color, and pixels farther from it than the
+    # crop's mean distance are averaged as the beyblade
+    border = np.concatenate([crops[:, 0], crops[:, -1], crops[:, 1:-1, 0], crops[:, 1:-1, -1]], axis=1)
+    background = np.median(border, axis=1)
+    distance = np.linalg.norm(crops - background[:, None, None], axis=-1)
+    foreground = distance > distance.mean(axis=(1, 2), keepdims=True)
+
+    weights = foreground[..., None].astype(np.float32)
+    counts = weights.sum(axis=(1, 2))
+    colors = (crops * weights).sum(axis=(1, 2)) / np.maximum(counts, 1)
+
+    # Uniform crops have no foreground, their mean color is used instead
+    uniform = counts[:, 0] == 0
+    colors[uniform] = crops[uniform].mean(axis=(1, 2))
+    return colors
+
+def get_beyblade_colors(frame, bboxes, size=16):
+    # Beyblade colors of all bboxes of a frame
+    if len(bboxes) == 0:
+        return np.zeros((0, 3), dtype=np.float32)
+    return get_crops_colors(get_crops(frame, bboxes, size))
+
+def get_nearest_teams(colors, team_colors):
+    # Team (key of team_colors) whose color is nearest to each color
+    teams = list(team_colors.keys())
+    centers = np.array([team_colors[team] for team in teams], dtype=np.float32)
+    distance = np.linalg.norm(np.asarray(colors, dtype=np.float32)[:, None] - centers[None], axis=-1)
+    return [teams[i] for i in distance.argmin(axis=1)]
@@ -1 +1,9 @@
-from .battle import Battle
\ No newline at end of file
+from .battle import Battle
+from .rotation import RotationDetector
+from .battle_log import BattleLogWriter, write_battle_log, read_battle_log
+from .live import LiveBattle
+from .arena import Arena, DEFAULT_VERTICES
+from .features import BattleFeatures, FeatureRecorder
+from .sweep import PARAM_NAMES, get_param_grid, sweep, score_sweep
+from .highlights import HighlightRenderer, get_highlight_events, get_highlight_ranges
+from .rounds import get_active_counts, get_round_ranges
\ No newline at end of file
@@ -0,0 +1,73 @@
+import cv2
+import json
+import os
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import points_in_polygon
+
+# Battle polygon of the original 1920x1080 camera setup
+DEFAULT_VERTICES = ((779,0),(175,400),(245,1080),(1750,1080),(1820,400),(1250,0))
+
+class Arena:
+    def __init__(self, vertices=DEFAULT_VERTICES, roi_margin=32, roi_scale=1.0):
+        # Battle polygon of one camera setup, plus the crop used for arena-ROI detection
+        self.vertices = np.array(vertices, dtype=np.int32)
+        self.roi_margin = roi_margin  # Pixels kept around the polygon so beyblades on its border are fully visible
+        self.roi_scale = roi_scale  # Resize factor of the cropped frames before detection
+        self.origin = self.vertices.min(axis=0)  # Top-left corner of the polygon mask
+        self.mask = None  # Polygon membership of every pixel of the bounding rectangle, rasterized on first use
+
+    def get_mask(self):
+        # Rasterize the polygon once. cv2.fillPoly differs from cv2.pointPolygonTest along the
+        # slanted edges, so the pixels near the edges are redone with the exact point test.
+        # The extra last row and column stay False for positions clipped from outside the rectangle
+        if self.mask is None:
+            width, height = self.vertices.max(axis=0) - self.origin + 1
+            vertices = self.vertices - self.origin
+            fill = np.zeros((height + 1, width + 1), dtype=np.uint8)
+            cv2.fillPoly(fill, [vertices], 1)
+            edges = np.zeros_like(fill)
+            cv2.polylines(edges, [vertices], isClosed=True, color=1, thickness=5)
+            ys, xs = np.nonzero(edges)
+            fill[ys, xs] = points_in_polygon(np.stack([xs, ys], axis=1), vertices)
+            fill[height, :] = fill[:, width] = 0
+            self.mask = fill.view(bool)
+        return self.mask
+
+    def contains(self, points):
+        # Vectorized polygon membership of (N, 2) positions, points on the border count as inside.
+        # Integer positions (all track positions) are a mask lookup, others use the point test
+        points = np.asarray(points).reshape(-1, 2)
+        if not np.issubdtype(points.dtype, np.integer):
+            return points_in_polygon(points, self.vertices)
+        mask = self.get_mask()
+        # Index -1 and the last index both land on the False border of the mask
+        x = np.clip(points[:, 0] - self.origin[0], -1, mask.shape[1] - 1)
+        y = np.clip(points[:, 1] - self.origin[1], -1, mask.shape[0] - 1)
+        return mask[y, x]
+
+    def get_roi(self):
+        # (x1, y1, x2, y2) crop of the polygon's bounding rectangle plus the margin. Frames clip the
+        # far edges when sliced, so only the near edges are clamped here
+        x1, y1 = np.maximum(self.origin - self.roi_margin, 0)
+        x2, y2 = self.vertices.max(axis=0) + self.roi_margin + 1
+        return int(x1), int(y1), int(x2), int(y2)
+
+    def to_dict(self):
+        # Vertices as 'x,y' strings, the same format as the --arena_vertices option
+        return {'vertices': [f'{x},{y}' for x, y in self.vertices.tolist()], 'roi_margin': self.roi_margin, 'roi_scale': self.roi_scale}
+
+    def save(self, path):
+        # Persist the geometry of a camera setup as JSON
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        vertices = [tuple(int(value) for value in point.split(',')) for point in config['vertices']]
+        return cls(vertices, config.get('roi_margin', 32), config.get('roi_scale', 1.0))
@@ -3,77 +3,101 @@ import numpy as np
 import pandas as pd
 import sys 
 sys.path.append('../')
-from utils import is_overlapping
+from utils import profiler, get_center_of_bbox
+from .arena import Arena
+from .rotation import RotationDetector
+from .battle_log import get_battle_stat_dtypes, write_battle_log
+from .interactions import InteractionEngine
 
 class Battle:
-    def __init__(self):
+    def __init__(self, rotation_detector=None, fps=30, arena=None, taken_iou=0.0, collision_iou=0.0, collision_debounce=0, num_teams=2):
         # Initialize battle-related variables
-        self.vertices = np.array([(779,0),(175,400),(245,1080),(1750,1080),(1820,400),(1250,0)])  # Battle polygon
+        self.arena = arena or Arena()  # Battle polygon of the camera setup
         self.start_battle_time = None  # Start time of the battle
         self.end_battle_time = None  # End time of the battle
-        self.beyblade_time = {1:0,2:0}  # Time each beyblade spends inside the battle area
+        self.beyblade_time = {team: 0 for team in range(1, num_teams + 1)}  # Time each beyblade spends inside the battle area
         self.battle_time = 0  # Total battle time
         self.winner = None  # Stores the winning beyblade team
         self.winner_bbox = None  # Bounding box of the winner
         self.winner_frame_num = None  # Frame number where the winner is decided
-        self.total_collision = 0  # Counter for total collisions between beyblades
+        self.total_collision = 0  # Counter for total collisions between any two beyblades
+        self.rotation_detector = rotation_detector or RotationDetector()  # Optical flow engine for the is_rotating check
+        self.fps = fps  # Frame rate used to convert frame numbers to time when no timestamp is given
+        self.active_teams = []  # Teams spinning inside the polygon in the last checked frame
+        self.interactions = InteractionEngine(taken_iou, collision_iou, collision_debounce)  # Beyblade/hand/launcher overlaps and per-pair collisions
 
      # Add beyblade status information per frame
     def add_beyblade_status(self,tracks,video_frames):
         prev_gray = None  # To store the grayscale frame for optical flow calculation
         for frame_num, beyblade_track in enumerate(tracks['Beyblade']):
             frame_gray = cv2.cvtColor(video_frames[frame_num], cv2.COLOR_BGR2GRAY)  # Convert frame to grayscale
-            for beyblade_id, track in beyblade_track.items():
-                position = track['position']
-                # Check if the beyblade is inside the battle polygon
-                tracks['Beyblade'][frame_num][beyblade_id]['inside_polygon'] = cv2.pointPolygonTest(self.vertices, position, False) >= 0
-
-                # Check for interaction with hand or launcher using bounding boxes
-                hand_bbox = tracks["Hand"][frame_num].get(1, {}).get('bbox', None)
-                launcher_bbox = tracks["Launcher"][frame_num].get(1, {}).get('bbox', None)
-                IoU_hand = is_overlapping(track['bbox'], hand_bbox)
-                IoU_launcher = is_overlapping(track['bbox'], launcher_bbox)
-                tracks['Beyblade'][frame_num][beyblade_id]['is_taken'] = IoU_hand or IoU_launcher
-
-                # Optical flow to detect beyblade movement and rotation
-                if prev_gray is not None:
-                    flow = cv2.calcOpticalFlowFarneback(prev_gray, frame_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-                    magnitude = np.sqrt(flow[..., 0]**2 + flow[..., 1]**2)
-                    x_min = max(0, int(position[0]) - 5)
-                    x_max = min(magnitude.shape[1], int(position[0]) + 5)
-                    y_min = max(0, int(position[1]) - 5)
-                    y_max = min(magnitude.shape[0], int(position[1]) + 5)
-                    movement = np.mean(magnitude[y_min:y_max, x_min:x_max])
-                    tracks['Beyblade'][frame_num][beyblade_id]['is_rotating'] = movement > 1.0
-                else:
-                    tracks['Beyblade'][frame_num][beyblade_id]['is_rotating'] = False
+            frame_tracks = {object: object_tracks[frame_num] for object, object_tracks in tracks.items()}
+            self.add_frame_beyblade_status(frame_tracks, frame_gray, prev_gray)
             prev_gray = frame_gray  # Update previous frame
 
+    # Add beyblade status information to the tracks of a single frame
+    def add_frame_beyblade_status(self,frame_tracks,frame_gray,prev_gray):
+        other_bboxes = [track['bbox'] for object in ("Hand", "Launcher") for track in frame_tracks[object].values()]
+        beyblade_tracks = list(frame_tracks['Beyblade'].values())
+        positions = [track['position'] for track in beyblade_tracks]
+        # Check if the beyblades are inside the battle polygon, one mask lookup for all of them
+        inside_polygon = self.arena.contains(positions).tolist()
+        # Check for interaction with any hand or launcher, one IoU matrix for all bounding boxes
+        is_taken = self.interactions.get_taken([track['bbox'] for track in beyblade_tracks], other_bboxes).tolist()
+        for track, inside, taken in zip(beyblade_tracks, inside_polygon, is_taken):
+            track['inside_polygon'] = inside
+            track['is_taken'] = taken
+
+        # Optical flow to detect beyblade movement and rotation, computed once for all beyblades
+        with profiler.stage('optical_flow'):
+            movements = self.rotation_detector.get_movements(prev_gray, frame_gray, positions)
+        for track, movement in zip(beyblade_tracks, movements):
+            track['movement'] = movement
+            track['is_rotating'] = movement > self.rotation_detector.threshold
+
+    # Cheap check on the raw detection boxes of a frame ({object: [bbox, ...]}) whether a launch is
+    # under way: two beyblades over the polygon, still on their launchers or not. Rotation and hands
+    # are not checked, so it holds no later than the battle start and the contacts of the launch
+    def is_launching(self,frame_boxes):
+        bboxes = frame_boxes['Beyblade']
+        if len(bboxes) < 2:
+            return False
+        return int(np.count_nonzero(self.arena.contains([get_center_of_bbox(bbox) for bbox in bboxes]))) >= 2
+
     # Check battle status per frame and track beyblade movements
-    def check_battle(self,frame_num,beyblade_track):
-        beyblade_inside_polygon = []  # Track beyblades inside the polygon
+    def check_battle(self,frame_num,beyblade_track,timestamp=None):
+        teams = []  # Teams of the beyblades that count for the battle
+        bboxes = []
         for beyblade_id, track in beyblade_track.items():
             inside_polygon = track['inside_polygon']
             taken = track['is_taken']
             rotate = track['is_rotating']
             # Only track beyblades that are inside the polygon, not taken, and rotating
             if inside_polygon and not taken and rotate:
-                team = track['team']
-                beyblade_inside_polygon.append(team)
-                if self.start_battle_time:
-                    time_now = frame_num / 30  # Convert frame number to time
-                    self.beyblade_time[team] = time_now - self.start_battle_time
-                if self.winner == team:
-                    self.winner_bbox = track['bbox']
-                    self.winner_frame_num = frame_num
+                teams.append(track['team'])
+                bboxes.append(track['bbox'])
+        return self.update_battle(frame_num, teams, bboxes, timestamp)
+
+    # Update the battle state from the beyblades spinning inside the polygon
+    def update_battle(self,frame_num,teams,bboxes,timestamp=None):
+        time_now = frame_num / self.fps if timestamp is None else timestamp  # Convert frame number to time
+        beyblade_inside_polygon = []  # Track beyblades inside the polygon
+        self.active_teams = beyblade_inside_polygon
+        for team, bbox in zip(teams, bboxes):
+            beyblade_inside_polygon.append(team)
+            if self.start_battle_time:
+                self.beyblade_time[team] = time_now - self.start_battle_time
+            if self.winner == team:
+                self.winner_bbox = bbox
+                self.winner_frame_num = frame_num
 
         # Determine if battle has started, ended, or is ongoing
         if len(beyblade_inside_polygon) >= 2:
             if not self.start_battle_time:
-                self.start_battle_time = frame_num / 30
+                self.start_battle_time = time_now
                 return 1, self.battle_time, self.beyblade_time  # Battle ongoing
             else:
-                self.end_battle_time = frame_num / 30
+                self.end_battle_time = time_now
                 self.battle_time = self.end_battle_time - self.start_battle_time
                 return 1, self.battle_time, self.beyblade_time  # Battle continues
         elif len(beyblade_inside_polygon) == 1 and self.start_battle_time:
@@ -85,83 +109,169 @@ class Battle:
             else:
                 return 0, self.battle_time, self.beyblade_time  # Waiting for opponent
 
+    # Compute the battle statistics of a single frame
+    def get_frame_stat(self, frame_num, beyblade_track, timestamp=None):
+        battle_status, battle_time, beyblade_time = self.check_battle(frame_num,beyblade_track,timestamp)
+
+        # Count the debounced collisions of every pair of beyblades based on bounding boxes
+        beyblade_bbox = [track['bbox'] for track in beyblade_track.values()]
+        collisions = self.interactions.update_collisions(frame_num, list(beyblade_track.keys()), beyblade_bbox)
+        self.total_collision += collisions
+
+        return self.get_stat(battle_status, battle_time, beyblade_time, collisions > 0)
+
+    # Battle statistics of a frame, with one time column per team
+    def get_stat(self, battle_status, battle_time, beyblade_time, collision):
+        frame_stat = {'battle_status': battle_status, 'battle_time': battle_time}
+        frame_stat.update({f'beyblade{team}_time': time for team, time in beyblade_time.items()})
+        frame_stat.update({'collision': collision, 'total_collision': self.total_collision})
+        return frame_stat
+
     # Extract battle statistics and log the events
     def get_battle_stat(self, tracks, battle_log_path):
-        # Initialize battle stats dictionary
-        battle_stat = {
-            'battle_status':[],
-            'battle_time':[],
-            'beyblade1_time':[],
-            'beyblade2_time':[],
-            'collision':[],
-            'total_collision':[]
-        }
-
-        battle_log = pd.DataFrame(columns=["frame_num", "battle_status", "collision"])
+        frame_stats = (self.get_frame_stat(frame_num, beyblade_track) for frame_num, beyblade_track in enumerate(tracks['Beyblade']))
+        return self.save_battle_stat(frame_stats, battle_log_path, len(tracks['Beyblade']))
+
+    # Add beyblade status to a TrackStore with batch operations over all frames; gray_frames
+    # (e.g. FrameStore.get_gray) skips the grayscale conversion
+    def add_track_store_status(self, track_store, video_frames, gray_frames=None):
+        beyblade_mask = track_store.get_class_mask('Beyblade')
+        beyblade_records = track_store.records[beyblade_mask]
+
+        # Polygon membership and interaction with every hand and launcher for all beyblades at once
+        taken_iou = self.interactions.taken_iou
+        track_store.records['inside_polygon'][beyblade_mask] = self.arena.contains(beyblade_records['position'])
+        track_store.records['is_taken'][beyblade_mask] = (track_store.get_overlaps('Beyblade', 'Hand', taken_iou) |
+                                                          track_store.get_overlaps('Beyblade', 'Launcher', taken_iou))
+
+        # Optical flow needs the frames, so rotation is still checked frame by frame
+        prev_gray = None
+        for frame_num in range(track_store.num_frames):
+            frame_gray = gray_frames[frame_num] if gray_frames is not None else cv2.cvtColor(video_frames[frame_num], cv2.COLOR_BGR2GRAY)
+            rows = track_store.get_frame_rows(frame_num, 'Beyblade')
+            positions = track_store.records['position'][rows]
+            with profiler.stage('optical_flow'):
+                movements = np.array(self.rotation_detector.get_movements(prev_gray, frame_gray, positions), dtype=np.float64)
+            track_store.records['movement'][rows] = movements
+            track_store.records['is_rotating'][rows] = movements > self.rotation_detector.threshold
+            prev_gray = frame_gray
+
+    # Extract battle statistics from a TrackStore and log the events
+    def get_track_store_stat(self, track_store, battle_log_path):
+        return self.save_battle_stat(self.iter_track_store_stat(track_store), battle_log_path, track_store.num_frames)
+
+    # Compute the battle statistics of every frame of a TrackStore
+    def iter_track_store_stat(self, track_store):
+        records = track_store.records
+        active = records['inside_polygon'] & ~records['is_taken'] & records['is_rotating']
+        # Debounced collisions of every pair of beyblades in contact, counted for the whole video at once
+        frame_nums, track_ids, other_track_ids, _ = track_store.get_pair_contacts('Beyblade', self.interactions.collision_iou)
+        collisions = self.interactions.count_collisions(frame_nums, track_ids, other_track_ids, track_store.num_frames)
+
+        for frame_num in range(track_store.num_frames):
+            rows = track_store.get_frame_rows(frame_num, 'Beyblade')
+            rows = rows[active[rows]]
+            teams = records['team'][rows].tolist()
+            bboxes = records['bbox'][rows].tolist()
+            battle_status, battle_time, beyblade_time = self.update_battle(frame_num, teams, bboxes)
+
+            self.total_collision += int(collisions[frame_num])
+            collision = bool(collisions[frame_num])
+
+            yield self.get_stat(battle_status, battle_time, beyblade_time, collision)
+
+    # Extract battle statistics from cached BattleFeatures, without the video or optical flow
+    def get_feature_stat(self, features, battle_log_path=None):
+        return self.save_battle_stat(self.iter_feature_stat(features), battle_log_path, features.num_frames)
+
+    # Whether each record of BattleFeatures counts for the battle (spinning inside the polygon and
+    # not taken) with the current thresholds
+    def get_feature_active(self, features):
+        records = features.records
+        taken_iou = self.interactions.taken_iou
+        is_taken = (records['hand_iou'] > taken_iou) | (records['launcher_iou'] > taken_iou)
+        return records['inside_polygon'] & ~is_taken & (records['movement'] > self.rotation_detector.threshold)
+
+    # Compute the battle statistics of every frame of BattleFeatures with the current thresholds
+    def iter_feature_stat(self, features):
+        records = features.records
+        active = self.get_feature_active(features)
+        frame_nums, track_ids, other_track_ids, ious = features.get_pair_ious()
+        contact = ious > self.interactions.collision_iou
+        collisions = self.interactions.count_collisions(frame_nums[contact], track_ids[contact], other_track_ids[contact], features.num_frames)
+
+        for frame_num in range(features.num_frames):
+            rows = np.arange(features.frame_offsets[frame_num], features.frame_offsets[frame_num + 1])
+            rows = rows[active[rows]]
+            teams = records['team'][rows].tolist()
+            bboxes = records['bbox'][rows].tolist()
+            battle_status, battle_time, beyblade_time = self.update_battle(frame_num, teams, bboxes)
+
+            self.total_collision += int(collisions[frame_num])
+            collision = bool(collisions[frame_num])
+
+            yield self.get_stat(battle_status, battle_time, beyblade_time, collision)
+
+    # Collect per-frame battle statistics and write the battle log (skipped without a path)
+    def save_battle_stat(self, frame_stats, battle_log_path, num_frames):
+        # Preallocate one column per statistic and fill it frame by frame
+        battle_stat = {key: np.zeros(num_frames, dtype=dtype) for key, dtype in get_battle_stat_dtypes(len(self.beyblade_time)).items()}
 
         # Loop through each frame to gather stats
-        for frame_num, beyblade_track in enumerate(tracks['Beyblade']):
-            battle_stat["battle_status"].append({})
-            battle_stat["battle_time"].append({})
-            battle_stat["beyblade1_time"].append({})
-            battle_stat["beyblade2_time"].append({})
-            battle_stat["collision"].append({})
-            battle_stat["total_collision"].append({})
-
-            battle_status, battle_time, beyblade_time = self.check_battle(frame_num,beyblade_track)
-            battle_stat['battle_status'][frame_num] = battle_status
-            battle_stat['battle_time'][frame_num] = battle_time
-            battle_stat['beyblade1_time'][frame_num] = beyblade_time[1]
-            battle_stat['beyblade2_time'][frame_num] = beyblade_time[2]
-
-            # Calculate collision between beyblades based on bounding boxes
-            beyblade_bbox = []
-            for beyblade_id, track in beyblade_track.items():
-                beyblade_bbox.append(track['bbox'])
-            if len(beyblade_bbox) == 2:
-                IoU_beyblade = is_overlapping(beyblade_bbox[0], beyblade_bbox[1])
-                battle_stat['collision'][frame_num] = IoU_beyblade
-                if IoU_beyblade:
-                    self.total_collision += 1
-                battle_stat['total_collision'][frame_num] = self.total_collision
-            else:
-                battle_stat['total_collision'][frame_num] = self.total_collision
-                battle_stat['collision'][frame_num] = False
+        for frame_num, frame_stat in enumerate(frame_stats):
+            for key, value in frame_stat.items():
+                battle_stat[key][frame_num] = value
 
-            # Log battle status and collision data to CSV
-            battle_log_data = [frame_num,battle_status,battle_stat['collision'][frame_num]]
-            battle_log_series = pd.Series(battle_log_data, index=battle_log.columns)
-            battle_log = pd.concat([battle_log, battle_log_series.to_frame().T], ignore_index=True)
+        if battle_log_path is None:
+            return battle_stat
 
-        battle_log.to_csv(battle_log_path, index=False)
+        # Log battle status and collision data in a single write
+        battle_log = pd.DataFrame({
+            "frame_num": np.arange(num_frames),
+            "battle_status": battle_stat['battle_status'],
+            "collision": battle_stat['collision']
+        })
+        with profiler.stage('battle_log'):
+            write_battle_log(battle_log, battle_log_path)
 
         return battle_stat # Return final battle stats
 
+    # Draw the battle stats of a single frame
+    def draw_frame_stat(self, frame, frame_stat):
+        cv2.polylines(frame, [self.arena.vertices], isClosed=True, color=(255, 0, 0), thickness=2)
+
+        # Display battle statistics on the frame
+        battle_status = frame_stat["battle_status"]
+        battle_time = frame_stat["battle_time"]
+        total_collision = frame_stat["total_collision"]
+
+        if battle_status == 0:
+            frame = cv2.putText(frame,f"Waiting Opponent...",(50,50), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
+        else:
+            frame = cv2.putText(frame,f"Battle Time: {battle_time:.2f} s",(50,50), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
+            for team in self.beyblade_time:
+                beyblade_time = frame_stat[f"beyblade{team}_time"]
+                frame = cv2.putText(frame,f"Beyblade {team} Time: {beyblade_time:.2f} s",(50,50 + 40 * team), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
+            frame = cv2.putText(frame,f"Total Collision: {total_collision}",(50,90 + 40 * len(self.beyblade_time)), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
+
+        return frame
+
+    # Crop the winner from an annotated frame
+    def get_winner_img(self, frame):
+        x1, y1, x2, y2 = [int(value) for value in self.winner_bbox]
+        return frame[y1:y2, x1:x2]
+
     # Visualize battle stats by drawing on video frames
     def draw_stat(self, video_frames, battle_stat, tracks):
         output_video_frames= [] # Store output video frames
+        winner_img = None # Stays None when no winner has been decided
         for frame_num, frame in enumerate(video_frames):
-            cv2.polylines(frame, [self.vertices], isClosed=True, color=(255, 0, 0), thickness=2)
-
-            # Display battle statistics on each frame
-            battle_status = battle_stat["battle_status"][frame_num]
-            battle_time = battle_stat["battle_time"][frame_num]
-            beyblade1_time = battle_stat["beyblade1_time"][frame_num]
-            beyblade2_time = battle_stat["beyblade2_time"][frame_num]
-            total_collision = battle_stat["total_collision"][frame_num]
-
-            if battle_status == 0:
-                frame = cv2.putText(frame,f"Waiting Opponent...",(50,50), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
-            else:
-                frame = cv2.putText(frame,f"Battle Time: {battle_time:.2f} s",(50,50), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
-                frame = cv2.putText(frame,f"Beyblade 1 Time: {beyblade1_time:.2f} s",(50,90), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
-                frame = cv2.putText(frame,f"Beyblade 2 Time: {beyblade2_time:.2f} s",(50,130), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
-                frame = cv2.putText(frame,f"Total Collision: {total_collision}",(50,170), cv2.FONT_HERSHEY_SIMPLEX,1,(0,0,0),3)
+            frame_stat = {key: values[frame_num] for key, values in battle_stat.items()}
+            frame = self.draw_frame_stat(frame, frame_stat)
 
             # Save cropped winner array
             if frame_num == self.winner_frame_num:
-                x1, y1, x2, y2 = [int(value) for value in self.winner_bbox]
-                winner_img = frame[y1:y2, x1:x2]
+                winner_img = self.get_winner_img(frame)
 
             output_video_frames.append(frame) # Append the frame to the output video
 
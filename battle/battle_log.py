@@ -0,0 +1,83 @@
+import csv
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append('../')
+from utils import profiler
+
+def get_battle_stat_dtypes(num_teams=2):
+    # Per-frame battle statistics and the columns they are stored in, one time column per team
+    dtypes = {'battle_status': np.int8, 'battle_time': np.float64}
+    dtypes.update({f'beyblade{team}_time': np.float64 for team in range(1, num_teams + 1)})
+    dtypes.update({'collision': np.bool_, 'total_collision': np.int64})
+    return dtypes
+
+BATTLE_LOG_COLUMNS = ["frame_num", "battle_status", "collision"]
+
+def write_battle_log(battle_log, battle_log_path):
+    # Write the battle log DataFrame as Parquet or CSV depending on the file extension
+    if battle_log_path.endswith('.parquet'):
+        battle_log.to_parquet(battle_log_path, index=False)  # Requires pyarrow
+    else:
+        battle_log.to_csv(battle_log_path, index=False)
+
+def read_battle_log(battle_log_path):
+    # Read a battle log written by write_battle_log or BattleLogWriter
+    if battle_log_path.endswith('.parquet'):
+        return pd.read_parquet(battle_log_path)  # Requires pyarrow
+    return pd.read_csv(battle_log_path)
+
+class BattleLogWriter:
+    def __init__(self, battle_log_path, buffer_size=256):
+        # Append-only battle log for long or live runs, rows are flushed every buffer_size frames
+        self.battle_log_path = battle_log_path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.is_parquet = battle_log_path.endswith('.parquet')
+        self.parquet_writer = None
+
+        if not self.is_parquet:
+            self.file = open(battle_log_path, 'w', newline='')
+            self.csv_writer = csv.writer(self.file, lineterminator='\n')  # Same line endings as write_battle_log
+            self.csv_writer.writerow(BATTLE_LOG_COLUMNS)
+
+    def write(self, frame_num, battle_status, collision):
+        # Append the log row of one frame
+        self.buffer.append((frame_num, battle_status, collision))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        # Write the buffered rows to disk
+        if not self.buffer:
+            return
+
+        with profiler.stage('battle_log'):
+            if self.is_parquet:
+                # pyarrow is only needed when writing Parquet
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                frame_nums, battle_statuses, collisions = zip(*self.buffer)
+                table = pa.table({
+                    "frame_num": pa.array(frame_nums, type=pa.int64()),
+                    "battle_status": pa.array(battle_statuses, type=pa.int8()),
+                    "collision": pa.array(collisions, type=pa.bool_())
+                })
+                if self.parquet_writer is None:
+                    self.parquet_writer = pq.ParquetWriter(self.battle_log_path, table.schema)
+                self.parquet_writer.write_table(table)
+            else:
+                self.csv_writer.writerows(self.buffer)
+                self.file.flush()
+
+        self.buffer = []
+
+    def close(self):
+        # Flush the remaining rows and close the file
+        self.flush()
+        if self.is_parquet:
+            if self.parquet_writer is not None:
+                self.parquet_writer.close()
+        else:
+            self.file.close()
@@ -0,0 +1,99 @@
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import get_iou_matrix, get_ious, get_self_pairs
+
+# Everything Battle looks at per beyblade and frame, so the referee logic can be replayed
+# without decoding the video or computing optical flow again
+FEATURE_DTYPE = np.dtype([
+    ('frame_num', np.int32),
+    ('track_id', np.int32),
+    ('team', np.int8),
+    ('beyblade_color', np.float64, 3),  # Team color drawn over the beyblade, meaningless while team is 0
+    ('bbox', np.float64, 4),
+    ('position', np.int32, 2),
+    ('movement', np.float64),  # Mean optical flow magnitude, NaN without a previous frame
+    ('inside_polygon', np.bool_),
+    ('hand_iou', np.float64),  # Highest IoU with the hands of the frame, 0 without one
+    ('launcher_iou', np.float64)  # Highest IoU with the launchers of the frame, 0 without one
+])
+
+class BattleFeatures:
+    def __init__(self, records, num_frames):
+        # Beyblade feature records sorted by frame, keeping the order within a frame
+        order = np.argsort(records['frame_num'], kind='stable')
+        self.records = records[order]
+        self.num_frames = num_frames
+        self.frame_offsets = np.searchsorted(self.records['frame_num'], np.arange(num_frames + 1))
+
+    @classmethod
+    def from_track_store(cls, track_store):
+        # Features of the beyblade records of a TrackStore after Battle.add_track_store_status
+        beyblade_records = track_store.records[track_store.get_class_mask('Beyblade')]
+        records = np.zeros(len(beyblade_records), dtype=FEATURE_DTYPE)
+        for name in ('frame_num', 'track_id', 'team', 'beyblade_color', 'bbox', 'position', 'movement', 'inside_polygon'):
+            records[name] = beyblade_records[name]
+        records['hand_iou'] = track_store.get_ious('Beyblade', 'Hand')
+        records['launcher_iou'] = track_store.get_ious('Beyblade', 'Launcher')
+        return cls(records, track_store.num_frames)
+
+    @classmethod
+    def load(cls, path):
+        # Load features saved with save
+        with np.load(path) as data:
+            return cls(data['records'], int(data['num_frames']))
+
+    def save(self, path):
+        # Save the features as a compact npz file
+        np.savez_compressed(path, records=self.records, num_frames=self.num_frames)
+
+    def get_range(self, start, stop):
+        # Features of the frames start to stop - 1, renumbered from 0, e.g. for one round of a session
+        records = self.records[self.frame_offsets[start]:self.frame_offsets[stop]].copy()
+        records['frame_num'] -= start
+        return BattleFeatures(records, stop - start)
+
+    def get_frame_records(self, frame_num):
+        return self.records[self.frame_offsets[frame_num]:self.frame_offsets[frame_num + 1]]
+
+    def get_frame_tracks(self, frame_num):
+        # Beyblades of one frame in the {track_id: info} shape the drawing functions take
+        beyblade_track = {}
+        for record in self.get_frame_records(frame_num):
+            track_info = {'bbox': record['bbox'].tolist()}
+            if record['team']:
+                track_info['team'] = int(record['team'])
+                if 'beyblade_color' in record.dtype.names:  # Missing in features saved before it was added
+                    track_info['beyblade_color'] = record['beyblade_color']
+            beyblade_track[int(record['track_id'])] = track_info
+        return beyblade_track
+
+    def get_pair_ious(self):
+        # (frame_nums, track_ids, other_track_ids, ious) of every pair of beyblades of a frame
+        rows, other_rows = get_self_pairs(self.records['frame_num'], self.num_frames)
+        ious = get_ious(self.records['bbox'][rows], self.records['bbox'][other_rows])
+        return self.records['frame_num'][rows], self.records['track_id'][rows], self.records['track_id'][other_rows], ious
+
+class FeatureRecorder:
+    def __init__(self):
+        # Collects the features of frames that arrive one by one, as in the streaming and live paths
+        self.rows = []
+        self.num_frames = 0
+
+    def add_frame(self, frame_num, frame_tracks):
+        # Record the beyblades of one frame after Battle.add_frame_beyblade_status
+        bboxes = [track['bbox'] for track in frame_tracks['Beyblade'].values()]
+        hand_ious, launcher_ious = [self.get_max_ious(bboxes, frame_tracks[object]) for object in ("Hand", "Launcher")]
+        for (track_id, track), hand_iou, launcher_iou in zip(frame_tracks['Beyblade'].items(), hand_ious, launcher_ious):
+            self.rows.append((frame_num, track_id, track.get('team', 0), track.get('beyblade_color', (0, 0, 0)), track['bbox'], track['position'],
+                              track['movement'], track['inside_polygon'], hand_iou, launcher_iou))
+        self.num_frames = max(self.num_frames, frame_num + 1)
+
+    def get_max_ious(self, bboxes, other_track):
+        # Highest IoU of each bbox with the bboxes of other_track, 0 without one
+        if len(bboxes) == 0 or len(other_track) == 0:
+            return [0.0] * len(bboxes)
+        return get_iou_matrix(bboxes, [track['bbox'] for track in other_track.values()]).max(axis=1).tolist()
+
+    def get_features(self):
+        return BattleFeatures(np.array(self.rows, dtype=FEATURE_DTYPE), self.num_frames)
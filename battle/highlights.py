@@ -0,0 +1,76 @@
+import cv2
+import os
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import VideoWriter, draw_beyblades, profiler
+
+def get_highlight_events(battle_log):
+    # (frame_num, label) of the battle start, the first frame of every collision and the battle end
+    battle_status = np.asarray(battle_log['battle_status'])
+    collision = np.asarray(battle_log['collision'], dtype=bool)
+    events = [(int(frame_num), 'collision') for frame_num in np.flatnonzero(collision & ~np.r_[False, collision[:-1]])]
+    for status, label in ((1, 'battle_start'), (2, 'battle_end')):
+        frame_nums = np.flatnonzero(battle_status == status)
+        if len(frame_nums):
+            events.append((int(frame_nums[0]), label))
+    return sorted(events)
+
+def get_highlight_ranges(events, num_frames, fps=30, before=1.0, after=1.0):
+    # [start, stop) frame ranges from before seconds ahead of each event to after seconds past it,
+    # overlapping ranges merged, each with the labels of its events
+    ranges = []
+    for frame_num, label in sorted(events):
+        start = max(0, frame_num - int(round(before * fps)))
+        stop = min(num_frames, frame_num + int(round(after * fps)) + 1)
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], stop), ranges[-1][2] + [label])
+        else:
+            ranges.append((start, stop, [label]))
+    return ranges
+
+class HighlightRenderer:
+    def __init__(self, video_path, frame_index, battle, features, battle_stat):
+        # Re-renders single frames or short ranges of an analysed match with its overlays, seeking
+        # with the frame index so only those frames are decoded
+        self.video_path = video_path
+        self.frame_index = frame_index
+        self.battle = battle  # Battle after the analysis, for the polygon, the overlays and the winner
+        self.features = features  # BattleFeatures with the beyblade boxes, teams and colors
+        self.battle_stat = battle_stat  # Per-frame battle statistics, as returned by Battle.save_battle_stat
+
+    def draw_frame(self, frame_num, frame):
+        # Draw the beyblades and the battle stat of one frame in place
+        with profiler.stage('drawing'):
+            draw_beyblades(frame, self.features.get_frame_tracks(frame_num))
+            self.battle.draw_frame_stat(frame, {key: values[frame_num] for key, values in self.battle_stat.items()})
+        return frame
+
+    def save_winner_img(self, winner_img_path):
+        # Crop the winner from its annotated frame, False without a winner
+        if self.battle.winner_frame_num is None:
+            return False
+        frame = self.frame_index.read_frame(self.video_path, self.battle.winner_frame_num)
+        self.draw_frame(self.battle.winner_frame_num, frame)
+        return cv2.imwrite(winner_img_path, self.battle.get_winner_img(frame))
+
+    def save_clips(self, ranges, output_dir, reel=True):
+        # One annotated clip per range, named after its first frame and events, plus a reel of all
+        # of them in highlights.avi. Returns the clip paths
+        os.makedirs(output_dir, exist_ok=True)
+        fps = self.frame_index.fps
+        reel_writer = VideoWriter(os.path.join(output_dir, 'highlights.avi'), fps) if reel else None
+        clip_paths = []
+        for start, stop, labels in ranges:
+            clip_path = os.path.join(output_dir, f'{start:06d}_{"_".join(dict.fromkeys(labels))}.avi')
+            clip_writer = VideoWriter(clip_path, fps)
+            for frame_num, frame in self.frame_index.iter_range(self.video_path, start, stop):
+                self.draw_frame(frame_num, frame)
+                clip_writer.write(frame)
+                if reel_writer is not None:
+                    reel_writer.write(frame)
+            clip_writer.release()
+            clip_paths.append(clip_path)
+        if reel_writer is not None:
+            reel_writer.release()
+        return clip_paths
@@ -0,0 +1,73 @@
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import get_iou_matrix
+
+def get_pair_keys(track_ids, other_track_ids):
+    # Order independent int64 key of a pair of track ids
+    low, high = np.minimum(track_ids, other_track_ids), np.maximum(track_ids, other_track_ids)
+    return (low.astype(np.int64) << 32) | high.astype(np.int64)
+
+def get_collisions(frames, pair_keys, debounce=0):
+    # Which contacts (frame, pair key) count as collisions. A pair that stays in contact only
+    # counts again once it has been apart for more than debounce frames, so debounce=0 counts
+    # every frame of contact
+    order = np.lexsort((frames, pair_keys))
+    sorted_frames, sorted_keys = frames[order], pair_keys[order]
+    counted = np.ones(len(frames), dtype=bool)
+    counted[1:] = (sorted_keys[1:] != sorted_keys[:-1]) | (sorted_frames[1:] - sorted_frames[:-1] > debounce)
+    collisions = np.empty(len(frames), dtype=bool)
+    collisions[order] = counted
+    return collisions
+
+def get_pair_counts(pair_keys):
+    # {(track id, track id): count} of pair keys
+    keys, counts = np.unique(pair_keys, return_counts=True)
+    return {(int(key >> 32), int(key & 0xffffffff)): int(count) for key, count in zip(keys, counts)}
+
+def add_pair_counts(pair_counts, other_pair_counts):
+    # Add the counts of other_pair_counts to pair_counts in place
+    for pair, count in other_pair_counts.items():
+        pair_counts[pair] = pair_counts.get(pair, 0) + count
+
+class InteractionEngine:
+    def __init__(self, taken_iou=0.0, collision_iou=0.0, collision_debounce=0):
+        # Pairwise beyblade contacts and beyblade/hand/launcher overlaps for any number of objects.
+        # Streams are counted frame by frame with the debounce state kept here, whole videos or
+        # chunks in one vectorized pass
+        self.taken_iou = taken_iou  # IoU with a hand or launcher above which a beyblade counts as taken
+        self.collision_iou = collision_iou  # IoU of two beyblades above which they are in contact
+        self.collision_debounce = collision_debounce  # Frames a pair has to be apart before it can collide again
+        self.last_contact = {}  # Last frame each pair of track ids was in contact
+        self.pair_collisions = {}  # Collisions counted per pair of track ids
+
+    def count_collisions(self, frame_nums, track_ids, other_track_ids, num_frames):
+        # Per frame, the debounced collisions of the contacts (frame, track id, track id) of a
+        # whole video or chunk, e.g. from TrackStore.get_pair_contacts
+        pair_keys = get_pair_keys(track_ids, other_track_ids)
+        collisions = get_collisions(frame_nums, pair_keys, self.collision_debounce)
+        add_pair_counts(self.pair_collisions, get_pair_counts(pair_keys[collisions]))
+        return np.bincount(frame_nums[collisions], minlength=num_frames)
+
+    def get_taken(self, bboxes, other_bboxes):
+        # Whether each beyblade overlaps any of the hands and launchers of the frame
+        if len(bboxes) == 0 or len(other_bboxes) == 0:
+            return np.zeros(len(bboxes), dtype=bool)
+        return (get_iou_matrix(bboxes, other_bboxes) > self.taken_iou).any(axis=1)
+
+    def get_contacts(self, track_ids, bboxes):
+        # (track id, track id) pairs of the beyblades of a frame that are in contact
+        if len(bboxes) < 2:
+            return []
+        rows, other_rows = np.nonzero(np.triu(get_iou_matrix(bboxes, bboxes) > self.collision_iou, k=1))
+        return [tuple(sorted((track_ids[i], track_ids[j]))) for i, j in zip(rows.tolist(), other_rows.tolist())]
+
+    def update_collisions(self, frame_num, track_ids, bboxes):
+        # Count the debounced collisions of one frame of a stream and return how many there were
+        collisions = 0
+        for pair in self.get_contacts(track_ids, bboxes):
+            if frame_num - self.last_contact.get(pair, -np.inf) > self.collision_debounce:
+                self.pair_collisions[pair] = self.pair_collisions.get(pair, 0) + 1
+                collisions += 1
+            self.last_contact[pair] = frame_num
+        return collisions
@@ -0,0 +1,123 @@
+import json
+import time
+import cv2
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import profiler
+
+class LiveBattle:
+    def __init__(self, tracker, team_assigner, battle, latency_budget=0.25, on_event=None, on_frame=None):
+        # Incremental battle analysis of a live stream. Frames older than latency_budget seconds
+        # when analysis could start are dropped so the results keep up with the match
+        self.tracker = tracker
+        self.team_assigner = team_assigner
+        self.battle = battle
+        self.latency_budget = latency_budget
+        self.on_event = on_event  # Called with every event dict as soon as it happens
+        self.on_frame = on_frame  # Called with (frame, frame_tracks, frame_stat, timestamp) of every analysed frame
+        self.events = []
+        self.latencies = []  # Capture to end of analysis time of every analysed frame
+        self.processed = 0
+        self.dropped = 0  # Frames skipped because they were already over the latency budget
+        self.prev_gray = None
+        self.battle_started = False
+        self.prev_collision = False
+        self.prev_active_teams = []
+        self.prev_winner = None
+
+    def emit(self, event_type, frame_num, timestamp, **data):
+        # Record an event and pass it to the callback
+        event = {'type': event_type, 'frame_num': frame_num, 'timestamp': round(timestamp, 3), **data}
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def process_frame(self, frame_num, timestamp, frame):
+        # Update the battle state with one frame and emit the events it causes
+        frame_tracks = self.tracker.track_frame(frame)
+        self.tracker.add_position_to_frame_tracks(frame_tracks)
+        beyblade_track = frame_tracks['Beyblade']
+
+        # Team colors are fitted on the first frame that shows every beyblade
+        if not self.team_assigner.beyblade_colors and len(beyblade_track) >= self.team_assigner.num_teams:
+            self.team_assigner.assign_beyblade_color(frame, beyblade_track)
+
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.team_assigner.beyblade_colors:
+            beyblade_ids = list(beyblade_track.keys())
+            teams = self.team_assigner.get_beyblade_teams(frame, beyblade_ids, [track['bbox'] for track in beyblade_track.values()])
+            for track, team in zip(beyblade_track.values(), teams):
+                track['team'] = team
+                track['beyblade_color'] = self.team_assigner.beyblade_colors[team]
+            self.battle.add_frame_beyblade_status(frame_tracks, frame_gray, self.prev_gray)
+            frame_stat = self.battle.get_frame_stat(frame_num, beyblade_track, timestamp)
+        else:
+            frame_stat = self.battle.get_frame_stat(frame_num, {}, timestamp)
+        self.prev_gray = frame_gray
+
+        # Derive events from the state transitions
+        if frame_stat['battle_status'] == 1 and not self.battle_started:
+            self.battle_started = True
+            self.emit('battle_start', frame_num, timestamp)
+        if frame_stat['collision'] and not self.prev_collision:
+            self.emit('collision', frame_num, timestamp, total_collision=frame_stat['total_collision'])
+        if frame_stat['battle_status'] != 0:
+            for team in self.prev_active_teams:
+                if team not in self.battle.active_teams:
+                    self.emit('beyblade_out', frame_num, timestamp, team=int(team))
+        if self.battle.winner is not None and self.battle.winner != self.prev_winner:
+            self.emit('winner', frame_num, timestamp, winner=int(self.battle.winner), battle_time=round(self.battle.battle_time, 2))
+
+        self.prev_collision = frame_stat['collision']
+        self.prev_active_teams = list(self.battle.active_teams)
+        self.prev_winner = self.battle.winner
+
+        if self.on_frame is not None:
+            self.on_frame(frame, frame_tracks, frame_stat, timestamp)
+        return frame_stat
+
+    def run(self, capture, max_frames=None):
+        # Consume a LiveCapture until the stream ends, dropping frames that are already too old
+        while max_frames is None or self.processed < max_frames:
+            latest = capture.read()
+            if latest is None:
+                break
+            frame_num, timestamp, capture_time, frame = latest
+
+            if time.monotonic() - capture_time > self.latency_budget:
+                self.dropped += 1
+                profiler.count('frames_dropped')
+                continue
+
+            self.process_frame(frame_num, timestamp, frame)
+            self.processed += 1
+            self.latencies.append(time.monotonic() - capture_time)
+            profiler.count('frames_processed')
+            profiler.observe('frame_latency', self.latencies[-1])
+
+        return self.get_stats(capture)
+
+    def get_stats(self, capture=None):
+        # Latency percentiles and processed/dropped frame counts
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        stats = {
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'latency_mean': float(latencies.mean()),
+            'latency_p50': float(np.percentile(latencies, 50)),
+            'latency_p95': float(np.percentile(latencies, 95)),
+            'latency_max': float(latencies.max()),
+            'events': len(self.events)
+        }
+        if capture is not None:
+            # Frames the capture replaced before analysis could read them are dropped too
+            stats['captured'] = capture.captured
+            stats['skipped_by_capture'] = capture.overwritten
+        return stats
+
+    def save_events(self, events_path):
+        # Write the events as JSON lines
+        with open(events_path, 'w') as f:
+            for event in self.events:
+                f.write(json.dumps(event) + '\n')
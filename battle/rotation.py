@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+class RotationDetector:
+    def __init__(self, mode='dense', threshold=1.0, window=5, roi_margin=128, verify=False):
+        # mode 'dense' runs Farneback over the full frame, 'roi' only over the union of the
+        # beyblade windows padded by roi_margin, and 'sparse' runs Lucas-Kanade at the centroids
+        if mode not in ('dense', 'roi', 'sparse'):
+            raise ValueError(f"Unknown rotation mode: {mode}")
+        self.mode = mode
+        self.threshold = threshold  # Mean flow magnitude above which a beyblade counts as rotating
+        self.window = window  # Half size of the window around the position that is averaged
+        self.roi_margin = roi_margin  # Context kept around the windows so the flow pyramid sees enough of the frame
+        self.verify = verify  # Also run the full-frame dense flow and compare the flags
+        self.flow_frames = 0  # Number of frames for which flow has been computed
+        self.flow_pixels = 0  # Number of pixels the flow has been computed over
+        self.verified_flags = 0  # Number of flags compared against the dense reference
+        self.mismatched_flags = 0  # Number of flags that differ from the dense reference
+
+    def get_window(self, position, width, height):
+        # Clip the averaging window around a position to the frame
+        x_min = max(0, int(position[0]) - self.window)
+        x_max = min(width, int(position[0]) + self.window)
+        y_min = max(0, int(position[1]) - self.window)
+        y_max = min(height, int(position[1]) + self.window)
+        return x_min, y_min, x_max, y_max
+
+    def get_roi(self, positions, width, height):
+        # Bounding rectangle of all beyblade windows, padded with the flow context margin
+        windows = np.array([self.get_window(position, width, height) for position in positions])
+        x_min = max(0, int(windows[:, 0].min()) - self.roi_margin)
+        y_min = max(0, int(windows[:, 1].min()) - self.roi_margin)
+        x_max = min(width, int(windows[:, 2].max()) + self.roi_margin)
+        y_max = min(height, int(windows[:, 3].max()) + self.roi_margin)
+        return x_min, y_min, x_max, y_max
+
+    def get_movement(self, flow, origin, window):
+        # Mean flow magnitude inside a window, with flow covering the frame from origin
+        x_min, y_min, x_max, y_max = window
+        window_flow = flow[y_min - origin[1]:y_max - origin[1], x_min - origin[0]:x_max - origin[0]]
+        if window_flow.size == 0:
+            return 0.0
+        magnitude = np.sqrt(window_flow[..., 0]**2 + window_flow[..., 1]**2)
+        return np.mean(magnitude)
+
+    def get_dense_movements(self, prev_gray, frame_gray, windows, roi):
+        # Compute Farneback flow once over the roi and read every window from it
+        x_min, y_min, x_max, y_max = roi
+        flow = cv2.calcOpticalFlowFarneback(prev_gray[y_min:y_max, x_min:x_max],
+                                            frame_gray[y_min:y_max, x_min:x_max],
+                                            None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        self.flow_frames += 1
+        self.flow_pixels += (x_max - x_min) * (y_max - y_min)
+        return [self.get_movement(flow, (x_min, y_min), window) for window in windows]
+
+    def get_sparse_movements(self, prev_gray, frame_gray, windows):
+        # Track a small grid of points inside every window with pyramidal Lucas-Kanade
+        points = []
+        for x_min, y_min, x_max, y_max in windows:
+            xs = np.linspace(x_min, max(x_min, x_max - 1), 3)
+            ys = np.linspace(y_min, max(y_min, y_max - 1), 3)
+            points += [(x, y) for y in ys for x in xs]
+        points = np.array(points, dtype=np.float32).reshape(-1, 1, 2)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, frame_gray, points, None,
+                                                          winSize=(15, 15), maxLevel=3)
+        self.flow_frames += 1
+        self.flow_pixels += len(points)
+
+        displacement = np.linalg.norm((next_points - points).reshape(-1, 2), axis=1)
+        displacement[status.ravel() == 0] = 0.0
+        return [float(np.mean(values)) for values in displacement.reshape(len(windows), -1)]
+
+    def get_movements(self, prev_gray, frame_gray, positions):
+        # Return the mean flow magnitude at every position (NaN without a previous frame),
+        # computing flow at most once per frame
+        if prev_gray is None or len(positions) == 0:
+            return [float('nan')] * len(positions)
+
+        height, width = frame_gray.shape[:2]
+        windows = [self.get_window(position, width, height) for position in positions]
+
+        if self.mode == 'sparse':
+            movements = self.get_sparse_movements(prev_gray, frame_gray, windows)
+        elif self.mode == 'roi':
+            movements = self.get_dense_movements(prev_gray, frame_gray, windows, self.get_roi(positions, width, height))
+        else:
+            movements = self.get_dense_movements(prev_gray, frame_gray, windows, (0, 0, width, height))
+
+        # Compare the flags against the full-frame dense flow used as reference
+        if self.verify:
+            flow = cv2.calcOpticalFlowFarneback(prev_gray, frame_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+            for window, movement in zip(windows, movements):
+                reference = self.get_movement(flow, (0, 0), window) > self.threshold
+                self.verified_flags += 1
+                self.mismatched_flags += int(reference != (movement > self.threshold))
+
+        return movements
+
+    def get_report(self):
+        # Summary of the flow work done and, in verify mode, the agreement with the dense reference
+        report = {
+            'mode': self.mode,
+            'flow_frames': self.flow_frames,
+            'flow_pixels': self.flow_pixels
+        }
+        if self.verify:
+            report['verified_flags'] = self.verified_flags
+            report['mismatched_flags'] = self.mismatched_flags
+            report['agreement'] = 1.0 - self.mismatched_flags / self.verified_flags if self.verified_flags else 1.0
+        return report
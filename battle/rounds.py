@@ -0,0 +1,23 @@
+import numpy as np
+
+def get_active_counts(battle, features):
+    # Number of beyblades that count for the battle in every frame of BattleFeatures
+    active = battle.get_feature_active(features)
+    return np.bincount(features.records['frame_num'][active], minlength=features.num_frames)
+
+def get_round_ranges(active_counts, min_gap):
+    # [start, stop) frame ranges of the rounds of a recording with several battles. Frames with
+    # active beyblades less than min_gap frames apart belong to the same round, rounds without two
+    # active beyblades at once (a single test spin) are idle time, and the idle frames between two
+    # rounds are split at their middle. A recording without any battle is one round
+    num_frames = len(active_counts)
+    frame_nums = np.flatnonzero(active_counts > 0)
+    breaks = np.flatnonzero(np.diff(frame_nums) >= min_gap)
+    runs = [(frame_nums[start], frame_nums[stop - 1] + 1)
+            for start, stop in zip(np.r_[0, breaks + 1], np.r_[breaks + 1, len(frame_nums)]) if stop > start]
+    runs = [(start, stop) for start, stop in runs if active_counts[start:stop].max() >= 2]
+    if not runs:
+        return [(0, num_frames)]
+    cuts = [(stop + next_start) // 2 for (_, stop), (next_start, _) in zip(runs[:-1], runs[1:])]
+    bounds = [0] + cuts + [num_frames]
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,122 @@
+import itertools
+import numpy as np
+import pandas as pd
+from .interactions import get_pair_keys, get_collisions
+
+# Referee parameters a sweep varies: RotationDetector.threshold, the taken_iou, collision_iou and
+# collision_debounce of Battle.interactions, and Battle.fps
+PARAM_NAMES = ('rotation_threshold', 'taken_iou', 'collision_iou', 'collision_debounce', 'fps')
+
+def get_param_grid(rotation_thresholds=(1.0,), taken_ious=(0.0,), collision_ious=(0.0,), collision_debounces=(0,), fps_values=(30,)):
+    # Every combination of the parameter values, as one array per parameter
+    combinations = list(itertools.product(rotation_thresholds, taken_ious, collision_ious, collision_debounces, fps_values))
+    return {name: np.array(values, dtype=np.float64) for name, values in zip(PARAM_NAMES, zip(*combinations))}
+
+def get_dense_features(features_list):
+    # Pad the beyblade features of every match into (matches, frames, slots) arrays, where the
+    # slots of a frame keep the order Battle sees the beyblades in. Padding never counts as inside
+    num_frames = max(features.num_frames for features in features_list)
+    num_slots = max([int(np.diff(features.frame_offsets).max(initial=0)) for features in features_list] + [1])
+    shape = (len(features_list), num_frames, num_slots)
+    dense = {
+        'inside': np.zeros(shape, dtype=bool),
+        'movement': np.full(shape, np.nan),
+        'hand_iou': np.zeros(shape),
+        'launcher_iou': np.zeros(shape),
+        'team': np.zeros(shape, dtype=np.int8)
+    }
+    for match_num, features in enumerate(features_list):
+        records = features.records
+        slots = np.arange(len(records)) - features.frame_offsets[records['frame_num']]
+        index = (match_num, records['frame_num'], slots)
+        dense['inside'][index] = records['inside_polygon']
+        dense['movement'][index] = records['movement']
+        dense['hand_iou'][index] = records['hand_iou']
+        dense['launcher_iou'][index] = records['launcher_iou']
+        dense['team'][index] = records['team']
+    return dense
+
+def get_total_collisions(features_list, params):
+    # (matches, combinations) total collisions. They only depend on collision_iou and
+    # collision_debounce, so every match is counted once per distinct pair of those
+    settings = np.stack([params['collision_iou'], params['collision_debounce']], axis=1)
+    unique_settings, inverse = np.unique(settings, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    total_collision = np.zeros((len(features_list), len(settings)), dtype=np.int64)
+    for match_num, features in enumerate(features_list):
+        frame_nums, track_ids, other_track_ids, ious = features.get_pair_ious()
+        pair_keys = get_pair_keys(track_ids, other_track_ids)
+        for setting_num, (collision_iou, collision_debounce) in enumerate(unique_settings):
+            contact = ious > collision_iou
+            collisions = get_collisions(frame_nums[contact], pair_keys[contact], collision_debounce)
+            total_collision[match_num, inverse == setting_num] = collisions.sum()
+    return total_collision
+
+def sweep(features_list, params, match_names=None, num_teams=None):
+    # Replay Battle.update_battle for every match and parameter combination at once. The battle
+    # state is a (matches, combinations) array per variable and the frames are stepped in order.
+    # num_teams defaults to the highest team of the features, and at least 2
+    dense = get_dense_features(features_list)
+    num_teams = num_teams or max(2, int(dense['team'].max(initial=0)))
+    num_matches, num_frames, _ = dense['inside'].shape
+    shape = (num_matches, len(params['fps']))
+    rotation_threshold = params['rotation_threshold'][None, :, None]
+    taken_iou = params['taken_iou'][None, :, None]
+
+    start_time = np.zeros(shape)  # 0 means not started, like the falsy start_battle_time
+    battle_time = np.zeros(shape)
+    beyblade_time = {team: np.zeros(shape) for team in range(1, num_teams + 1)}
+    winner = np.zeros(shape, dtype=np.int8)  # 0 means no winner yet
+    winner_frame_num = np.full(shape, -1)
+
+    # Frames without any beyblade inside the polygon leave every state unchanged
+    for frame_num in np.flatnonzero(dense['inside'].any(axis=(0, 2))):
+        inside = dense['inside'][:, frame_num, None, :]
+        is_taken = (dense['hand_iou'][:, frame_num, None, :] > taken_iou) | (dense['launcher_iou'][:, frame_num, None, :] > taken_iou)
+        active = inside & ~is_taken & (dense['movement'][:, frame_num, None, :] > rotation_threshold)  # (matches, combinations, slots)
+        teams = np.broadcast_to(dense['team'][:, frame_num, None, :], active.shape)
+        time_now = np.broadcast_to(frame_num / params['fps'], shape)
+        started = start_time != 0
+
+        for team, times in beyblade_time.items():
+            update = started & (active & (teams == team)).any(axis=-1)
+            times[update] = (time_now - start_time)[update]
+        winner_active = (winner > 0) & (active & (teams == winner[..., None])).any(axis=-1)
+        winner_frame_num[winner_active] = frame_num
+
+        num_active = active.sum(axis=-1)
+        battle_start = (num_active >= 2) & ~started
+        battle_continue = (num_active >= 2) & started
+        start_time[battle_start] = time_now[battle_start]
+        battle_time[battle_continue] = (time_now - start_time)[battle_continue]
+        battle_won = (num_active == 1) & started
+        first_teams = np.take_along_axis(teams, active.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+        winner[battle_won] = first_teams[battle_won]
+
+    total_collision = get_total_collisions(features_list, params)
+
+    # One row per match and combination, with the columns of battle_results.csv
+    results = {'match': np.repeat(match_names if match_names is not None else np.arange(num_matches), shape[1])}
+    results.update({name: np.tile(values, num_matches) for name, values in params.items()})
+    results['battle_time'] = battle_time.ravel().round(2)
+    results['winner'] = pd.array(np.where(winner > 0, winner, None).ravel(), dtype='Int64')  # NA without a winner
+    for team, times in beyblade_time.items():
+        results[f'beyblade{team}_time'] = times.ravel().round(2)
+    times = np.stack(list(beyblade_time.values()))
+    results['remaining_time'] = (times.max(axis=0) - times.min(axis=0)).ravel().round(2)
+    results['total_collision'] = total_collision.ravel()
+    results['winner_frame_num'] = winner_frame_num.ravel()
+    return pd.DataFrame(results)
+
+def score_sweep(results, labels):
+    # Rank the parameter combinations against labelled matches (columns match, winner and
+    # optionally battle_time): share of correct winners, then mean battle time error
+    merged = results.merge(labels, on='match', suffixes=('', '_label'))
+    merged['winner_correct'] = (merged['winner'] == merged['winner_label']).fillna(False).astype(bool)
+    aggregations = {'matches': ('match', 'count'), 'winner_accuracy': ('winner_correct', 'mean')}
+    if 'battle_time_label' in merged:
+        merged['battle_time_error'] = (merged['battle_time'] - merged['battle_time_label']).abs()
+        aggregations['battle_time_mae'] = ('battle_time_error', 'mean')
+    scores = merged.groupby(list(PARAM_NAMES), as_index=False).agg(**aggregations)
+    sort_columns = ['winner_accuracy'] + (['battle_time_mae'] if 'battle_time_mae' in scores else [])
+    return scores.sort_values(sort_columns, ascending=[False] + [True] * (len(sort_columns) - 1), ignore_index=True)
@@ -0,0 +1,44 @@
+import argparse
+import json
+import os
+import sys
+from benchmarks import run_benchmark, compare_to_baseline
+
+BASELINE_PATH = os.path.join('benchmarks', 'baseline.json')
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments for the synthetic video and the baseline comparison
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic arena video.")
+    parser.add_argument("--num_frames", type=int, default=120, help="Length of the synthetic video in frames.")
+    parser.add_argument("--width", type=int, default=960, help="Width of the synthetic video.")
+    parser.add_argument("--height", type=int, default=540, help="Height of the synthetic video.")
+    parser.add_argument("--output_dir", type=str, default="output/benchmark", help="Directory for the synthetic video, the outputs and results.json.")
+    parser.add_argument("--baseline", type=str, default=BASELINE_PATH, help="Baseline results to compare against.")
+    parser.add_argument("--save_baseline", action="store_true", help="Store the results as the new baseline instead of comparing.")
+    parser.add_argument("--fps_threshold", type=float, default=0.2, help="Allowed relative frames/sec drop per stage.")
+    parser.add_argument("--rss_threshold", type=float, default=0.2, help="Allowed relative peak RSS growth per stage.")
+
+    # Run the benchmark with provided arguments
+    args = parser.parse_args()
+
+    results = run_benchmark(args.num_frames, args.width, args.height, args.output_dir)
+    with open(os.path.join(args.output_dir, 'results.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'calibration':16s} {results['calibration']['fps']:>10} fps {results['calibration']['seconds']:>9.3f} s")
+    for stage, stat in results['stages'].items():
+        print(f"{stage:16s} {stat['fps']:>10} fps {stat['seconds']:>9.3f} s {stat['peak_rss_mb']:>8.1f} MB {stat['rss_growth_mb']:>+8.1f} MB")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        # A non-zero exit code lets CI fail on a regression
+        regressions = compare_to_baseline(results, json.load(open(args.baseline)), args.fps_threshold, args.rss_threshold)
+        for regression in regressions:
+            print(f"Regression in {regression['stage']}: {regression['metric']} {regression['baseline']} -> {regression['value']}")
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline')
@@ -0,0 +1,2 @@
+from .synthetic import make_arena_video, get_synthetic_tracks, get_arena_vertices, StubModel
+from .stages import run_benchmark, compare_to_baseline, STAGES
\ No newline at end of file
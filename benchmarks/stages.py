@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+import os
+import sys
+import threading
+import time
+sys.path.append('../')
+from utils import read_video, get_peak_rss_mb, get_rss_mb, render_frames, AsyncVideoWriter
+from trackers import Tracker, TrackStore
+from assigner import Assigner
+from battle import Battle, Arena
+from main import assign_track_store_teams
+from .synthetic import make_arena_video, get_arena_vertices, StubModel
+
+STAGES = ('decode', 'detection', 'tracking', 'track_store', 'team_assignment', 'beyblade_status', 'battle_stat', 'rendering')
+
+class RssSampler:
+    def __init__(self, interval=0.005):
+        # Polls the current RSS on a background thread, so a stage reports its own peak
+        # instead of the process-wide high-water mark
+        self.interval = interval
+        self.peak = 0.0
+        self.stop = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        rss = get_rss_mb()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def poll(self):
+        while not self.stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self.start = self.peak
+        self.thread = threading.Thread(target=self.poll, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        self.sample()
+        return False
+
+class StageTimer:
+    def __init__(self, num_frames):
+        # Collects the wall time, frames/sec and RSS of every benchmark stage
+        self.num_frames = num_frames
+        self.stages = {}
+
+    def run(self, stage, function, *args):
+        # Time one stage and return its result. Without /proc the RSS falls back to the process peak
+        with RssSampler() as sampler:
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - start
+        peak_rss = sampler.peak or get_peak_rss_mb()
+        self.stages[stage] = {
+            'seconds': round(elapsed, 4),
+            'fps': round(self.num_frames / elapsed, 2) if elapsed > 0 else None,
+            'peak_rss_mb': round(peak_rss, 1),
+            'rss_growth_mb': round(peak_rss - (sampler.start or peak_rss), 1)
+        }
+        return result
+
+def run_calibration(iterations=20, seed=0):
+    # Fixed OpenCV workload of the same kind as the stages (blur, color conversion, optical flow),
+    # timed to compare the speed of the machine with the one the baseline was recorded on
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(0, 256, (2, 270, 480, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        prev_gray, gray = [cv2.cvtColor(cv2.GaussianBlur(frame, (5, 5), 0), cv2.COLOR_BGR2GRAY) for frame in frames]
+        cv2.calcOpticalFlowFarneback(prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    elapsed = time.perf_counter() - start
+    return {'seconds': round(elapsed, 4), 'fps': round(iterations / elapsed, 2)}
+
+def run_benchmark(num_frames=300, width=1920, height=1080, work_dir='output/benchmark', seed=0, render_workers=4):
+    # Run the stages of main.py on a synthetic arena video. Detection uses a stub model that replays
+    # the synthetic tracks, and the later stages use those tracks directly so they do not depend on YOLO
+    os.makedirs(work_dir, exist_ok=True)
+    video_path = os.path.join(work_dir, 'synthetic_arena.avi')
+    synthetic_tracks = make_arena_video(video_path, num_frames, width, height, seed=seed)
+    calibration = run_calibration(seed=seed)
+    timer = StageTimer(num_frames)
+
+    video_frames = timer.run('decode', read_video, video_path)
+
+    tracker = Tracker(None, model=StubModel(synthetic_tracks))
+    records = timer.run('detection', tracker.get_detection_records, video_frames)
+
+    def track_frames():
+        offsets = records['frame_num'].searchsorted(range(len(video_frames) + 1))
+        for frame_num in range(len(video_frames)):
+            tracker.get_frame_tracks(tracker.get_supervision_detections(records[offsets[frame_num]:offsets[frame_num+1]]))
+    timer.run('tracking', track_frames)
+
+    def build_track_store():
+        track_store = TrackStore.from_tracks(synthetic_tracks)
+        track_store.add_positions()
+        return track_store
+    track_store = timer.run('track_store', build_track_store)
+
+    def assign_teams():
+        team_assigner = Assigner()
+        assign_frame_num = len(video_frames) // 2
+        team_assigner.assign_beyblade_color(video_frames[assign_frame_num], track_store.get_frame_tracks(assign_frame_num)['Beyblade'])
+        assign_track_store_teams(team_assigner, track_store, video_frames)
+    timer.run('team_assignment', assign_teams)
+
+    battle = Battle(arena=Arena(get_arena_vertices(width, height)))
+    timer.run('beyblade_status', battle.add_track_store_status, track_store, video_frames)
+    battle_stat = timer.run('battle_stat', battle.get_track_store_stat, track_store, os.path.join(work_dir, 'battle_log.csv'))
+
+    # Drawing and encoding as main.py runs them: parallel in-place drawing and a background encoder
+    def render():
+        tracks = track_store.to_tracks()
+
+        def draw_frame(frame_num, frame):
+            tracker.draw_frame_annotations(frame, tracks['Beyblade'][frame_num])
+            battle.draw_frame_stat(frame, {key: values[frame_num] for key, values in battle_stat.items()})
+        video_writer = AsyncVideoWriter(os.path.join(work_dir, 'output_video.avi'), 30)
+        try:
+            render_frames(video_frames, draw_frame, video_writer, min(render_workers, os.cpu_count() or 1))
+        finally:
+            video_writer.release()
+    timer.run('rendering', render)
+
+    return {
+        'config': {'num_frames': num_frames, 'width': width, 'height': height, 'seed': seed},
+        'calibration': calibration,
+        'stages': timer.stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in timer.stages.values()), 4),
+        'peak_rss_mb': round(get_peak_rss_mb(), 1),
+        'winner': battle.winner
+    }
+
+def compare_to_baseline(results, baseline, fps_threshold=0.2, rss_threshold=0.2, min_seconds=0.05):
+    # Stages whose frames/sec dropped, or whose peak RSS grew, by more than the thresholds
+    # relative to the baseline. Baseline fps are first scaled by the calibration speed of this
+    # machine against the baseline machine, so a slower runner is not a regression. Stages faster
+    # than min_seconds are too noisy for an fps check, and baselines of a different video size are
+    # not comparable
+    if baseline.get('config') != results['config']:
+        raise ValueError(f"Baseline config {baseline.get('config')} does not match {results['config']}")
+
+    speed = 1.0
+    if 'calibration' in baseline and 'calibration' in results:
+        speed = results['calibration']['fps'] / baseline['calibration']['fps']
+
+    regressions = []
+    for stage, stat in results['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            continue
+        expected_fps = base['fps'] * speed
+        if base['seconds'] >= min_seconds and stat['fps'] is not None and stat['fps'] < expected_fps * (1 - fps_threshold):
+            regressions.append({'stage': stage, 'metric': 'fps', 'baseline': round(expected_fps, 2), 'value': stat['fps']})
+        if stat['peak_rss_mb'] > base['peak_rss_mb'] * (1 + rss_threshold):
+            regressions.append({'stage': stage, 'metric': 'peak_rss_mb', 'baseline': base['peak_rss_mb'], 'value': stat['peak_rss_mb']})
+    return regressions
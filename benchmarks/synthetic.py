@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import VideoWriter
+from battle import DEFAULT_VERTICES
+
+BEYBLADE_COLORS = [(40, 40, 220), (220, 120, 30)]  # BGR colors of the two synthetic beyblades
+OBJECT_CLASS_IDS = {"Beyblade": 0, "Hand": 1, "Launcher": 2}
+
+def get_arena_vertices(width, height):
+    # Arena polygon scaled to the synthetic frame size
+    return (np.array(DEFAULT_VERTICES) * [width / 1920, height / 1080]).astype(np.int32)
+
+def get_synthetic_tracks(num_frames, width=1920, height=1080, seed=0):
+    # Ground truth tracks of a synthetic battle: two beyblades orbiting the arena center,
+    # a hand and a launcher over the first beyblade at the start, and the second beyblade
+    # leaving the arena after three quarters of the video so the battle has a winner
+    rng = np.random.default_rng(seed)
+    scale = height / 1080
+    radius = 45 * scale
+    center = np.array([width / 2, height * 0.6])
+    orbit = np.array([width * 0.2, height * 0.2])
+    speeds = rng.uniform(0.03, 0.06, 2)
+    phases = rng.uniform(0, 2 * np.pi, 2)
+    launch_frames = max(1, num_frames // 8)
+    exit_frame = num_frames * 3 // 4
+
+    tracks = {"Beyblade": [], "Hand": [], "Launcher": []}
+    for frame_num in range(num_frames):
+        beyblade_track = {}
+        for i in range(2):
+            angle = phases[i] + speeds[i] * frame_num * (1 if i == 0 else -1)
+            position = center + orbit * (0.5 + 0.4 * i) * [np.cos(angle), np.sin(angle)]
+            if i == 1 and frame_num >= exit_frame:
+                # Slide out of the arena to the right
+                position = position + [(frame_num - exit_frame) * 40 * scale, 0]
+            if position[0] - radius < width:
+                beyblade_track[i + 1] = {"bbox": [float(position[0] - radius), float(position[1] - radius),
+                                                  float(position[0] + radius), float(position[1] + radius)]}
+        tracks["Beyblade"].append(beyblade_track)
+
+        hand_track, launcher_track = {}, {}
+        if frame_num < launch_frames and 1 in beyblade_track:
+            x1, y1, x2, y2 = beyblade_track[1]['bbox']
+            launcher_track[1] = {"bbox": [x1 - radius, y1 - 2 * radius, x2 + radius, y1 + radius]}
+            hand_track[1] = {"bbox": [x1 - radius, y1 - 4 * radius, x2 + radius, y1 - radius]}
+        tracks["Hand"].append(hand_track)
+        tracks["Launcher"].append(launcher_track)
+
+    return tracks
+
+def draw_synthetic_frame(frame_num, frame_tracks, background):
+    # Draw a frame: spinning colored discs with spokes so optical flow sees the rotation,
+    # a skin colored hand blob and a gray launcher block
+    frame = background.copy()
+    for track_id, track in frame_tracks["Beyblade"].items():
+        x1, y1, x2, y2 = track['bbox']
+        center = (int((x1 + x2) / 2), int((y1 + y2) / 2))
+        radius = int((x2 - x1) / 2)
+        color = BEYBLADE_COLORS[(track_id - 1) % len(BEYBLADE_COLORS)]
+        cv2.circle(frame, center, radius, color, cv2.FILLED)
+        for spoke in range(4):
+            angle = frame_num * 0.6 + spoke * np.pi / 2
+            end = (int(center[0] + radius * np.cos(angle)), int(center[1] + radius * np.sin(angle)))
+            cv2.line(frame, center, end, (255, 255, 255), max(1, radius // 8))
+    for track in frame_tracks["Launcher"].values():
+        x1, y1, x2, y2 = map(int, track['bbox'])
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (90, 90, 90), cv2.FILLED)
+    for track in frame_tracks["Hand"].values():
+        x1, y1, x2, y2 = map(int, track['bbox'])
+        cv2.ellipse(frame, ((x1 + x2) // 2, (y1 + y2) // 2), ((x2 - x1) // 2, (y2 - y1) // 2), 0, 0, 360, (140, 180, 225), cv2.FILLED)
+    return frame
+
+def make_arena_video(video_path, num_frames=300, width=1920, height=1080, fps=30, seed=0):
+    # Write a synthetic arena video and return its ground truth tracks
+    tracks = get_synthetic_tracks(num_frames, width, height, seed)
+    background = np.full((height, width, 3), 200, dtype=np.uint8)
+    cv2.fillPoly(background, [get_arena_vertices(width, height)], (60, 70, 60))
+
+    video_writer = VideoWriter(video_path, fps)
+    for frame_num in range(num_frames):
+        frame_tracks = {object: object_tracks[frame_num] for object, object_tracks in tracks.items()}
+        video_writer.write(draw_synthetic_frame(frame_num, frame_tracks, background))
+    video_writer.release()
+    return tracks
+
+class StubTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+class StubBoxes:
+    def __init__(self, xyxy, conf, cls):
+        # Numpy arrays exposed through the .cpu().numpy() calls of ultralytics boxes
+        self.xyxy = StubTensor(xyxy)
+        self.conf = StubTensor(conf)
+        self.cls = StubTensor(cls)
+
+    def __len__(self):
+        return len(self.xyxy.array)
+
+class StubResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+class StubModel:
+    def __init__(self, tracks):
+        # Stand-in for the YOLO model that returns the synthetic tracks of each predicted frame,
+        # so detection can be benchmarked without weights. Frames are matched by call order
+        self.names = {class_id: object for object, class_id in OBJECT_CLASS_IDS.items()}
+        self.tracks = tracks
+        self.frame_num = 0
+
+    def predict(self, frames, conf=0.1, imgsz=640):
+        results = []
+        for _ in frames:
+            xyxy, cls = [], []
+            for object, class_id in OBJECT_CLASS_IDS.items():
+                for track in self.tracks[object][self.frame_num % len(self.tracks[object])].values():
+                    xyxy.append(track['bbox'])
+                    cls.append(class_id)
+            results.append(StubResult(StubBoxes(np.array(xyxy, dtype=np.float32).reshape(-1, 4),
+                                                np.full(len(cls), 0.9, dtype=np.float32),
+                                                np.array(cls, dtype=np.float32))))
+            self.frame_num += 1
+        return results
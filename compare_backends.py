@@ -0,0 +1,92 @@
+from trackers import BACKENDS, load_model
+from trackers.backends import get_calibration_frames, DYNAMIC_BACKENDS
+from utils import get_iou
+import argparse
+import json
+import os
+import time
+
+
+def get_detections(result):
+    # (class id, bbox, confidence) of every box of one predict result
+    boxes = result.boxes
+    return list(zip(boxes.cls.cpu().numpy().astype(int).tolist(),
+                    boxes.xyxy.cpu().numpy().tolist(),
+                    boxes.conf.cpu().numpy().tolist()))
+
+
+def match_detections(reference, detections, iou_threshold=0.5):
+    # Greedy same-class matching of the backend boxes to the reference boxes, highest IoU first
+    pairs = sorted(((get_iou(ref_bbox, bbox), i, j)
+                    for i, (ref_class, ref_bbox, _) in enumerate(reference)
+                    for j, (class_id, bbox, _) in enumerate(detections)
+                    if class_id == ref_class), reverse=True)
+    matched_reference, matched_detections, matches = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i in matched_reference or j in matched_detections:
+            continue
+        matched_reference.add(i)
+        matched_detections.add(j)
+        matches.append((iou, abs(reference[i][2] - detections[j][2])))
+    return matches
+
+
+def time_predict(model, frames, conf, imgsz, batch_size=1, warmup=3):
+    # Mean seconds per frame after a few warmup runs, plus the detections of every frame.
+    # Frames are predicted in batches of batch_size like the tracker does
+    for frame in frames[:warmup]:
+        model.predict(frame, conf=conf, imgsz=imgsz, verbose=False)
+    start = time.perf_counter()
+    detections = [get_detections(result)
+                  for i in range(0, len(frames), batch_size)
+                  for result in model.predict(frames[i:i+batch_size], conf=conf, imgsz=imgsz, verbose=False)]
+    return (time.perf_counter() - start) / len(frames), detections
+
+
+def compare_backends(input_video, model_path, backends=('onnx', 'openvino'), int8=False, imgsz=640, conf=0.1, num_frames=50, iou_threshold=0.5, batch_size=20):
+    # Speed of every backend relative to pytorch on frames of our own video, and how well its
+    # detections agree with the pytorch ones (same class, IoU >= iou_threshold)
+    frames = get_calibration_frames([input_video], num_frames)
+    reference_time, reference = time_predict(load_model(model_path, 'pytorch', imgsz), frames, conf, imgsz, batch_size)
+    reference_count = sum(len(frame_detections) for frame_detections in reference)
+
+    report = {'frames': len(frames), 'imgsz': imgsz, 'batch_size': batch_size, 'pytorch': {'ms_per_frame': round(reference_time * 1000, 2), 'detections': reference_count}}
+    for backend in backends:
+        model = load_model(model_path, backend, imgsz, int8, [input_video])
+        backend_time, detections = time_predict(model, frames, conf, imgsz, batch_size if backend in DYNAMIC_BACKENDS else 1)
+        matches = [match for ref, det in zip(reference, detections) for match in match_detections(ref, det, iou_threshold)]
+        detection_count = sum(len(frame_detections) for frame_detections in detections)
+        report[backend + ('_int8' if int8 else '')] = {
+            'ms_per_frame': round(backend_time * 1000, 2),
+            'speedup': round(reference_time / backend_time, 3) if backend_time else None,
+            'detections': detection_count,
+            'recall': round(len(matches) / reference_count, 4) if reference_count else None,  # Share of pytorch boxes found again
+            'precision': round(len(matches) / detection_count, 4) if detection_count else None,
+            'mean_iou': round(sum(iou for iou, _ in matches) / len(matches), 4) if matches else None,
+            'mean_conf_diff': round(sum(diff for _, diff in matches) / len(matches), 4) if matches else None
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments for the video, model and backends to compare
+    parser = argparse.ArgumentParser(description="Compare the speed and detections of the inference backends against pytorch.")
+    parser.add_argument("--input_video", type=str, required=True, help="Path to the video to sample the frames from.")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the trained YOLO model file.")
+    parser.add_argument("--backends", type=str, nargs="+", default=["onnx", "openvino"], choices=BACKENDS[1:], help="Backends to compare against pytorch.")
+    parser.add_argument("--int8", action="store_true", help="Compare the INT8 quantized exports, calibrated on the input video.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size.")
+    parser.add_argument("--batch_size", type=int, default=20, help="Frames per predict call, as in the tracker (torchscript always predicts single frames).")
+    parser.add_argument("--num_frames", type=int, default=50, help="Number of frames sampled evenly across the video.")
+    parser.add_argument("--output_dir", type=str, default="output", help="Directory for backend_report.json.")
+
+    # Run the comparison with provided arguments
+    args = parser.parse_args()
+
+    report = compare_backends(args.input_video, args.model_path, args.backends, args.int8, args.imgsz, num_frames=args.num_frames, batch_size=args.batch_size)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'backend_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
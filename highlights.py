@@ -0,0 +1,49 @@
+from battle import Battle, RotationDetector, Arena, BattleFeatures, HighlightRenderer, read_battle_log, get_highlight_events, get_highlight_ranges
+from utils import FrameIndex
+import argparse
+import os
+import time
+
+
+def get_frame_index(input_video, output_dir):
+    # Frame index saved by the analysis run, or a new one (one decode pass) for older runs
+    frame_index_path = os.path.join(output_dir, 'frame_index.npz')
+    if os.path.exists(frame_index_path):
+        return FrameIndex.load(frame_index_path)
+    frame_index = FrameIndex.from_video(input_video)
+    frame_index.save(frame_index_path)
+    return frame_index
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments for the analysed match and the clip lengths
+    parser = argparse.ArgumentParser(description="Cut the winner crop and highlight clips of an analysed match without re-rendering the whole video.")
+    parser.add_argument("--input_video", type=str, required=True, help="Path to the analysed video file.")
+    parser.add_argument("--output_dir", type=str, default="output", help="Output directory of the analysis run (features.npz, battle_log.csv, arena.json).")
+    parser.add_argument("--battle_log_path", type=str, default=None, help="Battle log of the run, defaults to battle_log.csv in the output directory.")
+    parser.add_argument("--before", type=float, default=1.0, help="Seconds kept before every event.")
+    parser.add_argument("--after", type=float, default=1.0, help="Seconds kept after every event.")
+    parser.add_argument("--no_reel", action="store_true", help="Only save the single clips, not highlights.avi with all of them.")
+    parser.add_argument("--num_teams", type=int, default=2, help="Number of beyblades (teams) the run was analysed with.")
+    parser.add_argument("--collision_debounce", type=int, default=0, help="Collision debounce the run was analysed with.")
+
+    # Render the highlights with provided arguments
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    frame_index = get_frame_index(args.input_video, args.output_dir)
+    features = BattleFeatures.load(os.path.join(args.output_dir, 'features.npz'))
+    battle_log = read_battle_log(args.battle_log_path or os.path.join(args.output_dir, 'battle_log.csv'))
+
+    # The overlays and the winner come from replaying the referee logic on the saved features
+    arena = Arena.load(os.path.join(args.output_dir, 'arena.json'))
+    battle = Battle(RotationDetector(), arena=arena, collision_debounce=args.collision_debounce, num_teams=args.num_teams)
+    battle_stat = battle.get_feature_stat(features)
+
+    renderer = HighlightRenderer(args.input_video, frame_index, battle, features, battle_stat)
+    highlights_dir = os.path.join(args.output_dir, 'highlights')
+    ranges = get_highlight_ranges(get_highlight_events(battle_log), len(frame_index), frame_index.fps, args.before, args.after)
+    clip_paths = renderer.save_clips(ranges, highlights_dir, reel=not args.no_reel)
+    renderer.save_winner_img(os.path.join(highlights_dir, 'winner.jpg'))
+    print(f'Saved {len(clip_paths)} highlight clips ({sum(stop - start for start, stop, _ in ranges)} of {len(frame_index)} frames) '
+          f'to {highlights_dir} in {time.perf_counter() - start_time:.2f} s')
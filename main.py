@@ -1,93 +1,517 @@
-from utils import read_video, save_video
-from trackers import Tracker
+from utils import read_video, iter_video, AsyncVideoWriter, LiveCapture, FrameStore, FrameIndex, profiler, render_frames
+from trackers import Tracker, TrackStore, DetectionCache, StrideScheduler, PhaseScheduler, get_drift_report, BACKENDS
 import cv2
 import numpy as np
 import pandas as pd
 from assigner import Assigner
-from battle import Battle
+from battle import Battle, RotationDetector, BattleLogWriter, LiveBattle, Arena, BattleFeatures, FeatureRecorder, HighlightRenderer, get_highlight_events, get_highlight_ranges
 import argparse
+import json
+import os
+import time
+from collections import deque
 
 
-def main(input_video, model_path):
-    # Load video frames
-    video_frames = read_video(input_video)
+def assign_frame_teams(team_assigner, frame, beyblade_track):
+    # Assign team and color to every Beyblade of a single frame
+    beyblade_ids = list(beyblade_track.keys())
+    beyblade_bboxes = [track['bbox'] for track in beyblade_track.values()]
+    teams = team_assigner.get_beyblade_teams(frame, beyblade_ids, beyblade_bboxes)
+    for track, team in zip(beyblade_track.values(), teams):
+        track['team'] = team
+        track['beyblade_color'] = team_assigner.beyblade_colors[team]
 
-    # Initialize the object tracker with the model
-    tracker = Tracker(model_path)
 
-    # Retrieve object tracks from the video
-    tracks = tracker.get_object_tracks(video_frames,
-                                       read_from_stub=True,
-                                       stub_path='stubs/track_stubs.pkl')
-
-    # Add object position information to tracks
-    tracker.add_position_to_tracks(tracks)
-
-    # Assign Beyblade teams based on color
-    team_assigner = Assigner()
-    team_assigner.assign_beyblade_color(video_frames[240], 
-                                    tracks['Beyblade'][240])
-    
-    # Iterate through frames to assign team and color to Beyblades
-    for frame_num, beyblade_track in enumerate(tracks['Beyblade']):
-        for beyblade_id, track in beyblade_track.items():
-            team = team_assigner.get_beyblade_team(video_frames[frame_num],   
-                                                   track['bbox'],
-                                                   beyblade_id)
-            tracks['Beyblade'][frame_num][beyblade_id]['team'] = team 
-            tracks['Beyblade'][frame_num][beyblade_id]['beyblade_color'] = team_assigner.beyblade_colors[team]
+def assign_track_store_teams(team_assigner, track_store, video_frames):
+    # Assign team and color to every Beyblade of a TrackStore, one batch per frame. Without
+    # video_frames the beyblade_color column already holds the measured colors (sharded runs)
+    records = track_store.records
+    for frame_num in range(track_store.num_frames):
+        rows = track_store.get_frame_rows(frame_num, 'Beyblade')
+        if len(rows) == 0:
+            continue
+        teams = team_assigner.get_beyblade_teams(None if video_frames is None else video_frames[frame_num],
+                                                 records['track_id'][rows].tolist(),
+                                                 records['bbox'][rows].tolist(),
+                                                 records['beyblade_color'][rows] if video_frames is None else None)
+        records['team'][rows] = teams
+        records['beyblade_color'][rows] = [team_assigner.beyblade_colors[team] for team in teams]
 
-    # Initialize battle analysis and gather battle statistics
-    battle = Battle()
-    battle.add_beyblade_status(tracks,video_frames)
-    battle_stat = battle.get_battle_stat(tracks,'output/battle_log.csv')
 
+def get_battle_results(battle):
     # Extract key battle statistics
     battle_time = battle.battle_time
     winner = battle.winner
     beyblade_time = battle.beyblade_time
-    beyblade1_time = beyblade_time[1]
-    beyblade2_time = beyblade_time[2]
-    remaining_time = abs(beyblade2_time - beyblade1_time)
+    remaining_time = max(beyblade_time.values()) - min(beyblade_time.values())
     total_collision = battle.total_collision
 
-    # Organize battle statistics into a DataFrame
+    # Organize battle statistics into a DataFrame, with one time column per team
     battle_data = {
         'battle_time': [round(battle_time,2)],
-        'winner': [winner],
-        'beyblade1_time': [round(beyblade1_time,2)],
-        'beyblade2_time': [round(beyblade2_time,2)],
+        'winner': [winner]
+    }
+    battle_data.update({f'beyblade{team}_time': [round(time,2)] for team, time in beyblade_time.items()})
+    battle_data.update({
         'remaining_time': [round(remaining_time,2)],
         'total_collision': [total_collision]
-    }
+    })
+    return pd.DataFrame(battle_data)
+
 
+def save_battle_results(battle, battle_results_path):
     # Save battle statistics to a CSV file
-    df = pd.DataFrame(battle_data)
-    df.to_csv('output/battle_results.csv', index=False)
+    df = get_battle_results(battle)
+    df.to_csv(battle_results_path, index=False)
 
     # Display winner and battle time
     print('\n')
-    print(f'Winner: Beyblade {winner}')
-    print(f'Battle Time: {battle_time:.2f} s')
+    print(f'Winner: Beyblade {battle.winner}')
+    print(f'Battle Time: {battle.battle_time:.2f} s')
+
+    return df
+
+
+def save_highlights(input_video, output_dir, frame_index, battle, features, battle_stat):
+    # Annotated winner crop and clips around the battle start, every collision and the battle end,
+    # decoded by seeking to those frames instead of re-rendering the whole match
+    renderer = HighlightRenderer(input_video, frame_index, battle, features, battle_stat)
+    highlights_dir = os.path.join(output_dir, 'highlights')
+    ranges = get_highlight_ranges(get_highlight_events(battle_stat), len(frame_index), frame_index.fps)
+    clip_paths = renderer.save_clips(ranges, highlights_dir)
+    renderer.save_winner_img(os.path.join(highlights_dir, 'winner.jpg'))
+    print(f'Saved {len(clip_paths)} highlight clips to {highlights_dir}')
+    return clip_paths
+
+
+def get_stride_scheduler(detection_stride, adaptive_stride):
+    # Keyframe scheduler when the detector should skip frames, None to detect every frame
+    if detection_stride <= 1 and not adaptive_stride:
+        return None
+    return StrideScheduler(max(1, detection_stride), adaptive=adaptive_stride)
+
+
+def get_tracker(tracker, model_path, cache_dir, pipelined, detection_stride=1, adaptive_stride=False, backend='pytorch', imgsz=640, int8=False, calibration_videos=None, roi=None, roi_scale=1.0, cache_max_size_mb=None, cache_max_age_days=None):
+    # Reuse an already loaded tracker (and its backend) with fresh tracking state, or load a new one
+    if tracker is not None:
+        tracker.reset()
+        tracker.stride_scheduler = get_stride_scheduler(detection_stride, adaptive_stride)
+        tracker.roi, tracker.roi_scale = roi, roi_scale
+        return tracker
+    detection_cache = None
+    if cache_dir:
+        # Eviction limits are given in megabytes and days
+        detection_cache = DetectionCache(cache_dir,
+                                         max_size=None if cache_max_size_mb is None else int(cache_max_size_mb * 2**20),
+                                         max_age=None if cache_max_age_days is None else cache_max_age_days * 24 * 3600)
+    return Tracker(model_path, detection_cache, imgsz=imgsz, pipelined=pipelined,
+                   stride_scheduler=get_stride_scheduler(detection_stride, adaptive_stride),
+                   backend=backend, int8=int8, calibration_videos=calibration_videos, roi=roi, roi_scale=roi_scale)
+
+
+def get_arena(arena_path, output_dir):
+    # Battle polygon of the camera setup (the original setup unless a saved arena is given),
+    # recorded next to the results of the run
+    arena = Arena.load(arena_path) if arena_path else Arena()
+    arena.save(os.path.join(output_dir, 'arena.json'))
+    return arena
+
+
+def update_arena(arena_path, vertices=None, roi_margin=None, roi_scale=None):
+    # Create or adjust the saved arena of a camera setup, keeping the settings that are not given.
+    # vertices are 'x,y' strings like in the saved file
+    arena = Arena.load(arena_path) if os.path.exists(arena_path) else Arena()
+    arena = Arena(arena.vertices if vertices is None else [tuple(int(value) for value in point.split(',')) for point in vertices],
+                  arena.roi_margin if roi_margin is None else roi_margin,
+                  arena.roi_scale if roi_scale is None else roi_scale)
+    arena.save(arena_path)
+    return arena
+
+
+def print_tracker_stats(tracker):
+    # Detection cache, pipeline and keyframe statistics of the last run
+    if tracker.detection_cache is not None:
+        print(f'Detection cache: {tracker.detection_cache.get_stats()}')
+    if tracker.pipeline is not None:
+        print(f'Detection pipeline: {tracker.pipeline.get_stats()}')
+    if tracker.stride_scheduler is not None:
+        print(f'Detection stride: {tracker.stride_scheduler.get_stats()}')
+
+
+def save_profile(tracker, output_dir):
+    # Add the component statistics to the profiler and write the run report as JSON and Prometheus text
+    if tracker.detection_cache is not None:
+        profiler.set_gauges('detection_cache', tracker.detection_cache.get_stats())
+    if tracker.pipeline is not None:
+        profiler.set_gauges('detection_pipeline', tracker.pipeline.get_stats())
+    if tracker.stride_scheduler is not None:
+        profiler.set_gauges('detection_stride', tracker.stride_scheduler.get_stats())
+    profiler.save(os.path.join(output_dir, 'profile.json'), os.path.join(output_dir, 'profile.prom'))
+    print(f"Profile: {os.path.join(output_dir, 'profile.json')}")
+
+
+def main(input_video, model_path, flow_mode='dense', verify_flow=False, battle_log_path=None, stub_path=None, cache_dir='stubs/detection_cache', pipelined=False, color_method='fast', output_dir='output', tracker=None, detection_stride=1, adaptive_stride=False, profile=False, render=True, render_workers=4, backend='pytorch', imgsz=640, int8=False, calibration_videos=None, arena_path=None, arena_roi=False, num_teams=2, collision_debounce=0, frame_store_dir=None, highlights=False, cache_max_size_mb=None, cache_max_age_days=None):
+    # Every run writes into its own output directory
+    os.makedirs(output_dir, exist_ok=True)
+    if profile:
+        profiler.enable()
+    battle_log_path = battle_log_path or os.path.join(output_dir, 'battle_log.csv')
+
+    # Load video frames, or map them from the frame store where they are decoded once per video.
+    # The store's frames are copy-on-write so the annotations drawn in place stay in this run
+    frame_store = FrameStore.from_video(input_video, frame_store_dir) if frame_store_dir else None
+    if frame_store is not None:
+        video_frames = frame_store.get_frames(writable=True)
+        frame_index = frame_store.get_frame_index()
+    else:
+        frame_index = FrameIndex()  # Frame timestamps recorded while decoding, for seeking later
+        video_frames = read_video(input_video, frame_index)
+    frame_index.save(os.path.join(output_dir, 'frame_index.npz'))
+
+    # Initialize the object tracker with the model and the detection cache, or reuse a loaded one.
+    # INT8 exports are calibrated on the input video unless other videos are given, and with
+    # arena_roi only the crop around the battle polygon is detected on
+    arena = get_arena(arena_path, output_dir)
+    tracker = get_tracker(tracker, model_path, cache_dir, pipelined, detection_stride, adaptive_stride,
+                          backend, imgsz, int8, calibration_videos or [input_video],
+                          arena.get_roi() if arena_roi else None, arena.roi_scale, cache_max_size_mb, cache_max_age_days)
+
+    # Retrieve object tracks from the video
+    tracks = tracker.get_object_tracks(video_frames,
+                                       read_from_stub=stub_path is not None,
+                                       stub_path=stub_path,
+                                       video_path=input_video)
+
+    # Move the tracks into a columnar store and add object positions in one batch
+    track_store = TrackStore.from_tracks(tracks)
+    track_store.add_positions()
+
+    # Assign Beyblade teams based on color
+    team_assigner = Assigner(color_method, num_teams=num_teams)
+    team_assigner.assign_beyblade_color(video_frames[240], 
+                                    track_store.get_frame_tracks(240)['Beyblade'])
+    
+    # Iterate through frames to assign team and color to Beyblades
+    assign_track_store_teams(team_assigner, track_store, video_frames)
+
+    # Initialize battle analysis and gather battle statistics
+    battle = Battle(RotationDetector(mode=flow_mode, verify=verify_flow), arena=arena, collision_debounce=collision_debounce, num_teams=num_teams)
+    battle.add_track_store_status(track_store, video_frames, frame_store.get_gray() if frame_store is not None else None)
+    battle_stat = battle.get_track_store_stat(track_store, battle_log_path)
+    # Keep the per-beyblade features so the referee logic can be re-run without the video (sweep.py)
+    features = BattleFeatures.from_track_store(track_store)
+    features.save(os.path.join(output_dir, 'features.npz'))
+
+    # Save and display the battle results
+    battle_results = save_battle_results(battle, os.path.join(output_dir, 'battle_results.csv'))
+    if verify_flow:
+        print(f'Rotation check: {battle.rotation_detector.get_report()}')
+    print_tracker_stats(tracker)
+    if highlights:
+        save_highlights(input_video, output_dir, frame_index, battle, features, battle_stat)
 
     # Draw Output 
-    ## Draw Object Tracks
-    output_video_frames = tracker.draw_annotations(video_frames, tracks)
+    if render:
+        # Compatibility view of the tracks for drawing
+        tracks = track_store.to_tracks()
+
+        def draw_frame(frame_num, frame):
+            # Draw the object tracks and the battle stat of one frame in place
+            with profiler.stage('drawing'):
+                tracker.draw_frame_annotations(frame, tracks['Beyblade'][frame_num])
+                battle.draw_frame_stat(frame, {key: values[frame_num] for key, values in battle_stat.items()})
+
+        # Frames are drawn on worker threads while the previous chunk is encoded in the background
+        video_writer = AsyncVideoWriter(os.path.join(output_dir, 'output_video.avi'), 30)
+        try:
+            render_frames(video_frames, draw_frame, video_writer, min(render_workers, os.cpu_count() or 1))
+        finally:
+            video_writer.release()
+    profiler.count('frames_processed', len(video_frames))
+
+    # Save the winner image, cropped from the annotated frame unless rendering is skipped
+    if battle.winner_frame_num is not None:
+        cv2.imwrite(os.path.join(output_dir, 'winner.jpg'), battle.get_winner_img(video_frames[battle.winner_frame_num]))
+
+    if profile:
+        save_profile(tracker, output_dir)
+        profiler.disable()
+
+    return battle_results
+
+def main_stream(input_video, model_path, assign_frame_num=240, flow_mode='dense', verify_flow=False, battle_log_path=None, stub_path=None, cache_dir='stubs/detection_cache', pipelined=False, color_method='fast', output_dir='output', tracker=None, detection_stride=1, adaptive_stride=False, profile=False, render=True, backend='pytorch', imgsz=640, int8=False, calibration_videos=None, arena_path=None, arena_roi=False, num_teams=2, collision_debounce=0, frame_store_dir=None, highlights=False, phase_schedule=False, coarse_stride=4, confirm_window=2.0, cache_max_size_mb=None, cache_max_age_days=None):
+    # Single-pass version of main: frames flow through detection, tracking, team assignment,
+    # battle analysis, drawing and encoding one at a time, so memory stays flat for any video length
+    os.makedirs(output_dir, exist_ok=True)
+    if profile:
+        profiler.enable()
+    battle_log_path = battle_log_path or os.path.join(output_dir, 'battle_log.csv')
+    arena = get_arena(arena_path, output_dir)
+    tracker = get_tracker(tracker, model_path, cache_dir, pipelined, detection_stride, adaptive_stride,
+                          backend, imgsz, int8, calibration_videos or [input_video],
+                          arena.get_roi() if arena_roi else None, arena.roi_scale, cache_max_size_mb, cache_max_age_days)
+    team_assigner = Assigner(color_method, num_teams=num_teams)
+    battle = Battle(RotationDetector(mode=flow_mode, verify=verify_flow), arena=arena, collision_debounce=collision_debounce, num_teams=num_teams)
+    video_writer = AsyncVideoWriter(os.path.join(output_dir, 'output_video.avi'), 30) if render else None
+    battle_log = BattleLogWriter(battle_log_path)
+    feature_recorder = FeatureRecorder()
+    frame_stats = []  # Per-frame battle statistics, only kept for the highlights
+    winner_img = None
+    last_stat = None  # Battle statistics of the last analysed frame, kept by the skipped frames
+
+    # With the phase schedule the battle state drives the detector: keyframes only while waiting for
+    # the launch, every frame during the battle, and no analysis at all once the winner has held for
+    # confirm_window seconds (negative or None analyses until the end)
+    phase_scheduler = None
+    if phase_schedule:
+        confirm_frames = int(round(confirm_window * battle.fps)) if confirm_window is not None and confirm_window >= 0 else None
+        phase_scheduler = PhaseScheduler(coarse_stride, confirm_frames, battle.is_launching, max(1, detection_stride))
+        tracker.stride_scheduler = phase_scheduler
+
+    if frame_store_dir:
+        frame_store = FrameStore.from_video(input_video, frame_store_dir)
+        frames, frame_index = frame_store.iter_frames(), frame_store.get_frame_index()
+    else:
+        frame_index = FrameIndex()  # Filled while the frames are decoded, for seeking later
+        frames = iter_video(input_video, frame_index)
+    frame_tracks_stream = tracker.iter_object_tracks(frames,
+                                                     read_from_stub=stub_path is not None,
+                                                     stub_path=stub_path,
+                                                     video_path=input_video)
+
+    # Team colors are fitted on a reference frame, so earlier frames wait in a bounded buffer
+    pending = deque()
+    prev_gray = None
+
+    def process_frame(frame_num, frame, frame_tracks, prev_gray):
+        nonlocal winner_img, last_stat
+        start = time.perf_counter()
+        skipped = phase_scheduler is not None and phase_scheduler.is_skipped(frame_num)
+        if skipped:
+            # The battle is decided: no tracks, team assignment, optical flow or battle update, the
+            # frame keeps the last statistics so the log and the video still have one row per frame
+            frame_tracks = {object: {} for object in frame_tracks}
+            frame_gray = None
+            frame_stat = dict(last_stat, collision=False)
+        else:
+            assign_frame_teams(team_assigner, frame, frame_tracks['Beyblade'])
+            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            battle.add_frame_beyblade_status(frame_tracks, frame_gray, prev_gray)
+            frame_stat = battle.get_frame_stat(frame_num, frame_tracks['Beyblade'])
+            if phase_scheduler is not None:
+                phase_scheduler.update_phase(frame_num, frame_stat['battle_status'], battle.winner)
+            last_stat = frame_stat
+        feature_recorder.add_frame(frame_num, frame_tracks)
+        battle_log.write(frame_num, frame_stat['battle_status'], frame_stat['collision'])
+        if highlights:
+            frame_stats.append(frame_stat)
+
+        if render:
+            with profiler.stage('drawing'):
+                frame = tracker.draw_frame_annotations(frame, frame_tracks['Beyblade'])
+                frame = battle.draw_frame_stat(frame, frame_stat)
+                if skipped:
+                    frame = cv2.putText(frame, "Winner confirmed, analysis stopped", (50, 130 + 40 * num_teams), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+        if frame_num == battle.winner_frame_num:
+            winner_img = battle.get_winner_img(frame).copy()
+
+        if render:
+            video_writer.write(frame)
+        profiler.count('frames_processed')
+        profiler.observe('frame_latency', time.perf_counter() - start)
+        return frame_gray
+
+    for frame_num, (frame, frame_tracks) in enumerate(frame_tracks_stream):
+        tracker.add_position_to_frame_tracks(frame_tracks)
+        pending.append((frame_num, frame, frame_tracks))
 
-    ## Draw Battle Stat
-    output_video_frames, winner_img = battle.draw_stat(output_video_frames, battle_stat, tracks)
+        if frame_num == assign_frame_num:
+            team_assigner.assign_beyblade_color(frame, frame_tracks['Beyblade'])
 
-    # Save the final annotated video and winner image
-    save_video(output_video_frames, 'output/output_video.avi')
-    cv2.imwrite('output/winner.jpg', winner_img)
+        if frame_num >= assign_frame_num:
+            while pending:
+                prev_gray = process_frame(*pending.popleft(), prev_gray)
+
+    # Videos shorter than the reference frame fall back to their last frame
+    if pending:
+        _, frame, frame_tracks = pending[-1]
+        team_assigner.assign_beyblade_color(frame, frame_tracks['Beyblade'])
+        while pending:
+            prev_gray = process_frame(*pending.popleft(), prev_gray)
+
+    if render:
+        video_writer.release()
+    battle_log.close()
+    features = feature_recorder.get_features()
+    features.save(os.path.join(output_dir, 'features.npz'))
+    frame_index.save(os.path.join(output_dir, 'frame_index.npz'))
+    if phase_scheduler is not None:
+        # Where the schedule switched, so the skipped frames of the log and the video can be told apart
+        phase_report = dict(phase_scheduler.get_stats(), num_frames=features.num_frames)
+        with open(os.path.join(output_dir, 'phase_report.json'), 'w') as f:
+            json.dump(phase_report, f, indent=2)
+
+    # Save the battle results
+    battle_results = save_battle_results(battle, os.path.join(output_dir, 'battle_results.csv'))
+    if verify_flow:
+        print(f'Rotation check: {battle.rotation_detector.get_report()}')
+    print_tracker_stats(tracker)
+    if highlights:
+        save_highlights(input_video, output_dir, frame_index, battle, features, battle.save_battle_stat(frame_stats, None, len(frame_stats)))
+
+    if winner_img is not None:
+        cv2.imwrite(os.path.join(output_dir, 'winner.jpg'), winner_img)
+
+    if profile:
+        save_profile(tracker, output_dir)
+        profiler.disable()
+
+    return battle_results
+
+def main_live(input_video, model_path, latency_budget=0.25, flow_mode='dense', color_method='fast', output_dir='output', show=False, tracker=None, profile=False, render=True, backend='pytorch', imgsz=640, int8=False, calibration_videos=None, arena_path=None, arena_roi=False, num_teams=2, collision_debounce=0):
+    # Analyze a live stream (URL, camera index or a file played at wall-clock speed) incrementally,
+    # emitting battle events as they happen and dropping frames that exceed the latency budget
+    os.makedirs(output_dir, exist_ok=True)
+    if profile:
+        profiler.enable()
+    # Live frames are never cached, and a stream cannot be calibrated on, so INT8 needs calibration_videos
+    arena = get_arena(arena_path, output_dir)
+    tracker = get_tracker(tracker, model_path, None, False, backend=backend, imgsz=imgsz, int8=int8, calibration_videos=calibration_videos,
+                          roi=arena.get_roi() if arena_roi else None, roi_scale=arena.roi_scale)
+    team_assigner = Assigner(color_method, num_teams=num_teams)
+    battle = Battle(RotationDetector(mode=flow_mode), arena=arena, collision_debounce=collision_debounce, num_teams=num_teams)
+    source = int(input_video) if input_video.isdigit() else input_video
+    capture = LiveCapture(source)
+    # The recording runs at the capture frame rate, see on_frame
+    video_writer = AsyncVideoWriter(os.path.join(output_dir, 'output_video.avi'), capture.fps) if render else None
+    recorded_frames = 0
+
+    def on_frame(frame, frame_tracks, frame_stat, timestamp):
+        # Draw the current state for the arena screen and the recording
+        nonlocal recorded_frames
+        frame = tracker.draw_frame_annotations(frame, frame_tracks['Beyblade'])
+        frame = battle.draw_frame_stat(frame, frame_stat)
+        if render:
+            # Dropped frames repeat the last analysed one, so the recording plays back in real time
+            # and its frames line up with the battle log and event timestamps
+            repeats = round(timestamp * capture.fps) + 1 - recorded_frames
+            for _ in range(repeats):
+                video_writer.write(frame)
+            recorded_frames += repeats
+        if show:
+            cv2.imshow('Beyblade Battle', frame)
+            cv2.waitKey(1)
+
+    def on_event(event):
+        print(f'Event: {event}')
+
+    # Without a recording or a window nothing is drawn
+    live_battle = LiveBattle(tracker, team_assigner, battle, latency_budget, on_event=on_event,
+                             on_frame=on_frame if render or show else None)
+    try:
+        stats = live_battle.run(capture)
+    finally:
+        capture.release()
+        if render:
+            video_writer.release()
+
+    live_battle.save_events(os.path.join(output_dir, 'events.jsonl'))
+    battle_results = save_battle_results(battle, os.path.join(output_dir, 'battle_results.csv'))
+    print(f'Live stats: {stats}')
+
+    if profile:
+        save_profile(tracker, output_dir)
+        profiler.disable()
+
+    return battle_results
+
+def stride_report(input_video, model_path, detection_stride=4, adaptive_stride=False, output_dir='output', stream=False, **options):
+    # Run the video with full per-frame detection and with the detection stride, then report
+    # how far the strided winner, battle times and collisions drift from the full run
+    run = main_stream if stream else main
+    options['cache_dir'] = None  # Both runs have to run the detector to compare their speed
+    tracker = get_tracker(options.pop('tracker', None), model_path, None, options.get('pipelined', False),
+                          backend=options.get('backend', 'pytorch'), imgsz=options.get('imgsz', 640), int8=options.get('int8', False),
+                          calibration_videos=options.get('calibration_videos') or [input_video])
+
+    start = time.perf_counter()
+    reference_results = run(input_video, model_path, output_dir=os.path.join(output_dir, 'full'), tracker=tracker, **options)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    strided_results = run(input_video, model_path, output_dir=os.path.join(output_dir, 'strided'), tracker=tracker,
+                          detection_stride=detection_stride, adaptive_stride=adaptive_stride, **options)
+    strided_time = time.perf_counter() - start
+
+    report = get_drift_report(reference_results, strided_results)
+    report.update(tracker.stride_scheduler.get_stats())
+    report['full_time'] = round(reference_time, 3)
+    report['strided_time'] = round(strided_time, 3)
+    report['speedup'] = round(reference_time / strided_time, 3) if strided_time else None
+    with open(os.path.join(output_dir, 'stride_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Stride report: {report}')
+    return report
 
 if __name__ == "__main__":
     # Parse command-line arguments for video and model paths
     parser = argparse.ArgumentParser(description="Analyze a beyblade battle video using a trained model.")
-    parser.add_argument("--input_video", type=str, required=True, help="Path to the input video file.")
+    parser.add_argument("--input_video", type=str, required=True, help="Path to the input video file (or stream URL / camera index with --live).")
     parser.add_argument("--model_path", type=str, required=True, help="Path to the trained YOLO model file.")
+    parser.add_argument("--live", action="store_true", help="Analyze a live stream (URL, camera index, or a file played at wall-clock speed) incrementally.")
+    parser.add_argument("--latency_budget", type=float, default=0.25, help="Seconds a live frame may wait before it is dropped.")
+    parser.add_argument("--show", action="store_true", help="Show the annotated live frames in a window.")
+    parser.add_argument("--stream", action="store_true", help="Process the video in a single streaming pass with bounded memory.")
+    parser.add_argument("--flow_mode", type=str, default="dense", choices=["dense", "roi", "sparse"], help="Optical flow mode for the beyblade rotation check.")
+    parser.add_argument("--verify_flow", action="store_true", help="Compare the rotation flags against full-frame dense optical flow.")
+    parser.add_argument("--stub_path", type=str, default=None, help="Read tracks from (or save them to) a pickle stub instead of the detection cache.")
+    parser.add_argument("--cache_dir", type=str, default="stubs/detection_cache", help="Directory of the detection cache, empty to disable it.")
+    parser.add_argument("--cache_max_size", type=float, default=None, help="Megabytes the detection cache may use, least recently used videos are evicted beyond it.")
+    parser.add_argument("--cache_max_age", type=float, default=None, help="Days after their last use that detection cache entries are evicted.")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap decoding, detection and tracking with an adaptive batch size (one detection cache chunk per batch when the cache is on).")
+    parser.add_argument("--color_method", type=str, default="fast", choices=["fast", "kmeans"], help="Beyblade color method used for team assignment.")
+    parser.add_argument("--battle_log_path", type=str, default=None, help="Path of the per-frame battle log (.csv or .parquet), defaults to battle_log.csv in the output directory.")
+    parser.add_argument("--output_dir", type=str, default="output", help="Directory for the results, log, winner image and annotated video.")
+    parser.add_argument("--detection_stride", type=int, default=1, help="Run the detector every N frames and interpolate the tracks in between.")
+    parser.add_argument("--adaptive_stride", action="store_true", help="Adapt the detection stride to the beyblade motion, starting from --detection_stride.")
+    parser.add_argument("--profile", action="store_true", help="Record stage timings, latency histograms and counters to profile.json and profile.prom in the output directory.")
+    parser.add_argument("--no_render", "--no-render", action="store_true", help="Stats-only run: skip drawing and encoding the annotated video.")
+    parser.add_argument("--render_workers", type=int, default=4, help="Threads drawing the annotated frames of a batch run.")
+    parser.add_argument("--stride_report", action="store_true", help="Compare the strided results against full per-frame detection and write stride_report.json.")
+    parser.add_argument("--backend", type=str, default="pytorch", choices=BACKENDS, help="Inference backend of the detector, exported from the model file on first use.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size of the detector (and of its exports).")
+    parser.add_argument("--int8", action="store_true", help="Use an INT8 quantized onnx or openvino export, calibrated on frames of the input video.")
+    parser.add_argument("--calibration_videos", type=str, nargs="+", default=None, help="Videos to sample the INT8 calibration frames from instead of the input video.")
+    parser.add_argument("--arena_path", type=str, default=None, help="JSON file with the battle polygon of the camera setup, defaults to the original 1920x1080 setup.")
+    parser.add_argument("--arena_vertices", type=str, nargs="+", default=None, help="Battle polygon as x,y points, saved to --arena_path.")
+    parser.add_argument("--roi_margin", type=int, default=None, help="Pixels kept around the battle polygon in the arena crop, saved to --arena_path.")
+    parser.add_argument("--roi_scale", type=float, default=None, help="Resize factor of the arena crop before detection, saved to --arena_path.")
+    parser.add_argument("--arena_roi", action="store_true", help="Only detect on the crop around the battle polygon and map the boxes back to the full frame.")
+    parser.add_argument("--frame_store_dir", type=str, default=None, help="Decode the video once into a memory-mapped frame store in this directory (e.g. stubs/frame_store) and reuse it on reruns.")
+    parser.add_argument("--highlights", action="store_true", help="Also save annotated clips around the battle start, every collision and the battle end, plus a reel of them, to the highlights directory.")
+    parser.add_argument("--phase_schedule", action="store_true", help="With --stream, only detect keyframes before the launch and stop the analysis once the winner is confirmed (see phase_report.json).")
+    parser.add_argument("--coarse_stride", type=int, default=4, help="Detection stride of --phase_schedule while waiting for the launch.")
+    parser.add_argument("--confirm_window", type=float, default=2.0, help="Seconds the winner has to hold before --phase_schedule stops the analysis, negative to analyse until the end.")
+    parser.add_argument("--num_teams", type=int, default=2, help="Number of beyblades (teams) in the battle.")
+    parser.add_argument("--collision_debounce", type=int, default=0, help="Frames a pair of beyblades has to be apart before their next contact counts as a new collision.")
 
     # Run the main function with provided arguments
     args = parser.parse_args()
     
-    main(args.input_video, args.model_path)
+    if args.arena_vertices or args.roi_margin is not None or args.roi_scale is not None:
+        if args.arena_path is None:
+            parser.error("--arena_vertices, --roi_margin and --roi_scale are saved to --arena_path, which is required with them")
+        update_arena(args.arena_path, args.arena_vertices, args.roi_margin, args.roi_scale)
+    if args.phase_schedule and (not args.stream or args.live or args.stride_report or args.adaptive_stride):
+        parser.error("--phase_schedule follows the battle in a single pass, it needs --stream and does not combine with --live, --stride_report or --adaptive_stride")
+
+    run_options = dict(backend=args.backend, imgsz=args.imgsz, int8=args.int8, calibration_videos=args.calibration_videos,
+                           arena_path=args.arena_path, arena_roi=args.arena_roi, num_teams=args.num_teams, collision_debounce=args.collision_debounce)
+    if args.live:
+        main_live(args.input_video, args.model_path, latency_budget=args.latency_budget, flow_mode=args.flow_mode, color_method=args.color_method, output_dir=args.output_dir, show=args.show, profile=args.profile, render=not args.no_render, **run_options)
+    elif args.stride_report:
+        stride_report(args.input_video, args.model_path, detection_stride=args.detection_stride, adaptive_stride=args.adaptive_stride, output_dir=args.output_dir, stream=args.stream, flow_mode=args.flow_mode, pipelined=args.pipelined, color_method=args.color_method, render=not args.no_render, frame_store_dir=args.frame_store_dir, **run_options)
+    elif args.stream:
+        main_stream(args.input_video, args.model_path, flow_mode=args.flow_mode, verify_flow=args.verify_flow, battle_log_path=args.battle_log_path, stub_path=args.stub_path, cache_dir=args.cache_dir, cache_max_size_mb=args.cache_max_size, cache_max_age_days=args.cache_max_age, pipelined=args.pipelined, color_method=args.color_method, output_dir=args.output_dir, detection_stride=args.detection_stride, adaptive_stride=args.adaptive_stride, profile=args.profile, render=not args.no_render, frame_store_dir=args.frame_store_dir, highlights=args.highlights, phase_schedule=args.phase_schedule, coarse_stride=args.coarse_stride, confirm_window=args.confirm_window, **run_options)
+    else:
+        main(args.input_video, args.model_path, flow_mode=args.flow_mode, verify_flow=args.verify_flow, battle_log_path=args.battle_log_path, stub_path=args.stub_path, cache_dir=args.cache_dir, cache_max_size_mb=args.cache_max_size, cache_max_age_days=args.cache_max_age, pipelined=args.pipelined, color_method=args.color_method, output_dir=args.output_dir, detection_stride=args.detection_stride, adaptive_stride=args.adaptive_stride, profile=args.profile, render=not args.no_render, render_workers=args.render_workers, frame_store_dir=args.frame_store_dir, highlights=args.highlights, **run_options)
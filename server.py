@@ -0,0 +1,238 @@
+import time
+PROCESS_START = time.perf_counter()  # Before any other import, for the cold-start report
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Options a job may pass to main, or to main_stream with stream set. The model, its backend and the
+# detection cache belong to the warm trackers of the server, and the profiler is shared by the whole process
+JOB_OPTIONS = {
+    False: ('flow_mode', 'verify_flow', 'battle_log_path', 'stub_path', 'color_method', 'detection_stride', 'adaptive_stride',
+            'render', 'render_workers', 'arena_path', 'arena_roi', 'num_teams', 'collision_debounce', 'frame_store_dir', 'highlights'),
+    True: ('assign_frame_num', 'flow_mode', 'verify_flow', 'battle_log_path', 'stub_path', 'color_method', 'detection_stride',
+           'adaptive_stride', 'render', 'arena_path', 'arena_roi', 'num_teams', 'collision_debounce', 'frame_store_dir', 'highlights',
+           'phase_schedule', 'coarse_stride', 'confirm_window')
+}
+
+class AnalysisServer:
+    def __init__(self, model_path, workers=1, queue_size=16, output_dir='output/jobs', cache_dir='stubs/detection_cache',
+                 pipelined=False, backend='pytorch', imgsz=640, int8=False, calibration_videos=None, cache_max_size_mb=None, cache_max_age_days=None):
+        # Long-running analysis service. The heavy imports and one loaded model per worker are paid
+        # once at startup, every job then only reuses a warm tracker with fresh tracking state
+        self.model_path = model_path
+        self.output_dir = output_dir  # Jobs without an output_dir write to a job_<id> directory in here
+        self.jobs = {}  # job id -> job record, as returned by the HTTP API
+        self.job_queue = queue.Queue(maxsize=queue_size)  # Submissions beyond queue_size are refused
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+        import_start = time.perf_counter()
+        from main import main, main_stream, get_tracker
+        import sklearn.cluster  # Team clustering of the Assigner
+        import supervision  # ByteTrack of the Tracker
+        self.runs = {False: main, True: main_stream}
+        model_start = time.perf_counter()
+        self.trackers = [get_tracker(None, model_path, cache_dir, pipelined, backend=backend, imgsz=imgsz, int8=int8,
+                                     calibration_videos=calibration_videos, cache_max_size_mb=cache_max_size_mb,
+                                     cache_max_age_days=cache_max_age_days) for _ in range(workers)]
+        for tracker in self.trackers:
+            tracker.get_model()
+        ready_time = time.perf_counter()
+        self.cold_start = {
+            'import_time': round(model_start - import_start, 3),
+            'model_load_time': round(ready_time - model_start, 3),
+            'ready_time': round(ready_time - PROCESS_START, 3)  # From process start, what every CLI run pays
+        }
+
+        self.threads = [threading.Thread(target=self.work, args=(tracker,), daemon=True) for tracker in self.trackers]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, input_video, output_dir=None, **options):
+        # Queue an analysis job and return its record. Raises ValueError for bad jobs and queue.Full
+        # when the queue is full
+        stream = bool(options.get('stream', False))
+        unknown = sorted(set(options) - {'stream'} - set(JOB_OPTIONS[stream]))
+        if unknown:
+            raise ValueError(f'Unknown {"stream" if stream else "batch"} job options: {", ".join(unknown)}')
+        if not os.path.exists(input_video):
+            raise ValueError(f'Input video not found: {input_video}')
+        with self.lock:
+            job_id = str(next(self.job_ids))
+            job = {
+                'id': job_id,
+                'status': 'queued',
+                'input_video': input_video,
+                'output_dir': output_dir or os.path.join(self.output_dir, f'job_{job_id}'),
+                'options': options,
+                'submit_time': time.time(),
+                'queue_time': None,
+                'run_time': None,
+                'results': None,
+                'error': None
+            }
+            self.job_queue.put_nowait(job)
+            self.jobs[job_id] = job
+        return job
+
+    def work(self, tracker):
+        # Worker thread: run the queued jobs one at a time on its own warm tracker
+        while True:
+            job = self.job_queue.get()
+            start_time = time.perf_counter()
+            job['queue_time'] = round(time.time() - job['submit_time'], 3)
+            job['status'] = 'running'
+            options = dict(job['options'])
+            run = self.runs[bool(options.pop('stream', False))]
+            try:
+                battle_results = run(job['input_video'], self.model_path, output_dir=job['output_dir'], tracker=tracker, **options)
+                job['results'] = json.loads(battle_results.to_json(orient='records'))
+                job['status'] = 'done'
+            except Exception as e:
+                # A failed job is reported, the worker and its tracker keep serving
+                job['error'] = str(e)
+                job['status'] = 'failed'
+            job['run_time'] = round(time.perf_counter() - start_time, 3)
+            self.job_queue.task_done()
+
+    def get_stats(self):
+        # Cold start, queue and per-job timings of the server
+        with self.lock:
+            jobs = list(self.jobs.values())
+        finished = [job for job in jobs if job['run_time'] is not None]
+        statuses = [job['status'] for job in jobs]
+        return {
+            'cold_start': self.cold_start,
+            'uptime': round(time.perf_counter() - PROCESS_START, 3),
+            'workers': len(self.trackers),
+            'jobs': {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')},
+            'mean_queue_time': round(sum(job['queue_time'] for job in finished) / len(finished), 3) if finished else None,
+            'mean_run_time': round(sum(job['run_time'] for job in finished) / len(finished), 3) if finished else None
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # JSON API of the server: POST /jobs, GET /jobs, GET /jobs/<id> and GET /stats
+    server_version = 'BeybladeAnalysis/1.0'
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        analysis = self.server.analysis
+        if self.path == '/stats':
+            self.send_json(200, analysis.get_stats())
+        elif self.path == '/jobs':
+            self.send_json(200, list(analysis.jobs.values()))
+        elif self.path.startswith('/jobs/') and self.path[len('/jobs/'):] in analysis.jobs:
+            self.send_json(200, analysis.jobs[self.path[len('/jobs/'):]])
+        else:
+            self.send_json(404, {'error': f'Not found: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self.send_json(404, {'error': f'Not found: {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.server.analysis.submit(request.pop('input_video'), request.pop('output_dir', None), **request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_json(400, {'error': f'Bad job: {e}'})
+            return
+        except queue.Full:
+            self.send_json(503, {'error': 'Job queue is full'})
+            return
+        self.send_json(202, job)
+
+    def log_message(self, format, *args):
+        # Jobs print their own progress, requests are not logged
+        pass
+
+
+def serve(analysis, host='127.0.0.1', port=8765):
+    # Serve the analysis API on localhost until interrupted
+    http_server = ThreadingHTTPServer((host, port), RequestHandler)
+    http_server.analysis = analysis
+    print(f'Serving on http://{host}:{port} with {len(analysis.trackers)} warm workers, cold start: {analysis.cold_start}')
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+
+
+def request_json(url, data=None):
+    # GET (or POST data as JSON) and decode the JSON answer, also for error statuses
+    request = urllib.request.Request(url, data=None if data is None else json.dumps(data).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+def submit_job(url, input_video, output_dir=None, wait=True, poll_interval=0.1, **options):
+    # Submit a job to a running server and optionally wait for it. The latency from submitting to
+    # the finished job minus its run time is the per-job overhead of the server (HTTP, queue, polling)
+    start_time = time.perf_counter()
+    job = request_json(f'{url}/jobs', dict(options, input_video=os.path.abspath(input_video),
+                                           output_dir=output_dir and os.path.abspath(output_dir)))
+    if 'id' not in job or not wait:
+        return job
+    while job['status'] in ('queued', 'running'):
+        time.sleep(poll_interval)
+        job = request_json(f"{url}/jobs/{job['id']}")
+    job['latency'] = round(time.perf_counter() - start_time, 3)
+    job['overhead'] = round(job['latency'] - job['run_time'], 3)
+    return job
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments to start the server or to submit a job to a running one
+    parser = argparse.ArgumentParser(description="Keep the analysis models warm in a local server and run battle analysis jobs on it.")
+    parser.add_argument("--model_path", type=str, default=None, help="Path to the trained YOLO model file, required to start the server.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to serve on, localhost by default.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to serve on (or of the server to submit to).")
+    parser.add_argument("--workers", type=int, default=1, help="Jobs analysed at the same time, each worker keeps its own loaded model.")
+    parser.add_argument("--queue_size", type=int, default=16, help="Jobs that may wait for a worker before submissions are refused.")
+    parser.add_argument("--output_dir", type=str, default="output/jobs", help="Directory for the outputs of jobs that do not name their own.")
+    parser.add_argument("--cache_dir", type=str, default="stubs/detection_cache", help="Directory of the detection cache, empty to disable it.")
+    parser.add_argument("--cache_max_size", type=float, default=None, help="Megabytes the detection cache may use, least recently used videos are evicted beyond it.")
+    parser.add_argument("--cache_max_age", type=float, default=None, help="Days after their last use that detection cache entries are evicted.")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap decoding, detection and tracking with an adaptive batch size (one detection cache chunk per batch when the cache is on).")
+    parser.add_argument("--backend", type=str, default="pytorch", choices=["pytorch", "onnx", "openvino", "torchscript"], help="Inference backend of the detector, exported from the model file once at startup.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size of the detector (and of its exports).")
+    parser.add_argument("--int8", action="store_true", help="Use an INT8 quantized onnx or openvino export.")
+    parser.add_argument("--calibration_videos", type=str, nargs="+", default=None, help="Videos to sample the INT8 calibration frames from.")
+    parser.add_argument("--submit", type=str, default=None, help="Submit this video to the running server instead of starting one.")
+    parser.add_argument("--job_output_dir", type=str, default=None, help="Output directory of the submitted job.")
+    parser.add_argument("--job_options", type=str, default="{}", help='JSON object of main.py options for the submitted job, e.g. \'{"stream": true}\'.')
+    parser.add_argument("--no_wait", action="store_true", help="Return after submitting instead of waiting for the job.")
+
+    # Submit a job, or start the server with provided arguments
+    args = parser.parse_args()
+
+    if args.submit:
+        job = submit_job(f'http://{args.host}:{args.port}', args.submit, args.job_output_dir, wait=not args.no_wait, **json.loads(args.job_options))
+        print(json.dumps(job, indent=2))
+    else:
+        if args.model_path is None:
+            parser.error("--model_path is required to start the server")
+        analysis = AnalysisServer(args.model_path, workers=args.workers, queue_size=args.queue_size, output_dir=args.output_dir,
+                                  cache_dir=args.cache_dir, pipelined=args.pipelined, backend=args.backend, imgsz=args.imgsz, int8=args.int8,
+                                  calibration_videos=args.calibration_videos, cache_max_size_mb=args.cache_max_size, cache_max_age_days=args.cache_max_age)
+        serve(analysis, args.host, args.port)
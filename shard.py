@@ -0,0 +1,203 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import tournament
+
+
+def analyze_segment(input_video, segment, frame_source, arena):
+    # Decode, detect and track one segment in a worker and add everything the battle pass needs
+    # per beyblade: position, polygon, hand/launcher contact, optical flow and the measured color.
+    # Returns the track records, numbered by the frames of the whole video, and the run time
+    import cv2
+    from main import get_tracker
+    from assigner import Assigner
+    from battle import Battle, RotationDetector
+    from trackers import TrackStore, OBJECT_CLASSES
+
+    start_time = time.perf_counter()
+    options = tournament.worker_options
+    start, own_start, stop = segment
+    tracker = get_tracker(tournament.worker_tracker, None, None, False,
+                          roi=arena.get_roi() if options['arena_roi'] else None, roi_scale=arena.roi_scale)
+    battle = Battle(RotationDetector(mode=options['flow_mode']), arena=arena)
+    team_assigner = Assigner(options['color_method'])
+
+    # Frames mapped from the frame store (with its gray plane), or decoded by seeking to the segment
+    if hasattr(frame_source, 'get_gray'):
+        frames, gray_frames = frame_source[start:stop], frame_source.get_gray()
+    else:
+        frames, gray_frames = (frame for _, frame in frame_source.iter_range(input_video, start, stop)), None
+
+    tracks = {object: [] for object in OBJECT_CLASSES}
+    prev_gray = None
+    for frame_num, (frame, frame_tracks) in enumerate(tracker.iter_object_tracks(frames), start):
+        frame_gray = gray_frames[frame_num] if gray_frames is not None else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        tracker.add_position_to_frame_tracks(frame_tracks)
+        battle.add_frame_beyblade_status(frame_tracks, frame_gray, prev_gray)
+        # Colors of every beyblade, for stitching its track and for the team assignment of the parent
+        beyblade_tracks = list(frame_tracks['Beyblade'].values())
+        if beyblade_tracks:
+            colors = team_assigner.get_beyblade_colors(frame, [track['bbox'] for track in beyblade_tracks])
+            for track, color in zip(beyblade_tracks, colors):
+                track['beyblade_color'] = color
+        for object, track in frame_tracks.items():
+            tracks[object].append(track)
+        prev_gray = frame_gray
+
+    if len(tracks[OBJECT_CLASSES[0]]) != stop - start:
+        raise RuntimeError(f'Segment {start}-{stop} of {input_video} decoded {len(tracks[OBJECT_CLASSES[0]])} of {stop - start} frames')
+    records = TrackStore.from_tracks(tracks, first_frame=start).records
+    return records, round(time.perf_counter() - start_time, 3)
+
+
+def run_sharded(input_video, model_path, output_dir='output', workers=2, threads_per_worker=1, shards=None, overlap=30, round_gap=5.0,
+                assign_frame_num=240, flow_mode='dense', battle_log_path=None, pipelined=False, color_method='fast', backend='pytorch',
+                imgsz=640, int8=False, calibration_videos=None, arena_path=None, arena_roi=False, num_teams=2, collision_debounce=0,
+                frame_store_dir=None, highlights=False):
+    # Analyze one long video across a process pool: every worker tracks an overlapping segment, the
+    # segment tracks are stitched into one TrackStore and the battle pass runs over all of it, so the
+    # results are those of a single-process run. Recordings with several battles are split into rounds
+    from main import get_arena, assign_track_store_teams, get_battle_results, save_battle_results, save_highlights
+    from utils import FrameStore, FrameIndex
+    from trackers import get_segments, stitch_segments
+    from assigner import Assigner
+    from battle import Battle, RotationDetector, BattleFeatures, HighlightRenderer, get_active_counts, get_round_ranges
+    import pandas as pd
+
+    start_time = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    battle_log_path = battle_log_path or os.path.join(output_dir, 'battle_log.csv')
+
+    # One indexing pass up front, so every segment can seek to its first frame (or map it from the
+    # frame store, whose gray plane is built here once instead of in every worker)
+    frame_store = FrameStore.from_video(input_video, frame_store_dir) if frame_store_dir else None
+    if frame_store is not None:
+        frame_index = frame_store.get_frame_index()
+        frame_store.get_gray()
+    else:
+        frame_index = FrameIndex.from_video(input_video)
+    frame_index.save(os.path.join(output_dir, 'frame_index.npz'))
+    num_frames = len(frame_index)
+    arena = get_arena(arena_path, output_dir)
+    segments = get_segments(num_frames, shards or workers, overlap)
+
+    # Segments are tracked without the detection cache, its chunks belong to whole-video runs. INT8
+    # exports are calibrated on the input video unless other videos are given
+    options = {'cache_dir': None, 'pipelined': pipelined, 'backend': backend, 'imgsz': imgsz, 'int8': int8,
+               'calibration_videos': calibration_videos, 'flow_mode': flow_mode, 'color_method': color_method, 'arena_roi': arena_roi}
+    tournament.export_worker_model(model_path, options, [input_video])
+    with ProcessPoolExecutor(max_workers=min(workers, len(segments)),
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=tournament.init_worker,
+                             initargs=(model_path, options, threads_per_worker)) as executor:
+        segment_results = list(executor.map(analyze_segment, repeat(input_video), segments,
+                                            repeat(frame_store or frame_index), repeat(arena)))
+    segment_time = time.perf_counter() - start_time
+
+    # Continue the tracks across the segment borders
+    track_store, stitch_stats = stitch_segments([records for records, _ in segment_results], segments, num_frames)
+
+    # Team colors from the measured colors of one frame, then teams in frame order like a single-process run
+    team_assigner = Assigner(color_method, num_teams=num_teams)
+    assign_frame_num = min(assign_frame_num, num_frames - 1)
+    team_assigner.fit_team_colors(track_store.records['beyblade_color'][track_store.get_frame_rows(assign_frame_num, 'Beyblade')])
+    assign_track_store_teams(team_assigner, track_store, None)
+
+    # Battle pass over the merged tracks
+    battle = Battle(RotationDetector(mode=flow_mode), arena=arena, collision_debounce=collision_debounce, num_teams=num_teams)
+    battle_stat = battle.get_track_store_stat(track_store, battle_log_path)
+    features = BattleFeatures.from_track_store(track_store)
+    features.save(os.path.join(output_dir, 'features.npz'))
+    battle_results = save_battle_results(battle, os.path.join(output_dir, 'battle_results.csv'))
+
+    # One result row per round, replayed from the features of its frames
+    round_ranges = get_round_ranges(get_active_counts(battle, features), round_gap * battle.fps)
+    round_results = []
+    for round_num, (start, stop) in enumerate(round_ranges, start=1):
+        round_battle = Battle(RotationDetector(mode=flow_mode), arena=arena, collision_debounce=collision_debounce, num_teams=num_teams)
+        round_battle.get_feature_stat(features.get_range(start, stop))
+        results = get_battle_results(round_battle)
+        results.insert(0, 'stop_frame', stop)
+        results.insert(0, 'start_frame', start)
+        results.insert(0, 'round', round_num)
+        round_results.append(results)
+    pd.concat(round_results, ignore_index=True).to_csv(os.path.join(output_dir, 'round_results.csv'), index=False)
+
+    # The full annotated video is not rendered, the winner crop is cut from its seeked frame
+    if highlights:
+        save_highlights(input_video, output_dir, frame_index, battle, features, battle_stat)
+    renderer = HighlightRenderer(input_video, frame_index, battle, features, battle_stat)
+    renderer.save_winner_img(os.path.join(output_dir, 'winner.jpg'))
+
+    shard_report = {
+        'workers': workers,
+        'segments': [{'start': start, 'own_start': own_start, 'stop': stop, 'run_time': run_time}
+                     for (start, own_start, stop), (_, run_time) in zip(segments, segment_results)],
+        'segment_time': round(segment_time, 3),
+        'rounds': len(round_ranges),
+        'run_time': round(time.perf_counter() - start_time, 3)
+    }
+    shard_report.update(stitch_stats)
+    with open(os.path.join(output_dir, 'shard_report.json'), 'w') as f:
+        json.dump(shard_report, f, indent=2)
+    print(f"Analyzed {num_frames} frames in {len(segments)} segments on {workers} workers in {shard_report['run_time']:.2f} s, "
+          f"{len(round_ranges)} rounds")
+    return battle_results
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments for the video, model and pool settings
+    parser = argparse.ArgumentParser(description="Analyze one long beyblade video (e.g. a whole session) across worker processes.")
+    parser.add_argument("--input_video", type=str, required=True, help="Path to the input video file.")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the trained YOLO model file.")
+    parser.add_argument("--output_dir", type=str, default="output", help="Directory for the battle log, results, round results and winner image.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes.")
+    parser.add_argument("--threads_per_worker", type=int, default=1, help="OpenCV and torch threads per worker process.")
+    parser.add_argument("--shards", type=int, default=None, help="Number of segments the video is split into, one per worker by default.")
+    parser.add_argument("--overlap", type=int, default=30, help="Frames every segment is tracked ahead of its own frames, used to stitch its tracks to the previous segment.")
+    parser.add_argument("--round_gap", type=float, default=5.0, help="Seconds without spinning beyblades in the arena that separate two rounds.")
+    parser.add_argument("--flow_mode", type=str, default="dense", choices=["dense", "roi", "sparse"], help="Optical flow mode for the beyblade rotation check.")
+    parser.add_argument("--battle_log_path", type=str, default=None, help="Path to the battle log file, defaults to battle_log.csv in the output directory.")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap decoding, detection and tracking with an adaptive batch size in every worker.")
+    parser.add_argument("--color_method", type=str, default="fast", choices=["fast", "kmeans"], help="Beyblade color method used for stitching and team assignment.")
+    parser.add_argument("--backend", type=str, default="pytorch", choices=["pytorch", "onnx", "openvino", "torchscript"], help="Inference backend of the detector, exported from the model file once before the workers start.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size of the detector (and of its exports).")
+    parser.add_argument("--int8", action="store_true", help="Use an INT8 quantized onnx or openvino export.")
+    parser.add_argument("--calibration_videos", type=str, nargs="+", default=None, help="Videos to sample the INT8 calibration frames from, the input video by default.")
+    parser.add_argument("--arena_path", type=str, default=None, help="JSON file with the battle polygon of the camera setup, defaults to the original 1920x1080 setup.")
+    parser.add_argument("--arena_roi", action="store_true", help="Only detect on the crop around the battle polygon.")
+    parser.add_argument("--num_teams", type=int, default=2, help="Number of beyblades (teams) in every battle.")
+    parser.add_argument("--collision_debounce", type=int, default=0, help="Frames a pair of beyblades has to be apart before their next contact counts as a new collision.")
+    parser.add_argument("--frame_store_dir", type=str, default=None, help="Decode the video once into a memory-mapped frame store in this directory, shared by the workers.")
+    parser.add_argument("--highlights", action="store_true", help="Also save highlight clips of the battle start, every collision and the battle end.")
+
+    # Run the sharded analysis with provided arguments
+    args = parser.parse_args()
+
+    battle_results = run_sharded(args.input_video, args.model_path,
+                                 output_dir=args.output_dir,
+                                 workers=args.workers,
+                                 threads_per_worker=args.threads_per_worker,
+                                 shards=args.shards,
+                                 overlap=args.overlap,
+                                 round_gap=args.round_gap,
+                                 flow_mode=args.flow_mode,
+                                 battle_log_path=args.battle_log_path,
+                                 pipelined=args.pipelined,
+                                 color_method=args.color_method,
+                                 backend=args.backend,
+                                 imgsz=args.imgsz,
+                                 int8=args.int8,
+                                 calibration_videos=args.calibration_videos,
+                                 arena_path=args.arena_path,
+                                 arena_roi=args.arena_roi,
+                                 num_teams=args.num_teams,
+                                 collision_debounce=args.collision_debounce,
+                                 frame_store_dir=args.frame_store_dir,
+                                 highlights=args.highlights)
+    print(battle_results)
@@ -0,0 +1,57 @@
+from battle import BattleFeatures, get_param_grid, sweep, score_sweep
+import argparse
+import os
+import time
+import pandas as pd
+
+
+def get_feature_paths(paths):
+    # features.npz files given directly or found in directories (e.g. a tournament output directory)
+    feature_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                feature_paths += [os.path.join(root, name) for name in sorted(names) if name == 'features.npz']
+        else:
+            feature_paths.append(path)
+    return feature_paths
+
+
+def get_match_name(feature_path):
+    # Matches are named after the output directory holding their features.npz
+    if os.path.basename(feature_path) == 'features.npz':
+        return os.path.basename(os.path.dirname(os.path.abspath(feature_path)))
+    return os.path.splitext(os.path.basename(feature_path))[0]
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments for the cached features and the parameter values to sweep
+    parser = argparse.ArgumentParser(description="Re-run the battle referee logic on cached features for many parameter combinations.")
+    parser.add_argument("--features", type=str, nargs="+", required=True, help="features.npz files, or directories searched for them.")
+    parser.add_argument("--labels", type=str, default=None, help="CSV with the true match, winner and optionally battle_time of labelled matches.")
+    parser.add_argument("--rotation_thresholds", type=float, nargs="+", default=[1.0], help="Flow magnitudes above which a beyblade counts as rotating.")
+    parser.add_argument("--taken_ious", type=float, nargs="+", default=[0.0], help="IoUs with the hand or launcher above which a beyblade counts as taken.")
+    parser.add_argument("--collision_ious", type=float, nargs="+", default=[0.0], help="IoUs of two beyblades above which they count as colliding.")
+    parser.add_argument("--collision_debounces", type=int, nargs="+", default=[0], help="Frames a pair of beyblades has to be apart before their next contact counts as a new collision.")
+    parser.add_argument("--fps", type=float, nargs="+", default=[30], help="Frame rates used to convert frame numbers to time.")
+    parser.add_argument("--output_dir", type=str, default="output", help="Directory for sweep_results.csv and sweep_scores.csv.")
+
+    # Run the sweep with provided arguments
+    args = parser.parse_args()
+
+    feature_paths = get_feature_paths(args.features)
+    features_list = [BattleFeatures.load(path) for path in feature_paths]
+    params = get_param_grid(args.rotation_thresholds, args.taken_ious, args.collision_ious, args.collision_debounces, args.fps)
+
+    start = time.perf_counter()
+    results = sweep(features_list, params, [get_match_name(path) for path in feature_paths])
+    print(f'Swept {len(features_list)} matches x {len(params["fps"])} combinations in {time.perf_counter() - start:.3f} s')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results.to_csv(os.path.join(args.output_dir, 'sweep_results.csv'), index=False)
+    if args.labels is not None:
+        scores = score_sweep(results, pd.read_csv(args.labels))
+        scores.to_csv(os.path.join(args.output_dir, 'sweep_scores.csv'), index=False)
+        print(scores.head(10))
+    else:
+        print(results)
@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def model_path(tmp_path_factory):
+    # Untrained YOLO weights, enough to load and export a model without downloading anything
+    pytest.importorskip('ultralytics')
+    from ultralytics import YOLO
+    model_path = str(tmp_path_factory.mktemp('model') / 'model.pt')
+    YOLO('yolov8n.yaml').save(model_path)
+    return model_path
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from battle.interactions import InteractionEngine, get_collisions, get_pair_keys
+
+
+def test_pair_keys_ignore_order():
+    np.testing.assert_array_equal(get_pair_keys(np.array([1, 5]), np.array([5, 1])), get_pair_keys(np.array([5, 1]), np.array([1, 5])))
+    assert get_pair_keys(np.array([1]), np.array([2]))[0] != get_pair_keys(np.array([1]), np.array([3]))[0]
+
+
+@pytest.mark.parametrize('debounce, expected', [
+    (0, [True, True, True, True, True]),
+    (1, [True, False, False, True, True]),
+    (5, [True, False, False, False, True])
+])
+def test_collisions_debounce(debounce, expected):
+    # One pair in contact at frames 0-2, apart for one frame, again at 4 and after a gap of 5 at 10
+    frames = np.array([0, 1, 2, 4, 10])
+    pair_keys = get_pair_keys(np.full(5, 1), np.full(5, 2))
+    np.testing.assert_array_equal(get_collisions(frames, pair_keys, debounce), expected)
+
+
+def test_collisions_debounce_per_pair_in_any_order():
+    # Contacts of three pairs, interleaved and not sorted by frame. Pair (1, 2) touches at frames
+    # 0, 2, 3 and 6, so with debounce=2 only 0 and 6 count
+    frames = np.array([3, 0, 1, 0, 6, 2])
+    pair_keys = get_pair_keys(np.array([1, 1, 3, 3, 2, 1]), np.array([2, 2, 1, 2, 1, 2]))
+    np.testing.assert_array_equal(get_collisions(frames, pair_keys, 2), [False, True, True, True, True, False])
+
+
+def get_contact_bboxes(num_frames, seed):
+    # Three beyblades moving at random around a small area, so pairs touch, separate and touch again
+    rng = np.random.default_rng(seed)
+    centers = np.cumsum(rng.normal(0, 6, (num_frames, 3, 2)), axis=0) + 50
+    return np.concatenate([centers - 10, centers + 10], axis=-1)
+
+
+@pytest.mark.parametrize('debounce', [0, 3, 10])
+def test_stream_collisions_match_batch(debounce):
+    num_frames, track_ids = 200, [4, 7, 9]
+    bboxes = get_contact_bboxes(num_frames, seed=debounce)
+
+    stream = InteractionEngine(collision_iou=0.05, collision_debounce=debounce)
+    stream_collisions = [stream.update_collisions(frame_num, track_ids, bboxes[frame_num]) for frame_num in range(num_frames)]
+
+    contacts = [(frame_num, *pair) for frame_num in range(num_frames) for pair in stream.get_contacts(track_ids, bboxes[frame_num])]
+    frame_nums, pair_track_ids, other_track_ids = map(np.array, zip(*contacts))
+    batch = InteractionEngine(collision_iou=0.05, collision_debounce=debounce)
+    batch_collisions = batch.count_collisions(frame_nums, pair_track_ids, other_track_ids, num_frames)
+
+    assert sum(stream_collisions) > 0
+    np.testing.assert_array_equal(stream_collisions, batch_collisions)
+    assert stream.pair_collisions == batch.pair_collisions
@@ -0,0 +1,32 @@
+import numpy as np
+from battle import get_round_ranges
+
+
+def test_battles_split_at_middle_of_idle_frames():
+    active_counts = np.zeros(100, dtype=int)
+    active_counts[10:30] = 2
+    active_counts[60:80] = 2
+    assert get_round_ranges(active_counts, min_gap=5) == [(0, 45), (45, 100)]
+
+
+def test_short_gap_stays_in_one_round():
+    active_counts = np.zeros(100, dtype=int)
+    active_counts[10:30] = 2
+    active_counts[33:50] = 1
+    assert get_round_ranges(active_counts, min_gap=5) == [(0, 100)]
+
+
+def test_single_spin_is_idle_time():
+    active_counts = np.zeros(120, dtype=int)
+    active_counts[5:20] = 1
+    active_counts[40:60] = 2
+    active_counts[90:110] = 2
+    # The test spin at 5-19 is not a round, so the first round starts at frame 0
+    assert get_round_ranges(active_counts, min_gap=5) == [(0, 75), (75, 120)]
+
+
+def test_no_battle_is_one_round():
+    assert get_round_ranges(np.zeros(50, dtype=int), min_gap=5) == [(0, 50)]
+    active_counts = np.zeros(50, dtype=int)
+    active_counts[10:20] = 1
+    assert get_round_ranges(active_counts, min_gap=5) == [(0, 50)]
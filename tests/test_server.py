@@ -0,0 +1,27 @@
+import inspect
+import pytest
+from main import main, main_stream
+from server import JOB_OPTIONS, AnalysisServer
+from benchmarks.synthetic import make_arena_video
+
+pytest.importorskip('sklearn')
+pytest.importorskip('supervision')
+
+
+@pytest.mark.parametrize('stream, run', [(False, main), (True, main_stream)])
+def test_job_options_are_run_parameters(stream, run):
+    assert set(JOB_OPTIONS[stream]) <= set(inspect.signature(run).parameters)
+
+
+@pytest.mark.parametrize('options', [
+    dict(phase_schedule=True),  # main_stream only
+    dict(stream=True, render_workers=2),  # main only
+    dict(profile=True)  # Shared by the whole server
+])
+def test_submit_rejects_options_of_other_mode(model_path, tmp_path, options):
+    input_video = str(tmp_path / 'match.avi')
+    make_arena_video(input_video, 10, 320, 180)
+    server = AnalysisServer(model_path, cache_dir=None, output_dir=str(tmp_path))
+    with pytest.raises(ValueError, match='Unknown'):
+        server.submit(input_video, **options)
+    assert server.jobs == {}
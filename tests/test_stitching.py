@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic import get_synthetic_tracks, StubModel
+from trackers import Tracker, TrackStore, get_segments, stitch_segments
+
+pytest.importorskip('supervision')
+
+NUM_FRAMES = 240
+
+
+def track_frames(tracks, start, stop):
+    # Track the synthetic detections of frames start to stop - 1 with a fresh ByteTrack, like one
+    # shard worker does, and number the records by the frames of the whole video
+    segment_tracks = {object: object_tracks[start:stop] for object, object_tracks in tracks.items()}
+    tracker = Tracker(None, model=StubModel(segment_tracks))
+    frames = [np.zeros((1, 1, 3), dtype=np.uint8)] * (stop - start)
+    tracked = tracker.get_object_tracks(frames)
+    return TrackStore.from_tracks(tracked, first_frame=start).records
+
+
+def get_id_map(records, other_records):
+    # {track id: other track id} of records with the same frame, class and bbox; fails when an id
+    # maps onto two ids or the records differ
+    assert len(records) == len(other_records)
+    key = lambda records: np.lexsort((records['bbox'][:, 1], records['bbox'][:, 0], records['cls'], records['frame_num']))
+    records, other_records = records[key(records)], other_records[key(other_records)]
+    np.testing.assert_array_equal(records['frame_num'], other_records['frame_num'])
+    np.testing.assert_array_equal(records['cls'], other_records['cls'])
+    np.testing.assert_allclose(records['bbox'], other_records['bbox'])
+    id_map = {}
+    for cls, track_id, other_track_id in zip(records['cls'].tolist(), records['track_id'].tolist(), other_records['track_id'].tolist()):
+        assert id_map.setdefault((cls, track_id), other_track_id) == other_track_id
+    return id_map
+
+
+@pytest.mark.parametrize('num_segments', [2, 3])
+def test_stitched_segments_match_single_track_store(num_segments):
+    tracks = get_synthetic_tracks(NUM_FRAMES, 960, 540)
+    reference = TrackStore(track_frames(tracks, 0, NUM_FRAMES), NUM_FRAMES)
+
+    segments = get_segments(NUM_FRAMES, num_segments, overlap=30)
+    track_store, stats = stitch_segments([track_frames(tracks, start, stop) for start, _, stop in segments], segments, NUM_FRAMES)
+
+    assert track_store.num_frames == NUM_FRAMES
+    id_map = get_id_map(reference.records, track_store.records)
+    # Every beyblade keeps one id across the segment borders, and no two share one
+    beyblade_ids = {track_id: stitched_id for (cls, track_id), stitched_id in id_map.items() if cls == 0}
+    assert len(set(beyblade_ids.values())) == len(beyblade_ids) == 2
+    assert stats['continued_tracks'] > 0
+
@@ -0,0 +1,54 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import get_synthetic_tracks, get_arena_vertices
+from battle import Arena, Battle, BattleFeatures, RotationDetector, get_param_grid, sweep
+from trackers import TrackStore
+
+WIDTH, HEIGHT = 960, 540
+
+ROTATION_THRESHOLDS = (0.5, 1.5)
+TAKEN_IOUS = (0.0, 0.2)
+COLLISION_IOUS = (0.0, 0.1)
+COLLISION_DEBOUNCES = (0, 10)
+FPS_VALUES = (25, 30)
+
+
+def get_features(num_frames, seed):
+    # BattleFeatures of the synthetic arena tracks, with random movement so the rotation threshold
+    # decides which beyblades are active
+    track_store = TrackStore.from_tracks(get_synthetic_tracks(num_frames, WIDTH, HEIGHT, seed=seed))
+    track_store.add_positions()
+    beyblades = track_store.get_class_mask('Beyblade')
+    records = track_store.records
+    records['team'][beyblades] = records['track_id'][beyblades]
+    records['movement'][beyblades] = np.random.default_rng(seed).uniform(0, 3, beyblades.sum())
+    records['inside_polygon'][beyblades] = Arena(get_arena_vertices(WIDTH, HEIGHT)).contains(records['position'][beyblades])
+    return BattleFeatures.from_track_store(track_store)
+
+
+def replay(features, rotation_threshold, taken_iou, collision_iou, collision_debounce, fps):
+    battle = Battle(RotationDetector(threshold=rotation_threshold), fps=fps, arena=Arena(get_arena_vertices(WIDTH, HEIGHT)),
+                    taken_iou=taken_iou, collision_iou=collision_iou, collision_debounce=collision_debounce)
+    battle.get_feature_stat(features)
+    return battle
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_sweep_matches_battle_replay(seed):
+    features_list = [get_features(150, seed), get_features(120, seed + 10)]
+    params = get_param_grid(ROTATION_THRESHOLDS, TAKEN_IOUS, COLLISION_IOUS, COLLISION_DEBOUNCES, FPS_VALUES)
+    results = sweep(features_list, params)
+    assert len(results) == len(features_list) * len(params['fps'])
+
+    combinations = list(itertools.product(ROTATION_THRESHOLDS, TAKEN_IOUS, COLLISION_IOUS, COLLISION_DEBOUNCES, FPS_VALUES))
+    for row, (match_num, combination) in zip(results.itertuples(), itertools.product(range(len(features_list)), combinations)):
+        battle = replay(features_list[match_num], *combination)
+        assert row.match == match_num
+        assert row.battle_time == pytest.approx(round(battle.battle_time, 2))
+        assert (None if pd.isna(row.winner) else row.winner) == battle.winner
+        for team, time in battle.beyblade_time.items():
+            assert getattr(row, f'beyblade{team}_time') == pytest.approx(round(time, 2))
+        assert row.total_collision == battle.total_collision
+        assert row.winner_frame_num == (-1 if battle.winner_frame_num is None else battle.winner_frame_num)
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import tournament
+from benchmarks.synthetic import make_arena_video
+from trackers.backends import get_export_path
+
+pytest.importorskip('ultralytics')
+pytest.importorskip('onnxruntime')
+
+
+def get_worker_model():
+    # Path of the export the worker's tracker loaded, and the calibration videos it was given
+    return tournament.worker_tracker.get_model().ckpt_path, tournament.worker_tracker.calibration_videos
+
+
+@pytest.mark.parametrize('options', [
+    dict(cache_dir=None, pipelined=False),  # Tournament workers, calibrated on the tournament videos
+    dict(cache_dir=None, pipelined=False, calibration_videos=None)  # Shard workers, calibrated on the input video
+])
+def test_int8_worker_loads_parent_export(model_path, tmp_path, options):
+    videos = [str(tmp_path / 'match.avi')]
+    make_arena_video(videos[0], 10, 320, 180)
+    options = dict(options, cache_dir=str(tmp_path / 'cache'), backend='onnx', imgsz=64, int8=True)
+    tournament.export_worker_model(model_path, options, videos)
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=tournament.init_worker, initargs=(model_path, options, 1)) as executor:
+        worker_export_path, calibration_videos = executor.submit(get_worker_model).result()
+
+    assert calibration_videos == videos
+    assert os.path.samefile(worker_export_path, get_export_path(model_path, 'onnx', 64, True, videos))
@@ -0,0 +1,172 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# Per-worker state, set once by init_worker
+worker_tracker = None
+worker_options = None
+
+
+def get_videos(input_dir=None, manifest=None):
+    # Collect the match videos from a directory or from a manifest with one video path per line
+    if manifest is not None:
+        base_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            lines = [line.strip() for line in f]
+        return [line if os.path.isabs(line) else os.path.join(base_dir, line)
+                for line in lines if line and not line.startswith('#')]
+    return sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir)
+                  if name.lower().endswith(VIDEO_EXTENSIONS))
+
+
+def get_match_names(videos):
+    # Unique output directory name per video, based on the file name
+    match_names = []
+    for video in videos:
+        name = os.path.splitext(os.path.basename(video))[0]
+        match_name, i = name, 1
+        while match_name in match_names:
+            i += 1
+            match_name = f'{name}_{i}'
+        match_names.append(match_name)
+    return match_names
+
+
+def init_worker(model_path, options, threads_per_worker):
+    # Limit the threads of every library before the heavy imports, then load the model once per worker
+    global worker_tracker, worker_options
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = str(threads_per_worker)
+
+    import cv2
+    cv2.setNumThreads(threads_per_worker)
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+    from main import get_tracker
+    worker_tracker = get_tracker(None, model_path, options['cache_dir'], options['pipelined'],
+                                 backend=options['backend'], imgsz=options['imgsz'], int8=options['int8'],
+                                 calibration_videos=options.get('calibration_videos'),
+                                 cache_max_size_mb=options.get('cache_max_size_mb'), cache_max_age_days=options.get('cache_max_age_days'))
+    worker_tracker.get_model()
+    worker_options = options
+
+
+def export_worker_model(model_path, options, videos):
+    # Export once up front so the workers only load the cached export instead of racing to write it.
+    # INT8 exports are calibrated on the videos unless the options give others, and the workers get
+    # the same list in the options, as it is part of the export path and the detection cache key
+    if options['int8']:
+        options['calibration_videos'] = options.get('calibration_videos') or videos
+    if options['backend'] != 'pytorch':
+        from trackers import export_model
+        export_model(model_path, options['backend'], options['imgsz'], options['int8'], options.get('calibration_videos'))
+
+
+def analyze_match(input_video, output_dir):
+    # Analyze one match in a worker, reusing the worker's loaded model
+    from main import main, main_stream
+    options = dict(worker_options)
+    run = main_stream if options.pop('stream') else main
+    battle_results = run(input_video, worker_tracker.model_path, output_dir=output_dir, tracker=worker_tracker, **options)
+    return battle_results
+
+
+def run_tournament(videos, model_path, output_dir='output/tournament', workers=2, threads_per_worker=1, **options):
+    # Analyze every match across a process pool and merge the per-match results into one table
+    import pandas as pd
+
+    os.makedirs(output_dir, exist_ok=True)
+    options.setdefault('stream', False)
+    options.setdefault('cache_dir', 'stubs/detection_cache')
+    options.setdefault('pipelined', False)
+    options.setdefault('backend', 'pytorch')
+    options.setdefault('imgsz', 640)
+    options.setdefault('int8', False)
+
+    export_worker_model(model_path, options, videos)
+
+    match_results = []
+    # Spawned workers start clean, so the thread limits apply before torch and OpenCV are imported
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker,
+                             initargs=(model_path, options, threads_per_worker)) as executor:
+        futures = {}
+        for video, match_name in zip(videos, get_match_names(videos)):
+            match_dir = os.path.join(output_dir, match_name)
+            futures[executor.submit(analyze_match, video, match_dir)] = (match_name, video)
+
+        for future in as_completed(futures):
+            match_name, video = futures[future]
+            try:
+                battle_results = future.result()
+            except Exception as e:
+                # One broken match should not cancel the rest of the tournament
+                print(f'Match {match_name} failed: {e}')
+                battle_results = pd.DataFrame([{'error': str(e)}])
+            battle_results.insert(0, 'video', video)
+            battle_results.insert(0, 'match', match_name)
+            match_results.append(battle_results)
+
+    # Merge the per-match battle_results rows into the tournament table
+    tournament_results = pd.concat(match_results, ignore_index=True).sort_values('match', ignore_index=True)
+    tournament_results.to_csv(os.path.join(output_dir, 'tournament_results.csv'), index=False)
+    return tournament_results
+
+
+if __name__ == "__main__":
+    # Parse command-line arguments for the videos, model and pool settings
+    parser = argparse.ArgumentParser(description="Analyze a whole tournament of beyblade battle videos in parallel.")
+    videos_group = parser.add_mutually_exclusive_group(required=True)
+    videos_group.add_argument("--input_dir", type=str, help="Directory containing the match videos.")
+    videos_group.add_argument("--manifest", type=str, help="Text file with one match video path per line.")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the trained YOLO model file.")
+    parser.add_argument("--output_dir", type=str, default="output/tournament", help="Directory for the per-match outputs and the tournament table.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes.")
+    parser.add_argument("--threads_per_worker", type=int, default=1, help="OpenCV and torch threads per worker process.")
+    parser.add_argument("--stream", action="store_true", help="Process every video in a single streaming pass with bounded memory.")
+    parser.add_argument("--cache_dir", type=str, default="stubs/detection_cache", help="Directory of the detection cache, empty to disable it.")
+    parser.add_argument("--cache_max_size", type=float, default=None, help="Megabytes the detection cache may use, least recently used videos are evicted beyond it.")
+    parser.add_argument("--cache_max_age", type=float, default=None, help="Days after their last use that detection cache entries are evicted.")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap decoding, detection and tracking with an adaptive batch size (one detection cache chunk per batch when the cache is on).")
+    parser.add_argument("--flow_mode", type=str, default="dense", choices=["dense", "roi", "sparse"], help="Optical flow mode for the beyblade rotation check.")
+    parser.add_argument("--color_method", type=str, default="fast", choices=["fast", "kmeans"], help="Beyblade color method used for team assignment.")
+    parser.add_argument("--backend", type=str, default="pytorch", choices=["pytorch", "onnx", "openvino", "torchscript"], help="Inference backend of the detector, exported from the model file once before the workers start.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size of the detector (and of its exports).")
+    parser.add_argument("--int8", action="store_true", help="Use an INT8 quantized onnx or openvino export, calibrated on frames of the tournament videos.")
+    parser.add_argument("--arena_path", type=str, default=None, help="JSON file with the battle polygon of the camera setup, defaults to the original 1920x1080 setup.")
+    parser.add_argument("--arena_roi", action="store_true", help="Only detect on the crop around the battle polygon.")
+    parser.add_argument("--frame_store_dir", type=str, default=None, help="Decode every video once into a memory-mapped frame store in this directory and reuse it on reruns.")
+    parser.add_argument("--num_teams", type=int, default=2, help="Number of beyblades (teams) in every battle.")
+    parser.add_argument("--collision_debounce", type=int, default=0, help="Frames a pair of beyblades has to be apart before their next contact counts as a new collision.")
+
+    # Run the tournament with provided arguments
+    args = parser.parse_args()
+
+    videos = get_videos(args.input_dir, args.manifest)
+    tournament_results = run_tournament(videos, args.model_path,
+                                        output_dir=args.output_dir,
+                                        workers=args.workers,
+                                        threads_per_worker=args.threads_per_worker,
+                                        stream=args.stream,
+                                        cache_dir=args.cache_dir,
+                                        cache_max_size_mb=args.cache_max_size, cache_max_age_days=args.cache_max_age,
+                                        pipelined=args.pipelined,
+                                        flow_mode=args.flow_mode,
+                                        color_method=args.color_method,
+                                        backend=args.backend,
+                                        imgsz=args.imgsz,
+                                        int8=args.int8,
+                                        arena_path=args.arena_path,
+                                        arena_roi=args.arena_roi,
+                                        frame_store_dir=args.frame_store_dir,
+                                        num_teams=args.num_teams,
+                                        collision_debounce=args.collision_debounce)
+    print(tournament_results)
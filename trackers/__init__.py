@@ -1 +1,6 @@
-from .tracker import Tracker
\ No newline at end of file
+from .tracker import Tracker
+from .track_store import TrackStore, OBJECT_CLASSES
+from .stitching import get_segments, match_track_ids, stitch_segments
+from .detection_cache import DetectionCache
+from .stride import StrideScheduler, PhaseScheduler, get_drift_report
+from .backends import BACKENDS, load_model, export_model
\ No newline at end of file
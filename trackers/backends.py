@@ -0,0 +1,146 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+import shutil
+from .detection_cache import get_file_hash
+
+# Inference backends a Tracker can run the detector on. Everything except pytorch is an exported
+# copy of the weights, loaded through YOLO so predict() and its results keep the same interface
+BACKENDS = ('pytorch', 'onnx', 'openvino', 'torchscript')
+DYNAMIC_BACKENDS = ('pytorch', 'onnx', 'openvino')  # Backends that predict a whole batch in one call
+
+def get_calibration_hash(calibration_videos, num_frames=100):
+    # Hash of the calibration set: the content of every video and the number of sampled frames
+    sha = hashlib.sha256(str(num_frames).encode())
+    for video_hash in sorted(get_file_hash(video_path) for video_path in calibration_videos):
+        sha.update(video_hash.encode())
+    return sha.hexdigest()
+
+def get_export_path(model_path, backend, imgsz=640, int8=False, calibration_videos=None, num_calibration_frames=100):
+    # Cached export next to the weights, one per weights content, backend, input size and precision
+    # (and calibration set for INT8), so retrained weights at the same path are exported again.
+    # OpenVINO exports are directories that YOLO recognizes by their _openvino_model suffix
+    stem = os.path.splitext(model_path)[0]
+    name = f"{stem}_{get_file_hash(model_path)[:12]}_{imgsz}"
+    if int8:
+        name += f"_int8_{get_calibration_hash(calibration_videos, num_calibration_frames)[:12]}"
+    if backend == 'onnx':
+        return name + '.onnx'
+    if backend == 'openvino':
+        return name + '_openvino_model'
+    if backend == 'torchscript':
+        return name + '.torchscript'
+    raise ValueError(f'Unknown backend {backend}, expected one of {BACKENDS}')
+
+def get_calibration_frames(video_paths, num_frames=100):
+    # Frames sampled evenly across our own videos for INT8 calibration
+    frames = []
+    per_video = max(1, num_frames // len(video_paths))
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for frame_num in np.linspace(0, max(frame_count - 1, 0), per_video).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_num))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+    if not frames:
+        raise ValueError(f'No calibration frames could be read from {video_paths}')
+    return frames
+
+def save_calibration_dataset(frames, dataset_dir, names):
+    # Write calibration frames as a dataset yaml, the format YOLO.export(int8=True) calibrates from
+    images_dir = os.path.join(dataset_dir, 'images')
+    os.makedirs(images_dir, exist_ok=True)
+    for i, frame in enumerate(frames):
+        cv2.imwrite(os.path.join(images_dir, f'{i:05d}.jpg'), frame)
+
+    data_path = os.path.join(dataset_dir, 'data.yaml')
+    with open(data_path, 'w') as f:
+        f.write(f'path: {os.path.abspath(dataset_dir)}\ntrain: images\nval: images\nnames:\n')
+        for class_id, name in sorted(names.items()):
+            f.write(f'  {class_id}: {name}\n')
+    return data_path
+
+def letterbox(frame, imgsz):
+    # Resize keeping the aspect ratio and pad to imgsz x imgsz like the YOLO preprocessing,
+    # returned as a normalized 1x3xHxW RGB tensor
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_height, new_width = round(height * scale), round(width * scale)
+    resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    image = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_height) // 2, (imgsz - new_width) // 2
+    image[top:top+new_height, left:left+new_width] = resized
+    return image[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255
+
+def quantize_onnx(fp32_path, int8_path, frames, imgsz):
+    # Static INT8 post-training quantization of an ONNX export, calibrated on our frames.
+    # onnx and onnxruntime are only needed for this backend
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = ({input_name: letterbox(frame, imgsz)} for frame in frames)
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    quantize_static(fp32_path, int8_path, FrameReader(),
+                    quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8, per_channel=True)
+
+    # Keep the class names and input size that YOLO reads from the export metadata
+    model = onnx.load(int8_path)
+    del model.metadata_props[:]
+    model.metadata_props.extend(onnx.load(fp32_path).metadata_props)
+    onnx.save(model, int8_path)
+
+def export_model(model_path, backend, imgsz=640, int8=False, calibration_videos=None, num_calibration_frames=100):
+    # Export the weights to a backend once and reuse the cached export afterwards
+    if int8 and backend == 'torchscript':
+        raise ValueError('INT8 quantization is available for the onnx and openvino backends')
+    if int8 and not calibration_videos:
+        raise ValueError('INT8 quantization needs calibration_videos to sample frames from')
+
+    export_path = get_export_path(model_path, backend, imgsz, int8, calibration_videos, num_calibration_frames)
+    if os.path.exists(export_path):
+        return export_path
+
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    if backend == 'onnx' and int8:
+        # Quantize the cached FP32 export
+        fp32_path = export_model(model_path, 'onnx', imgsz)
+        quantize_onnx(fp32_path, export_path, get_calibration_frames(calibration_videos, num_calibration_frames), imgsz)
+        return export_path
+
+    data_path = None
+    if int8:
+        # OpenVINO calibrates through YOLO.export, which reads the frames from a dataset yaml
+        dataset_dir = export_path + '_calibration'
+        data_path = save_calibration_dataset(get_calibration_frames(calibration_videos, num_calibration_frames), dataset_dir, model.names)
+
+    # The tracker predicts batches of any size, so onnx and openvino get a dynamic batch axis.
+    # TorchScript traces a static batch 1 input and is predicted frame by frame instead
+    exported_path = model.export(format=backend, imgsz=imgsz, int8=int8, data=data_path, dynamic=backend in DYNAMIC_BACKENDS)
+    shutil.move(str(exported_path), export_path)
+    if data_path is not None:
+        shutil.rmtree(os.path.dirname(data_path), ignore_errors=True)
+    return export_path
+
+def load_model(model_path, backend='pytorch', imgsz=640, int8=False, calibration_videos=None):
+    # YOLO model on the chosen backend, exporting the weights on first use. ultralytics (and torch)
+    # are imported here rather than with the package, so runs that never detect do not load them
+    from ultralytics import YOLO
+    if backend == 'pytorch':
+        if int8:
+            raise ValueError('INT8 quantization is available for the onnx and openvino backends')
+        return YOLO(model_path)
+    return YOLO(export_model(model_path, backend, imgsz, int8, calibration_videos), task='detect')
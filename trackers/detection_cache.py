@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+# Raw per-frame detections, stored before tracking so ByteTrack can be replayed from the cache
+DETECTION_DTYPE = np.dtype([
+    ('frame_num', np.int32),
+    ('xyxy', np.float32, 4),
+    ('confidence', np.float32),
+    ('class_id', np.int32)
+])
+
+FILE_HASHES = {}  # Hashes of already hashed files, keyed by (path, size, mtime)
+
+def get_file_hash(path):
+    # SHA-256 of a file's content, read in blocks and hashed once per process unless the file changes
+    stat = os.stat(path)
+    file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if file_id not in FILE_HASHES:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        FILE_HASHES[file_id] = sha.hexdigest()
+    return FILE_HASHES[file_id]
+
+class DetectionCache:
+    def __init__(self, cache_dir='stubs/detection_cache', chunk_size=50, max_size=None, max_age=None):
+        # Detections are keyed by video content, model weights and inference parameters and
+        # stored in chunks of chunk_size frames, so an interrupted run resumes at the last chunk
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size  # Maximum total cache size in bytes
+        self.max_age = max_age  # Maximum time in seconds since an entry was last used
+        self.hits = 0  # Chunks loaded from the cache
+        self.misses = 0  # Chunks that had to be detected
+
+    def get_key(self, video_path, model_path, **params):
+        # Cache key from the video content hash, the model weights hash and the inference parameters
+        key_data = {
+            'video': get_file_hash(video_path),
+            'model': get_file_hash(model_path),
+            'chunk_size': self.chunk_size,
+            'params': params
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()[:32]
+
+    def get_entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get_chunk_path(self, key, chunk_num):
+        return os.path.join(self.get_entry_dir(key), f'chunk_{chunk_num:06d}.npy')
+
+    def load_chunk(self, key, chunk_num):
+        # Memory-map a completed chunk, or return None if it has not been detected yet
+        chunk_path = self.get_chunk_path(key, chunk_num)
+        if not os.path.exists(chunk_path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.load(chunk_path, mmap_mode='r')
+
+    def save_chunk(self, key, chunk_num, records):
+        # Write to a temporary file first so a crash never leaves a half-written chunk behind
+        entry_dir = self.get_entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        chunk_path = self.get_chunk_path(key, chunk_num)
+        tmp_path = chunk_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, records)
+        os.replace(tmp_path, chunk_path)
+
+    def load_names(self, key):
+        # Class id -> name map of the model that detected an entry, None if it was not saved
+        names_path = os.path.join(self.get_entry_dir(key), 'names.json')
+        if not os.path.exists(names_path):
+            return None
+        with open(names_path) as f:
+            return {int(class_id): name for class_id, name in json.load(f).items()}
+
+    def save_names(self, key, names):
+        # Keep the class names with the detections, so a fully cached run never has to load the model
+        entry_dir = self.get_entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, 'names.json'), 'w') as f:
+            json.dump(names, f)
+
+    def touch(self, key):
+        # Record the last use of an entry for age-based eviction
+        entry_dir = self.get_entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, 'last_used'), 'w') as f:
+            f.write(str(time.time()))
+
+    def get_chunk(self, key, chunk_num, frames_chunk, detect_chunk):
+        # Records of one chunk, loaded from the cache or detected and saved.
+        # detect_chunk(frames_chunk, start_frame) returns the DETECTION_DTYPE records of a chunk
+        records = self.load_chunk(key, chunk_num)
+        if records is None:
+            records = detect_chunk(frames_chunk, chunk_num * self.chunk_size)
+            self.save_chunk(key, chunk_num, records)
+        return records
+
+    def iter_chunks(self, key, frames_chunks, detect_chunk):
+        # Yield (frames_chunk, records) for consecutive chunks, detecting only the missing ones
+        return self.iter_entry(key, ((frames_chunk, self.get_chunk(key, chunk_num, frames_chunk, detect_chunk))
+                                     for chunk_num, frames_chunk in enumerate(frames_chunks)))
+
+    def iter_entry(self, key, chunks):
+        # Pass the (frames_chunk, records) pairs of an entry through, recording its use before
+        # and evicting old entries once all of them were read
+        self.touch(key)
+        yield from chunks
+        self.evict()
+
+    def get_entries(self):
+        # (key, size in bytes, last use time) of every cache entry
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.get_entry_dir(key)
+            if not os.path.isdir(entry_dir):
+                continue
+            files = [os.path.join(entry_dir, name) for name in os.listdir(entry_dir)]
+            size = sum(os.path.getsize(path) for path in files)
+            last_used = max([os.path.getmtime(path) for path in files], default=os.path.getmtime(entry_dir))
+            entries.append((key, size, last_used))
+        return entries
+
+    def evict(self):
+        # Remove entries older than max_age, then the least recently used until under max_size
+        entries = sorted(self.get_entries(), key=lambda entry: entry[2])
+        now = time.time()
+        if self.max_age is not None:
+            for key, size, last_used in [entry for entry in entries if now - entry[2] > self.max_age]:
+                shutil.rmtree(self.get_entry_dir(key), ignore_errors=True)
+                entries.remove((key, size, last_used))
+        if self.max_size is not None:
+            total_size = sum(entry[1] for entry in entries)
+            while entries and total_size > self.max_size:
+                key, size, _ = entries.pop(0)
+                shutil.rmtree(self.get_entry_dir(key), ignore_errors=True)
+                total_size -= size
+
+    def get_stats(self):
+        # Hit/miss counters of the chunks requested so far
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0
+        }
@@ -0,0 +1,160 @@
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+_END = object()  # Marks the end of a stream between pipeline stages
+
+def get_available_memory():
+    # Available system memory in bytes, psutil is used when installed
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+class BatchSizeController:
+    def __init__(self, batch_size=20, min_batch_size=1, max_batch_size=64):
+        # Hill-climbs the inference batch size towards the highest measured frames/sec
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.direction = 1  # Whether the batch size is currently growing or shrinking
+        self.last_fps = None
+        self.history = []  # (batch_size, frames/sec) of every full batch
+
+    def update(self, num_frames, elapsed, memory_batch_size):
+        # Only full batches are comparable, the last partial batch of a stream is ignored
+        if num_frames == self.batch_size and elapsed > 0:
+            fps = num_frames / elapsed
+            self.history.append((num_frames, fps))
+            if self.last_fps is not None and fps < self.last_fps:
+                self.direction = -self.direction
+            self.last_fps = fps
+            step = max(1, self.batch_size // 4)
+            self.batch_size += self.direction * step
+
+        # Never exceed what fits in the memory budget
+        upper = max(self.min_batch_size, min(self.max_batch_size, memory_batch_size))
+        self.batch_size = int(np.clip(self.batch_size, self.min_batch_size, upper))
+        return self.batch_size
+
+class DetectionPipeline:
+    def __init__(self, detect_batch, batch_size=20, min_batch_size=1, max_batch_size=64, queue_size=64, memory_fraction=0.25):
+        # detect_batch(frames, start_frame) returns the detection records of a batch of frames.
+        # Decoding, inference and the consumer (tracking) run concurrently, linked by bounded queues
+        self.detect_batch = detect_batch
+        self.controller = BatchSizeController(batch_size, min_batch_size, max_batch_size)
+        self.queue_size = queue_size  # Decoded frames waiting for inference
+        self.memory_fraction = memory_fraction  # Share of the available memory frames in flight may use
+        self.decode_wait = 0.0  # Time the inference thread waited for decoded frames
+        self.inference_time = 0.0  # Time spent in detect_batch
+        self.num_frames = 0
+
+    def put(self, q, item, stop):
+        # Blocking put that gives up once the pipeline is stopped
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q, stop):
+        # Blocking get that returns the end marker once the pipeline is stopped
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def get_memory_batch_size(self, frame):
+        # Largest batch for which the frames in flight (frame queue, the batch being
+        # detected and the two batches waiting for the consumer) fit in the memory budget
+        memory_frames = get_available_memory() * self.memory_fraction / frame.nbytes
+        return int((memory_frames - self.queue_size) / 3)
+
+    def decode(self, frames, frame_queue, stop):
+        # Decode thread: pull frames from the source iterator into the bounded frame queue
+        try:
+            for frame in frames:
+                if not self.put(frame_queue, frame, stop):
+                    return
+            self.put(frame_queue, _END, stop)
+        except Exception as e:
+            self.put(frame_queue, e, stop)
+
+    def infer(self, frame_queue, result_queue, stop):
+        # Inference thread: group decoded frames into adaptively sized batches and detect them
+        start_frame = 0
+        finished = False
+        try:
+            while not finished and not stop.is_set():
+                batch = []
+                wait_start = time.perf_counter()
+                while len(batch) < self.controller.batch_size:
+                    frame = self.get(frame_queue, stop)
+                    if frame is _END:
+                        finished = True
+                        break
+                    if isinstance(frame, Exception):
+                        raise frame
+                    batch.append(frame)
+                self.decode_wait += time.perf_counter() - wait_start
+                if not batch:
+                    break
+
+                inference_start = time.perf_counter()
+                records = self.detect_batch(batch, start_frame)
+                elapsed = time.perf_counter() - inference_start
+                self.inference_time += elapsed
+
+                self.controller.update(len(batch), elapsed, self.get_memory_batch_size(batch[0]))
+
+                if not self.put(result_queue, (batch, records), stop):
+                    return
+                start_frame += len(batch)
+            self.put(result_queue, _END, stop)
+        except Exception as e:
+            self.put(result_queue, e, stop)
+
+    def iter_batches(self, frames):
+        # Yield (frames_batch, records) in frame order while the next batches are decoded and detected
+        frame_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.decode, args=(frames, frame_queue, stop), daemon=True),
+            threading.Thread(target=self.infer, args=(frame_queue, result_queue, stop), daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                result = result_queue.get()
+                if result is _END:
+                    break
+                if isinstance(result, Exception):
+                    raise result
+                self.num_frames += len(result[0])
+                yield result
+        finally:
+            # Also reached when the consumer stops early, so the worker threads are released
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=1)
+
+    def get_stats(self):
+        # Throughput and batch size history of the run
+        return {
+            'frames': self.num_frames,
+            'inference_time': self.inference_time,
+            'decode_wait': self.decode_wait,
+            'inference_fps': self.num_frames / self.inference_time if self.inference_time else 0.0,
+            'batch_size': self.controller.batch_size,
+            'batch_history': self.controller.history
+        }
@@ -0,0 +1,74 @@
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import get_ious, get_frame_pairs
+from .track_store import TrackStore, OBJECT_CLASSES
+
+def get_segments(num_frames, num_segments, overlap=30):
+    # Split a video into num_segments (start, own_start, stop) frame ranges. Every segment owns the
+    # frames own_start to stop - 1 and is tracked from start, up to overlap frames earlier, so the
+    # tracker is warmed up on frames the previous segment also saw
+    num_segments = max(1, min(num_segments, num_frames))
+    bounds = np.linspace(0, num_frames, num_segments + 1).round().astype(int)
+    return [(max(0, int(own_start) - overlap), int(own_start), int(stop)) for own_start, stop in zip(bounds[:-1], bounds[1:])]
+
+def match_track_ids(records, prev_records, num_frames, min_iou=0.5, max_color_distance=40.0):
+    # {track id: previous track id} of the tracks of one segment that continue tracks of the previous
+    # segment, from the frames both tracked. Pairs of the same frame whose boxes overlap by more than
+    # min_iou (and whose colors, when measured, are close) add their IoU to the score of the id pair,
+    # and the best scoring pairs are matched first, every id at most once
+    rows, prev_rows = get_frame_pairs(records['frame_num'], prev_records['frame_num'], num_frames)
+    same_class = records['cls'][rows] == prev_records['cls'][prev_rows]
+    rows, prev_rows = rows[same_class], prev_rows[same_class]
+    ious = get_ious(records['bbox'][rows], prev_records['bbox'][prev_rows])
+    color_distances = np.linalg.norm(records['beyblade_color'][rows] - prev_records['beyblade_color'][prev_rows], axis=1)
+    match = (ious > min_iou) & (color_distances <= max_color_distance)
+
+    scores = {}
+    for track_id, prev_track_id, iou in zip(records['track_id'][rows[match]].tolist(),
+                                            prev_records['track_id'][prev_rows[match]].tolist(), ious[match].tolist()):
+        scores[track_id, prev_track_id] = scores.get((track_id, prev_track_id), 0.0) + iou
+
+    id_map = {}
+    for (track_id, prev_track_id), _ in sorted(scores.items(), key=lambda item: -item[1]):
+        if track_id not in id_map and prev_track_id not in id_map.values():
+            id_map[track_id] = prev_track_id
+    return id_map
+
+def stitch_segments(segment_records, segments, num_frames, min_iou=0.5, max_color_distance=40.0):
+    # Merge the track records of overlapping segments (as returned by get_segments) into one
+    # TrackStore. Track ids of every segment are mapped onto the ids of the tracks they continue,
+    # tracks that start in the segment get fresh ids, and only the frames a segment owns are kept.
+    # Returns the store and the number of continued and new tracks
+    kept = []
+    prev_records = None
+    next_id = 1
+    stats = {'continued_tracks': 0, 'new_tracks': 0}
+    for records, (start, own_start, stop) in zip(segment_records, segments):
+        records = records[np.argsort(records['frame_num'], kind='stable')]
+        id_maps = {}
+        for cls_id in range(len(OBJECT_CLASSES)):
+            cls_records = records[records['cls'] == cls_id]
+            id_map = {}
+            if prev_records is not None:
+                overlap = (cls_records['frame_num'] >= start) & (cls_records['frame_num'] < own_start)
+                prev_cls_records = prev_records[(prev_records['cls'] == cls_id) & (prev_records['frame_num'] >= start)]
+                id_map = match_track_ids(cls_records[overlap], prev_cls_records, num_frames, min_iou, max_color_distance)
+            owned_ids = np.unique(cls_records['track_id'][cls_records['frame_num'] >= own_start]).tolist()
+            stats['continued_tracks'] += sum(track_id in id_map for track_id in owned_ids)
+            for track_id in owned_ids:
+                if track_id not in id_map:
+                    id_map[track_id] = next_id
+                    next_id += 1
+                    stats['new_tracks'] += 1
+            id_maps[cls_id] = id_map
+
+        records = records[records['frame_num'] >= own_start]
+        for cls_id, id_map in id_maps.items():
+            rows = np.flatnonzero(records['cls'] == cls_id)
+            records['track_id'][rows] = [id_map[track_id] for track_id in records['track_id'][rows].tolist()]
+        kept.append(records)
+        prev_records = records
+
+    records = np.concatenate(kept) if kept else np.zeros(0, dtype=segment_records[0].dtype)
+    return TrackStore(records, num_frames), stats
@@ -0,0 +1,148 @@
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import get_center_of_bbox
+
+def interpolate_bbox(bbox1, bbox2, t):
+    # Linear interpolation between two bboxes, t=0 gives bbox1 and t=1 gives bbox2
+    return [float(v1 + (v2 - v1) * t) for v1, v2 in zip(bbox1, bbox2)]
+
+def interpolate_frame_tracks(prev_tracks, next_tracks, t):
+    # Frame tracks between two detected keyframes. Objects in both keyframes move linearly,
+    # objects in only one of them are held at their bbox for the closer half of the gap
+    frame_tracks = {}
+    for object, prev_track in prev_tracks.items():
+        next_track = next_tracks[object]
+        track = {}
+        for track_id in list(prev_track.keys()) + [track_id for track_id in next_track if track_id not in prev_track]:
+            if track_id in prev_track and track_id in next_track:
+                track[track_id] = {"bbox": interpolate_bbox(prev_track[track_id]['bbox'], next_track[track_id]['bbox'], t)}
+            elif track_id in prev_track and t < 0.5:
+                track[track_id] = {"bbox": list(prev_track[track_id]['bbox'])}
+            elif track_id in next_track and t >= 0.5:
+                track[track_id] = {"bbox": list(next_track[track_id]['bbox'])}
+        frame_tracks[object] = track
+    return frame_tracks
+
+class StrideScheduler:
+    def __init__(self, stride=4, adaptive=False, min_stride=1, max_stride=8, motion_threshold=0.1):
+        # Decides how many frames to skip until the next detection keyframe. In adaptive mode the
+        # stride halves when beyblades move fast or appear/disappear, and grows while the scene is calm
+        self.stride = stride
+        self.adaptive = adaptive
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.motion_threshold = motion_threshold  # Per-frame movement, relative to the bbox size, counted as fast
+        self.keyframes = 0  # Frames that went through the detector
+        self.interpolated = 0  # Frames filled by interpolation
+        self.stopped = False  # Set once no more frames need to be detected
+
+    def get_motion(self, prev_tracks, next_tracks, gap):
+        # Largest per-frame movement of a beyblade between two keyframes, relative to its bbox size,
+        # and whether the set of beyblades changed
+        prev_track, next_track = prev_tracks['Beyblade'], next_tracks['Beyblade']
+        motion = 0.0
+        for track_id in set(prev_track) & set(next_track):
+            prev_bbox, next_bbox = prev_track[track_id]['bbox'], next_track[track_id]['bbox']
+            size = max(1.0, prev_bbox[2] - prev_bbox[0], prev_bbox[3] - prev_bbox[1])
+            distance = np.hypot(*np.subtract(get_center_of_bbox(next_bbox), get_center_of_bbox(prev_bbox)))
+            motion = max(motion, distance / size / gap)
+        return motion, set(prev_track) != set(next_track)
+
+    def update(self, prev_tracks, next_tracks, gap):
+        # Stride until the keyframe after next_tracks
+        if self.adaptive:
+            motion, changed = self.get_motion(prev_tracks, next_tracks, gap)
+            if motion > self.motion_threshold or changed:
+                self.stride = max(self.min_stride, self.stride // 2)
+            else:
+                self.stride = min(self.max_stride, self.stride + 1)
+        return self.stride
+
+    def check_keyframe(self, frame_num, frame_boxes):
+        # Called with the raw detection boxes of every keyframe before it is tracked. True asks the
+        # tracker to detect the frames buffered since the last keyframe instead of interpolating them
+        return False
+
+    def get_stats(self):
+        # Share of frames that went through the detector
+        frames = self.keyframes + self.interpolated
+        return {
+            'keyframes': self.keyframes,
+            'interpolated': self.interpolated,
+            'detected_share': self.keyframes / frames if frames else 0.0,
+            'stride': self.stride
+        }
+
+class PhaseScheduler(StrideScheduler):
+    def __init__(self, coarse_stride=4, confirm_frames=60, is_launching=None, stride=1):
+        # Detection schedule driven by the battle state machine: keyframes every coarse_stride frames
+        # while waiting for the launch, every stride frames during the battle, and nothing once the
+        # winner has held for confirm_frames frames (None keeps detecting until the end).
+        # is_launching(frame_boxes) is a cheap check on the raw detections of a keyframe, so the
+        # battle is detected in full before the battle pass has seen the launch
+        super().__init__(coarse_stride)
+        self.battle_stride = stride
+        self.confirm_frames = confirm_frames
+        self.is_launching = is_launching
+        self.phase = 'coarse'  # 'coarse' before the launch, 'full' after it
+        self.launch_frame = None  # Frame the full detection was switched on at
+        self.decided_frame = None  # First frame of the current winner
+        self.winner = None
+        self.stop_frame = None  # First frame that is skipped
+        self.skipped = 0  # Frames passed on without detection
+
+    def set_full(self, frame_num):
+        if self.phase == 'coarse':
+            self.phase = 'full'
+            self.launch_frame = frame_num
+            self.stride = self.battle_stride
+
+    def check_keyframe(self, frame_num, frame_boxes):
+        # Switch to full detection when a launch is under way on a coarse keyframe, detecting the gap before it
+        if self.phase == 'coarse' and self.is_launching is not None and self.is_launching(frame_boxes):
+            self.set_full(frame_num)
+            return True
+        return False
+
+    def update_phase(self, frame_num, battle_status, winner):
+        # Follow the battle status of every analysed frame. The confirmation window restarts
+        # whenever the battle resumes or the winner changes
+        if battle_status > 0:
+            self.set_full(frame_num)
+        if battle_status != 2:
+            self.decided_frame = None
+        elif self.decided_frame is None or winner != self.winner:
+            self.decided_frame, self.winner = frame_num, winner
+        elif self.confirm_frames is not None and self.stop_frame is None and frame_num - self.decided_frame >= self.confirm_frames:
+            self.stop_frame = frame_num + 1
+            self.stopped = True
+
+    def is_skipped(self, frame_num):
+        # Whether a frame is past the confirmation window of the decided battle
+        return self.stop_frame is not None and frame_num >= self.stop_frame
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            'phase': self.phase,
+            'launch_frame': self.launch_frame,
+            'stop_frame': self.stop_frame,
+            'skipped': self.skipped
+        })
+        return stats
+
+def get_drift_report(reference_results, strided_results):
+    # Drift of the strided battle results against full per-frame detection
+    reference = reference_results.iloc[0]
+    strided = strided_results.iloc[0]
+    report = {
+        'winner_match': bool(reference['winner'] == strided['winner']),
+        'battle_time_drift': round(float(strided['battle_time'] - reference['battle_time']), 2)
+    }
+    # One drift per team time column (beyblade1_time, beyblade2_time, ...)
+    for column in reference.index:
+        if column.startswith('beyblade') and column.endswith('_time'):
+            report[f'{column}_drift'] = round(float(strided[column] - reference[column]), 2)
+    report['total_collision_drift'] = int(strided['total_collision'] - reference['total_collision'])
+    return report
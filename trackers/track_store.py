@@ -0,0 +1,123 @@
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import get_centers_of_bboxes, get_ious, get_max_ious, get_self_pairs
+
+OBJECT_CLASSES = ("Beyblade", "Hand", "Launcher")
+
+TRACK_DTYPE = np.dtype([
+    ('frame_num', np.int32),
+    ('cls', np.int8),  # Index into OBJECT_CLASSES
+    ('track_id', np.int32),
+    ('bbox', np.float64, 4),
+    ('position', np.int32, 2),
+    ('inside_polygon', np.bool_),
+    ('is_taken', np.bool_),
+    ('is_rotating', np.bool_),
+    ('movement', np.float64),  # Mean optical flow magnitude at the beyblade, NaN without a previous frame
+    ('team', np.int8),  # 0 while no team has been assigned
+    ('beyblade_color', np.float64, 3)
+])
+
+# Per-track fields copied from the dict tracks when present
+TRACK_FIELDS = ('bbox', 'position', 'inside_polygon', 'is_taken', 'is_rotating', 'movement', 'team', 'beyblade_color')
+
+class TrackStore:
+    def __init__(self, records, num_frames):
+        # Records are kept sorted by frame so every frame is a contiguous slice
+        order = np.argsort(records['frame_num'], kind='stable')
+        self.records = records[order]
+        self.num_frames = num_frames
+        self.frame_offsets = np.searchsorted(self.records['frame_num'], np.arange(num_frames + 1))
+
+    @classmethod
+    def from_tracks(cls, tracks, first_frame=0):
+        # Build the columnar store from the nested {class: [{track_id: info}]} tracks. Fields the
+        # tracks already have (position, status, team, color) are kept, and first_frame numbers
+        # the frames of tracks that start later in the video
+        num_frames = len(tracks[OBJECT_CLASSES[0]])
+        rows = []
+        for cls_id, object in enumerate(OBJECT_CLASSES):
+            for frame_num, track in enumerate(tracks[object]):
+                for track_id, track_info in track.items():
+                    rows.append((first_frame + frame_num, cls_id, track_id, track_info))
+
+        records = np.zeros(len(rows), dtype=TRACK_DTYPE)
+        if rows:
+            frame_nums, cls_ids, track_ids, track_infos = zip(*rows)
+            records['frame_num'] = frame_nums
+            records['cls'] = cls_ids
+            records['track_id'] = track_ids
+            for name in TRACK_FIELDS:
+                present = [i for i, track_info in enumerate(track_infos) if name in track_info]
+                if present:
+                    records[name][present] = [track_infos[i][name] for i in present]
+        return cls(records, first_frame + num_frames)
+
+    def get_frame_slice(self, frame_num):
+        # Slice of the records belonging to a frame
+        return slice(self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1])
+
+    def get_frame_rows(self, frame_num, object):
+        # Record indices of one object class in a frame, in detection order
+        frame_slice = self.get_frame_slice(frame_num)
+        cls_ids = self.records['cls'][frame_slice]
+        return np.flatnonzero(cls_ids == OBJECT_CLASSES.index(object)) + frame_slice.start
+
+    def get_class_mask(self, object):
+        # Boolean mask of the records of one object class
+        return self.records['cls'] == OBJECT_CLASSES.index(object)
+
+    def add_positions(self):
+        # Add position (centroid) to all tracked objects at once
+        self.records['position'] = get_centers_of_bboxes(self.records['bbox'])
+
+    def get_overlaps(self, object, other_object, threshold=0):
+        # For every record of object, whether it overlaps any other_object bbox of its frame
+        return self.get_ious(object, other_object) > threshold
+
+    def get_ious(self, object, other_object):
+        # For every record of object, its highest IoU with the other_object bboxes of its frame
+        # (0 without one), over every hand or launcher of the frame
+        object_records = self.records[self.get_class_mask(object)]
+        other_records = self.records[self.get_class_mask(other_object)]
+        return get_max_ious(object_records['bbox'], object_records['frame_num'],
+                            other_records['bbox'], other_records['frame_num'], self.num_frames)
+
+    def get_pair_contacts(self, object="Beyblade", threshold=0):
+        # (frame_nums, track_ids, other_track_ids, ious) of every pair of objects of a frame whose
+        # IoU is above threshold, for any number of objects per frame
+        object_records = self.records[self.get_class_mask(object)]
+        rows, other_rows = get_self_pairs(object_records['frame_num'], self.num_frames)
+        ious = get_ious(object_records['bbox'][rows], object_records['bbox'][other_rows])
+        contact = ious > threshold
+        rows, other_rows = rows[contact], other_rows[contact]
+        return (object_records['frame_num'][rows], object_records['track_id'][rows],
+                object_records['track_id'][other_rows], ious[contact])
+
+    def get_frame_tracks(self, frame_num):
+        # Compatibility view of one frame in the old {class: {track_id: info}} shape
+        frame_tracks = {object: {} for object in OBJECT_CLASSES}
+        for record in self.records[self.get_frame_slice(frame_num)]:
+            track_info = {
+                "bbox": record['bbox'].tolist(),
+                "position": tuple(record['position'].tolist())
+            }
+            object = OBJECT_CLASSES[record['cls']]
+            if object == "Beyblade":
+                track_info['inside_polygon'] = bool(record['inside_polygon'])
+                track_info['is_taken'] = bool(record['is_taken'])
+                track_info['is_rotating'] = bool(record['is_rotating'])
+                if record['team']:
+                    track_info['team'] = int(record['team'])
+                    track_info['beyblade_color'] = record['beyblade_color']
+            frame_tracks[object][int(record['track_id'])] = track_info
+        return frame_tracks
+
+    def to_tracks(self):
+        # Compatibility view of the whole store in the old {class: [{track_id: info}]} shape
+        tracks = {object: [] for object in OBJECT_CLASSES}
+        for frame_num in range(self.num_frames):
+            for object, track in self.get_frame_tracks(frame_num).items():
+                tracks[object].append(track)
+        return tracks
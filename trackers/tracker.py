@@ -1,20 +1,67 @@
-from ultralytics import YOLO
-import supervision as sv
 import pickle
 import os
 import numpy as np
-import pandas as pd
 import cv2
 import sys 
 sys.path.append('../')
-from utils import get_center_of_bbox
+from utils import get_center_of_bbox, iter_chunks, profiler, draw_triangle, draw_beyblades
+from .detection_cache import DETECTION_DTYPE
+from .backends import load_model, get_calibration_hash, DYNAMIC_BACKENDS
+from .pipeline import DetectionPipeline
+from .stride import interpolate_frame_tracks
+
+LOST_TRACK_BUFFER = 30  # Frames a lost track is kept for at 30 fps, the ByteTrack default
+
+def get_byte_tracker(frame_rate=30):
+    # ByteTrack tracker. supervision is only imported once frames are actually tracked, so runs
+    # that read their tracks from a stub never load it
+    import supervision as sv
+    return sv.ByteTrack(lost_track_buffer=LOST_TRACK_BUFFER, frame_rate=frame_rate)
+
+def set_byte_tracker_frame_rate(tracker, frame_rate):
+    # Rescale the lost track buffer of a running tracker the way ByteTrack(frame_rate=...) sets it,
+    # keeping its current tracks
+    tracker.max_time_lost = int(frame_rate / 30.0 * LOST_TRACK_BUFFER)
 
 class Tracker:
-    def __init__(self, model_path):
-        # Initialize YOLO model and ByteTrack tracker
-        self.model = YOLO(model_path) 
-        self.tracker = sv.ByteTrack()
+    def __init__(self, model_path, detection_cache=None, conf=0.1, imgsz=640, pipelined=False, stride_scheduler=None, model=None,
+                 backend='pytorch', int8=False, calibration_videos=None, roi=None, roi_scale=1.0):
+        # YOLO model on the chosen inference backend (or an already built model with the same predict
+        # interface) and ByteTrack tracker. Both are created on first use, so runs that read their
+        # tracks from a stub never load the weights
+        self.model_path = model_path
+        self.backend = backend  # 'pytorch', or an exported 'onnx', 'openvino' or 'torchscript' model
+        self.int8 = int8  # INT8 quantized export calibrated on frames of calibration_videos
+        self.calibration_videos = calibration_videos
+        self.model = model  # Loaded by get_model
+        self.names = None  # Class id -> name map, from the detection cache or the model
+        self.tracker = None  # Created by get_frame_tracks
+        self.detection_cache = detection_cache  # Optional DetectionCache for the raw detections
+        self.conf = conf  # Detection confidence threshold
+        self.imgsz = imgsz  # Inference image size, exports are made for this size
+        self.pipelined = pipelined  # Overlap decoding, inference and tracking with an adaptive batch size
+        self.pipeline = None  # DetectionPipeline of the last pipelined run
+        self.stride_scheduler = stride_scheduler  # Optional StrideScheduler to only detect keyframes
+        self.roi = roi  # Optional (x1, y1, x2, y2) arena crop, only this part of the frames is detected on
+        self.roi_scale = roi_scale  # Resize factor of the cropped frames before detection
+
+    def reset(self):
+        # Start a new video with fresh tracking state while keeping the loaded model
+        self.tracker = None
+        self.pipeline = None
+
+    def get_model(self):
+        # Load the model (and export it for other backends) on first use
+        if self.model is None:
+            with profiler.stage('model_load'):
+                self.model = load_model(self.model_path, self.backend, self.imgsz, self.int8, self.calibration_videos)
+        return self.model
 
+    def get_names(self):
+        # Class names of the model, without loading it when a cache entry already provided them
+        if self.names is None:
+            self.names = dict(self.get_model().names)
+        return self.names
     
     def add_position_to_tracks(self, tracks):
         # Add position (centroid) to tracked objects
@@ -25,27 +72,245 @@ class Tracker:
                     position = get_center_of_bbox(bbox)
                     tracks[object][frame_num][track_id]['position'] = position
 
+    def add_position_to_frame_tracks(self, frame_tracks):
+        # Add position (centroid) to the tracked objects of a single frame
+        for object, track in frame_tracks.items():
+            for track_id, track_info in track.items():
+                track_info['position'] = get_center_of_bbox(track_info['bbox'])
 
-    def detect_frames(self, frames):
-        # Detect objects in video frames in batches
-        batch_size = 20 
+
+    def crop_frames(self, frames):
+        # Crop frames to the arena ROI and downsize them by roi_scale
+        x1, y1, x2, y2 = self.roi
+        crops = [frame[y1:y2, x1:x2] for frame in frames]
+        if self.roi_scale != 1.0:
+            crops = [cv2.resize(crop, None, fx=self.roi_scale, fy=self.roi_scale, interpolation=cv2.INTER_AREA) for crop in crops]
+        return crops
+
+
+    def detect_frames(self, frames, batch_size=20):
+        # Detect objects in video frames in batches, on the arena crops when an ROI is set
         detections = [] 
+        model = self.get_model()
+        if self.backend not in DYNAMIC_BACKENDS:
+            # Static batch 1 export, every frame is predicted on its own
+            batch_size = 1
         for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size], conf=0.1)
+            batch = frames[i:i+batch_size]
+            with profiler.stage('detection'):
+                if self.roi is not None:
+                    batch = self.crop_frames(batch)
+                detections_batch = model.predict(batch, conf=self.conf, imgsz=self.imgsz)
+            profiler.count('frames_detected', len(detections_batch))
             detections += detections_batch
         return detections
 
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+    def get_detection_records(self, frames, start_frame=0, batch_size=20):
+        # Detect objects in frames and flatten them into DETECTION_DTYPE records
+        records = []
+        for frame_num, detection in enumerate(self.detect_frames(frames, batch_size), start_frame):
+            boxes = detection.boxes
+            frame_records = np.zeros(len(boxes), dtype=DETECTION_DTYPE)
+            frame_records['frame_num'] = frame_num
+            frame_records['xyxy'] = boxes.xyxy.cpu().numpy()
+            if self.roi is not None:
+                # Map the boxes of the crop back to full-frame coordinates
+                frame_records['xyxy'] = frame_records['xyxy'] / self.roi_scale + np.tile(self.roi[:2], 2)
+            frame_records['confidence'] = boxes.conf.cpu().numpy()
+            frame_records['class_id'] = boxes.cls.cpu().numpy().astype(int)
+            records.append(frame_records)
+        return np.concatenate(records) if records else np.zeros(0, dtype=DETECTION_DTYPE)
+
+
+    def iter_detections(self, frames, video_path=None, batch_size=20):
+        # Yield (frame, detection_supervision) pairs, reading detections from the cache when possible
+        if self.detection_cache is not None and video_path is not None:
+            params = dict(conf=self.conf, imgsz=self.imgsz)
+            if self.backend != 'pytorch':
+                # Exported models detect slightly differently, pytorch keys stay as they were
+                params.update(backend=self.backend, int8=self.int8)
+                if self.int8:
+                    params.update(calibration=get_calibration_hash(self.calibration_videos))
+            if self.roi is not None:
+                params.update(roi=list(self.roi), roi_scale=self.roi_scale)
+            key = self.detection_cache.get_key(video_path, self.model_path, **params)
+            self.names = self.detection_cache.load_names(key) or self.names
+
+            def detect_chunk(frames_chunk, start_frame):
+                records = self.get_detection_records(frames_chunk, start_frame)
+                self.detection_cache.save_names(key, self.get_names())
+                return records
+            chunk_size = self.detection_cache.chunk_size
+            if self.pipelined:
+                # Fixed batches of one cache chunk each: the inference thread loads every chunk from the
+                # cache or detects it, while the next frames are decoded and the previous ones tracked
+                self.pipeline = DetectionPipeline(lambda batch, start_frame: self.detection_cache.get_chunk(key, start_frame // chunk_size, batch, detect_chunk),
+                                                  chunk_size, chunk_size, chunk_size)
+                chunks = self.detection_cache.iter_entry(key, self.pipeline.iter_batches(frames))
+            else:
+                chunks = self.detection_cache.iter_chunks(key, iter_chunks(frames, chunk_size), detect_chunk)
+        elif self.pipelined:
+            # The pipeline detects each adaptively sized batch in a single predict call
+            self.pipeline = DetectionPipeline(lambda batch, start_frame: self.get_detection_records(batch, start_frame, len(batch)), batch_size)
+            chunks = self.pipeline.iter_batches(frames)
+        else:
+            chunks = ((frames_chunk, self.get_detection_records(frames_chunk, chunk_num * batch_size))
+                      for chunk_num, frames_chunk in enumerate(iter_chunks(frames, batch_size)))
+
+        start_frame = 0
+        for frames_chunk, records in chunks:
+            # Records are ordered by frame, so every frame is a contiguous slice of its chunk
+            offsets = np.searchsorted(records['frame_num'], np.arange(start_frame, start_frame + len(frames_chunk) + 1))
+            for i, frame in enumerate(frames_chunk):
+                yield frame, self.get_supervision_detections(records[offsets[i]:offsets[i+1]])
+            start_frame += len(frames_chunk)
+
+
+    def get_supervision_detections(self, frame_records):
+        # Convert the detection records of one frame to supervision format
+        import supervision as sv
+        return sv.Detections(xyxy=np.array(frame_records['xyxy']),
+                             confidence=np.array(frame_records['confidence']),
+                             class_id=np.array(frame_records['class_id']).astype(int))
+
+
+    def get_record_boxes(self, records):
+        # Raw detection boxes of one frame per object class, before tracking
+        return {name: records['xyxy'][records['class_id'] == class_id].tolist() for class_id, name in self.get_names().items()}
+
+
+    def track_frame(self, frame):
+        # Detect and track the objects of a single frame, used when frames arrive one by one
+        records = self.get_detection_records([frame])
+        return self.get_frame_tracks(self.get_supervision_detections(records))
+
+
+    def iter_strided_tracks(self, frames):
+        # Yield (frame, frame_tracks) pairs, detecting only the keyframes picked by the stride scheduler.
+        # Frames between two keyframes wait in a short buffer and get interpolated tracks
+        scheduler = self.stride_scheduler
+        # ByteTrack only sees keyframes, so its lost track buffer is scaled to the same time span.
+        # It is rescaled whenever the scheduler changes the stride
+        self.tracker = get_byte_tracker(frame_rate=30 / scheduler.stride)
+        tracker_stride = scheduler.stride
+
+        def sync_stride():
+            nonlocal tracker_stride
+            if scheduler.stride != tracker_stride:
+                tracker_stride = scheduler.stride
+                set_byte_tracker_frame_rate(self.tracker, 30 / tracker_stride)
+
+        def fill_gap(buffer, prev_tracks, frame_tracks):
+            gap = len(buffer) + 1
+            for i, frame in enumerate(buffer, 1):
+                scheduler.interpolated += 1
+                profiler.count('frames_interpolated')
+                yield frame, interpolate_frame_tracks(prev_tracks, frame_tracks, i / gap)
+
+        buffer = []
+        prev_tracks = None
+        next_keyframe = 0
+        for frame_num, frame in enumerate(frames):
+            if scheduler.stopped and not buffer:
+                # Nothing is detected any more, the frames are passed on without tracks
+                scheduler.skipped += 1
+                profiler.count('frames_skipped')
+                yield frame, {"Beyblade": {}, "Hand": {}, "Launcher": {}}
+                continue
+            if frame_num < next_keyframe:
+                buffer.append(frame)
+                continue
+
+            records = self.get_detection_records([frame])
+            keyframe_changed = scheduler.check_keyframe(frame_num, self.get_record_boxes(records))
+            sync_stride()
+            if keyframe_changed and buffer:
+                # The schedule changed inside the gap, so its frames are detected instead of interpolated
+                for buffered_frame in buffer:
+                    prev_tracks = self.track_frame(buffered_frame)
+                    scheduler.keyframes += 1
+                    yield buffered_frame, prev_tracks
+                buffer = []
+            frame_tracks = self.get_frame_tracks(self.get_supervision_detections(records))
+            scheduler.keyframes += 1
+            stride = scheduler.stride
+            if prev_tracks is not None:
+                yield from fill_gap(buffer, prev_tracks, frame_tracks)
+                stride = scheduler.update(prev_tracks, frame_tracks, len(buffer) + 1)
+                sync_stride()
+            yield frame, frame_tracks
+
+            buffer = []
+            prev_tracks = frame_tracks
+            next_keyframe = frame_num + stride
+
+        # The last frame always becomes a keyframe so the tail is interpolated, not extrapolated
+        if buffer:
+            frame = buffer.pop()
+            frame_tracks = self.track_frame(frame)
+            scheduler.keyframes += 1
+            yield from fill_gap(buffer, prev_tracks, frame_tracks)
+            yield frame, frame_tracks
+
+
+    def get_frame_tracks(self, detection_supervision):
+        # Track the detections of a single frame and split them per object class
+        cls_names = self.get_names()
+        cls_names_inv = {v: k for k, v in cls_names.items()}
+
+        # Update tracks with detected objects
+        if self.tracker is None:
+            self.tracker = get_byte_tracker()
+        with profiler.stage('tracking'):
+            detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
+
+        frame_tracks = {
+            "Beyblade": {},
+            "Hand": {},
+            "Launcher": {}
+        }
+
+        for frame_detection in detection_with_tracks:
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]
+            track_id = frame_detection[4]
+
+            # Assign Beyblade tracks
+            if cls_id == cls_names_inv['Beyblade']:
+                frame_tracks["Beyblade"][track_id] = {"bbox": bbox}
+
+        # Assign Hand and Launcher tracks, every detection is kept with ids 1, 2, ... in detection order
+        for frame_detection in detection_supervision:
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]
+
+            if cls_id == cls_names_inv['Hand']:
+                frame_tracks["Hand"][len(frame_tracks["Hand"]) + 1] = {"bbox": bbox}
+
+            if cls_id == cls_names_inv['Launcher']:
+                frame_tracks["Launcher"][len(frame_tracks["Launcher"]) + 1] = {"bbox": bbox}
+
+        return frame_tracks
+
+
+    def iter_frame_tracks(self, frames, video_path=None):
+        # Yield (frame, frame_tracks) pairs from every frame's detections, or from keyframes only
+        # when a stride scheduler is set (strided runs bypass the detection cache)
+        if self.stride_scheduler is not None:
+            yield from self.iter_strided_tracks(frames)
+            return
+        for frame, detection_supervision in self.iter_detections(frames, video_path):
+            yield frame, self.get_frame_tracks(detection_supervision)
+
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None, video_path=None):
         # Load pre-existing tracks from a stub if available
         if read_from_stub and stub_path is not None and os.path.exists(stub_path):
             with open(stub_path, 'rb') as f:
                 tracks = pickle.load(f)
             return tracks
 
-        # Detect objects in frames
-        detections = self.detect_frames(frames)
-
         # Initialize tracking structure for objects
         tracks = {
             "Beyblade": [],
@@ -53,41 +318,11 @@ class Tracker:
             "Launcher": []
         }
 
-        # Track detected objects and update tracking information
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v: k for k, v in cls_names.items()}
+        # Detect objects in frames, then track them and update tracking information
+        for _, frame_tracks in self.iter_frame_tracks(frames, video_path):
+            for object, object_track in frame_tracks.items():
+                tracks[object].append(object_track)
 
-            # Convert detections to supervision format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
-            # Update tracks with detected objects
-            detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
-
-            tracks["Beyblade"].append({})
-            tracks["Hand"].append({})
-            tracks["Launcher"].append({})
-
-            for frame_detection in detection_with_tracks:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-                track_id = frame_detection[4]
-
-                # Assign Beyblade tracks
-                if cls_id == cls_names_inv['Beyblade']:
-                    tracks["Beyblade"][frame_num][track_id] = {"bbox": bbox}
-
-            # Assign Hand and Launcher tracks
-            for frame_detection in detection_supervision:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-
-                if cls_id == cls_names_inv['Hand']:
-                    tracks["Hand"][frame_num][1] = {"bbox": bbox}
-                
-                if cls_id == cls_names_inv['Launcher']:
-                    tracks["Launcher"][frame_num][1] = {"bbox": bbox}
-            
         # Save tracks to stub file for future use
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
@@ -96,61 +331,48 @@ class Tracker:
         return tracks
 
 
+    def iter_object_tracks(self, frames, read_from_stub=False, stub_path=None, video_path=None):
+        # Streaming version of get_object_tracks: yields (frame, frame_tracks) pairs
+        # while only holding one detection batch of frames in memory
+        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
+            with open(stub_path, 'rb') as f:
+                tracks = pickle.load(f)
+            for frame_num, frame in enumerate(frames):
+                yield frame, {object: object_tracks[frame_num] for object, object_tracks in tracks.items()}
+            return
+
+        # Per-frame tracks are small, so they are kept to write the stub at the end
+        tracks = {
+            "Beyblade": [],
+            "Hand": [],
+            "Launcher": []
+        }
+
+        for frame, frame_tracks in self.iter_frame_tracks(frames, video_path):
+            for object, object_track in frame_tracks.items():
+                tracks[object].append(object_track)
+            yield frame, frame_tracks
+
+        # Save tracks to stub file for future use
+        if stub_path is not None:
+            with open(stub_path, 'wb') as f:
+                pickle.dump(tracks, f)
+
+
     def draw_triangle(self, frame, bbox, color, track_id=None):
         # Draw a triangle over an object for visualization
-        y = int(bbox[1])
-        x, _ = get_center_of_bbox(bbox)
-
-        triangle_points = np.array([
-            [x, y],
-            [x-10, y-20],
-            [x+10, y-20],
-        ])
-        cv2.drawContours(frame, [triangle_points], 0, color, cv2.FILLED)
-        cv2.drawContours(frame, [triangle_points], 0, (0, 0, 0), 2)
-
-        # Draw rectangle with track ID if available
-        rectangle_width = 140
-        x1_rect = x - rectangle_width // 2
-        x2_rect = x + rectangle_width // 2
-        y1_rect = y - 50
-        y2_rect = y - 30
-
-        if track_id is not None:
-            cv2.rectangle(frame,
-                          (int(x1_rect), int(y1_rect)),
-                          (int(x2_rect), int(y2_rect)),
-                          color,
-                          cv2.FILLED)
-            
-            x1_text = x1_rect + 10
-            
-            cv2.putText(
-                frame,
-                f"Beyblade #{track_id}",
-                (int(x1_text), int(y1_rect + 15)),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (255, 255, 255),
-                2
-            )
-
-        return frame
+        return draw_triangle(frame, bbox, color, track_id)
+
+    def draw_frame_annotations(self, frame, beyblade_dict):
+        # Draw Beyblade tracking information on a single frame
+        return draw_beyblades(frame, beyblade_dict)
 
     def draw_annotations(self, video_frames, tracks):
         # Annotate video frames with tracked object information
         output_video_frames = []
         for frame_num, frame in enumerate(video_frames):
             beyblade_dict = tracks["Beyblade"][frame_num]
-
-            # Draw Beyblade tracking information on each frame
-            for track_id, beyblade in beyblade_dict.items():
-                color = beyblade.get("beyblade_color", (0, 0, 255))
-                team = beyblade.get("team", 1)
-                bbox = beyblade['bbox']
-
-                frame = self.draw_triangle(frame, bbox, color, team)
-
+            frame = self.draw_frame_annotations(frame, beyblade_dict)
             output_video_frames.append(frame)
 
-        return output_video_frames
+        return output_video_frames
\ No newline at end of file
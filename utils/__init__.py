@@ -1,2 +1,6 @@
-from .video_utils import read_video, save_video
-from .bbox_utils import get_center_of_bbox, is_overlapping
\ No newline at end of file
+from .video_utils import read_video, save_video, iter_video, iter_chunks, VideoWriter, AsyncVideoWriter, LiveCapture, render_frames
+from .frame_store import FrameStore
+from .frame_index import FrameIndex
+from .drawing_utils import draw_triangle, draw_beyblades
+from .profiler import profiler, Profiler, get_peak_rss_mb, get_rss_mb
+from .bbox_utils import get_center_of_bbox, get_iou, get_centers_of_bboxes, get_ious, get_iou_matrix, get_frame_pairs, get_self_pairs, get_max_ious, points_in_polygon
\ No newline at end of file
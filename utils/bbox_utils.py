@@ -1,39 +1,83 @@
+import numpy as np
+
 def get_center_of_bbox(bbox):
     # Calculate the center coordinates of the bounding box
     x1, y1, x2, y2 = bbox
     return int((x1 + x2) / 2), int((y1 + y2) / 2)
 
-def is_overlapping(bbox1, bbox2):
-    # Check if two bounding boxes overlap and calculate their Intersection over Union (IoU)
-    if bbox1 and bbox2:
-        x1_min, y1_min, x1_max, y1_max = bbox1
-        x2_min, y2_min, x2_max, y2_max = bbox2
-
-        # Determine the coordinates of the intersection rectangle
-        x_inter_min = max(x1_min, x2_min)
-        y_inter_min = max(y1_min, y2_min)
-        x_inter_max = min(x1_max, x2_max)
-        y_inter_max = min(y1_max, y2_max)
-
-        # Calculate the width and height of the intersection
-        width_inter = max(0, x_inter_max - x_inter_min)
-        height_inter = max(0, y_inter_max - y_inter_min)
-        area_inter = width_inter * height_inter
-
-        # If there is no intersection, return False
-        if area_inter == 0:
-            return False
-
-        # Calculate the area of both bounding boxes
-        area_obj1 = (x1_max - x1_min) * (y1_max - y1_min)
-        area_obj2 = (x2_max - x2_min) * (y2_max - y2_min)
-        
-        # Calculate the area of the union of both bounding boxes
-        area_union = area_obj1 + area_obj2 - area_inter
-
-        # Calculate the Intersection over Union (IoU) and check if it's greater than zero
-        IoU = area_inter / area_union
-
-        return IoU > 0 
-    else:
-        return False
+def get_iou(bbox1, bbox2):
+    # Intersection over Union of two bounding boxes, 0 when they do not overlap
+    x1_min, y1_min, x1_max, y1_max = bbox1
+    x2_min, y2_min, x2_max, y2_max = bbox2
+    area_inter = max(0, min(x1_max, x2_max) - max(x1_min, x2_min)) * max(0, min(y1_max, y2_max) - max(y1_min, y2_min))
+    if area_inter == 0:
+        return 0.0
+    area_union = (x1_max - x1_min) * (y1_max - y1_min) + (x2_max - x2_min) * (y2_max - y2_min) - area_inter
+    return area_inter / area_union
+
+def get_centers_of_bboxes(bboxes):
+    # Vectorized get_center_of_bbox for an (N, 4) array of bounding boxes
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    centers = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2, (bboxes[:, 1] + bboxes[:, 3]) / 2], axis=1)
+    return np.trunc(centers).astype(np.int32)
+
+def get_iou_matrix(bboxes1, bboxes2):
+    # IoU of every bbox of (..., N, 4) with every bbox of (..., M, 4) as (..., N, M), leading
+    # dimensions (e.g. a chunk of frames) broadcast; NaN padding rows have IoU 0
+    bboxes1 = np.asarray(bboxes1, dtype=np.float64)[..., :, None, :]
+    bboxes2 = np.asarray(bboxes2, dtype=np.float64)[..., None, :, :]
+    width_inter = np.minimum(bboxes1[..., 2], bboxes2[..., 2]) - np.maximum(bboxes1[..., 0], bboxes2[..., 0])
+    height_inter = np.minimum(bboxes1[..., 3], bboxes2[..., 3]) - np.maximum(bboxes1[..., 1], bboxes2[..., 1])
+    area_inter = np.where((width_inter > 0) & (height_inter > 0), width_inter * height_inter, 0.0)
+    area1 = (bboxes1[..., 2] - bboxes1[..., 0]) * (bboxes1[..., 3] - bboxes1[..., 1])
+    area2 = (bboxes2[..., 2] - bboxes2[..., 0]) * (bboxes2[..., 3] - bboxes2[..., 1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ious = area_inter / (area1 + area2 - area_inter)
+    return np.where(area_inter > 0, ious, 0.0)
+
+def get_ious(bboxes1, bboxes2):
+    # Vectorized get_iou for two (N, 4) arrays of bounding boxes: the diagonal of get_iou_matrix,
+    # computed as N 1x1 matrices; rows with NaN have IoU 0
+    bboxes1 = np.asarray(bboxes1, dtype=np.float64).reshape(-1, 1, 4)
+    bboxes2 = np.asarray(bboxes2, dtype=np.float64).reshape(-1, 1, 4)
+    return get_iou_matrix(bboxes1, bboxes2)[:, 0, 0]
+
+def get_frame_pairs(frames, other_frames, num_frames):
+    # Row index pairs (i, j) of every record i with every other record j of the same frame,
+    # for two arrays of sorted frame numbers
+    other_offsets = np.searchsorted(other_frames, np.arange(num_frames + 1))
+    counts = np.diff(other_offsets)[frames]
+    rows = np.repeat(np.arange(len(frames)), counts)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, np.repeat(other_offsets[frames], counts) + within
+
+def get_self_pairs(frames, num_frames):
+    # Row index pairs (i, j), i < j, of the records that share a frame
+    rows, other_rows = get_frame_pairs(frames, frames, num_frames)
+    keep = rows < other_rows
+    return rows[keep], other_rows[keep]
+
+def get_max_ious(bboxes, frames, other_bboxes, other_frames, num_frames):
+    # For every bbox, the highest IoU with any other bbox of its frame (0 without one)
+    rows, other_rows = get_frame_pairs(frames, other_frames, num_frames)
+    max_ious = np.zeros(len(bboxes))
+    np.maximum.at(max_ious, rows, get_ious(bboxes[rows], other_bboxes[other_rows]))
+    return max_ious
+
+def points_in_polygon(points, vertices):
+    # Vectorized cv2.pointPolygonTest(vertices, point, False) >= 0, points on the border count as inside
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    inside = np.zeros(len(points), dtype=bool)
+    on_edge = np.zeros(len(points), dtype=bool)
+    vertices = np.asarray(vertices, dtype=np.float64)
+    for (xi, yi), (xj, yj) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        # Points lying on the edge segment
+        cross = (xj - xi) * (y - yi) - (yj - yi) * (x - xi)
+        on_edge |= (cross == 0) & (x >= min(xi, xj)) & (x <= max(xi, xj)) & (y >= min(yi, yj)) & (y <= max(yi, yj))
+
+        # Ray casting towards +x
+        if yi != yj:
+            crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / (yj - yi) + xi)
+            inside ^= crosses
+    return inside | on_edge
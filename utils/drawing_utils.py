@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+from .bbox_utils import get_center_of_bbox
+
+def draw_triangle(frame, bbox, color, track_id=None):
+    # Draw a triangle over an object for visualization
+    y = int(bbox[1])
+    x, _ = get_center_of_bbox(bbox)
+
+    triangle_points = np.array([
+        [x, y],
+        [x-10, y-20],
+        [x+10, y-20],
+    ])
+    cv2.drawContours(frame, [triangle_points], 0, color, cv2.FILLED)
+    cv2.drawContours(frame, [triangle_points], 0, (0, 0, 0), 2)
+
+    # Draw rectangle with track ID if available
+    rectangle_width = 140
+    x1_rect = x - rectangle_width // 2
+    x2_rect = x + rectangle_width // 2
+    y1_rect = y - 50
+    y2_rect = y - 30
+
+    if track_id is not None:
+        cv2.rectangle(frame,
+                      (int(x1_rect), int(y1_rect)),
+                      (int(x2_rect), int(y2_rect)),
+                      color,
+                      cv2.FILLED)
+
+        x1_text = x1_rect + 10
+
+        cv2.putText(
+            frame,
+            f"Beyblade #{track_id}",
+            (int(x1_text), int(y1_rect + 15)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (255, 255, 255),
+            2
+        )
+
+    return frame
+
+def draw_beyblades(frame, beyblade_dict):
+    # Draw Beyblade tracking information on a single frame
+    for track_id, beyblade in beyblade_dict.items():
+        color = beyblade.get("beyblade_color", (0, 0, 255))
+        team = beyblade.get("team", 1)
+        bbox = beyblade['bbox']
+
+        frame = draw_triangle(frame, bbox, color, team)
+
+    return frame
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+from .profiler import profiler
+
+class FrameIndex:
+    def __init__(self, pts=(), fps=30):
+        # Presentation time (ms) of every frame of a video, recorded while it is decoded the first
+        # time. OpenCV has no keyframe flags, so seeks are checked against these timestamps instead
+        self.pts = list(pts)
+        self.fps = fps
+
+    @classmethod
+    def from_video(cls, video_path):
+        # Build the index of a video that was not indexed while decoding, without converting frames
+        cap = cv2.VideoCapture(video_path)
+        index = cls(fps=cap.get(cv2.CAP_PROP_FPS) or 30)
+        try:
+            while cap.grab():
+                index.add(cap)
+        finally:
+            cap.release()
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['pts'].tolist(), float(data['fps']))
+
+    def save(self, path):
+        np.savez_compressed(path, pts=np.array(self.pts, dtype=np.float64), fps=self.fps)
+
+    def __len__(self):
+        return len(self.pts)
+
+    def add(self, cap):
+        # Record the frame a capture has just read
+        if not self.pts:
+            self.fps = cap.get(cv2.CAP_PROP_FPS) or self.fps
+        self.pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+
+    def seek(self, cap, frame_num):
+        # Position the capture so the next read returns frame_num. The frame before it is grabbed to
+        # check where the seek landed; inexact seeking (in some containers) falls back to grabbing
+        # from the start
+        with profiler.stage('seek'):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, max(frame_num - 1, 0))
+            if frame_num == 0 or (cap.grab() and abs(cap.get(cv2.CAP_PROP_POS_MSEC) - self.pts[frame_num - 1]) < 0.5):
+                return
+            profiler.count('inexact_seeks')
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(frame_num):
+                cap.grab()
+
+    def iter_range(self, video_path, start, stop):
+        # Yield (frame_num, frame) for the frames start to stop - 1 of the video, decoding only those
+        cap = cv2.VideoCapture(video_path)
+        try:
+            start, stop = max(0, start), min(stop, len(self))
+            if start < stop:
+                self.seek(cap, start)
+            for frame_num in range(start, stop):
+                with profiler.stage('decode'):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                profiler.count('frames_decoded')
+                yield frame_num, frame
+        finally:
+            cap.release()
+
+    def read_frame(self, video_path, frame_num):
+        # A single frame by its number, None past the end of the video
+        for _, frame in self.iter_range(video_path, frame_num, frame_num + 1):
+            return frame
+        return None
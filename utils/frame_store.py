@@ -0,0 +1,143 @@
+import cv2
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from .frame_index import FrameIndex
+from .profiler import profiler
+
+def get_video_key(video_path):
+    # Store key of a video file from its path, size and modification time, so an edited or
+    # replaced video is decoded again
+    stat = os.stat(video_path)
+    video_id = f'{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha256(video_id.encode()).hexdigest()[:32]
+
+def decode_video(video_path, store_dir):
+    # Decode every frame once into a raw uint8 file, indexing their timestamps on the way. The frame
+    # count of a video header is not reliable, so frames are appended and meta.json, written last,
+    # marks a complete store
+    tmp_dir = f'{store_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    cap = cv2.VideoCapture(video_path)
+    frame_index = FrameIndex()
+    num_frames, shape = 0, (0, 0, 3)
+    try:
+        with open(os.path.join(tmp_dir, 'frames.u8'), 'wb') as f:
+            while True:
+                with profiler.stage('decode'):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                profiler.count('frames_decoded')
+                frame_index.add(cap)
+                f.write(frame.tobytes())
+                num_frames, shape = num_frames + 1, frame.shape
+        meta = {
+            'video_path': os.path.abspath(video_path),
+            'num_frames': num_frames,
+            'height': shape[0],
+            'width': shape[1],
+            'fps': cap.get(cv2.CAP_PROP_FPS) or 30
+        }
+    finally:
+        cap.release()
+    frame_index.save(os.path.join(tmp_dir, 'frame_index.npz'))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    # Another process may have finished the same video first, its store is kept
+    if os.path.exists(os.path.join(store_dir, 'meta.json')):
+        shutil.rmtree(tmp_dir)
+    else:
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(tmp_dir, store_dir)
+
+class FrameStore:
+    def __init__(self, store_dir):
+        # Decoded frames of one video as a read-only memory map, indexed like the read_video list.
+        # Pickling only sends the directory, so worker processes map the same file without copies
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        self.video_path = meta['video_path']
+        self.fps = meta['fps']
+        self.shape = (meta['num_frames'], meta['height'], meta['width'], 3)
+        self.frames = self.get_frames()
+        self.planes = {}  # Derived planes already mapped, keyed by file name
+
+    @classmethod
+    def from_video(cls, video_path, cache_dir='stubs/frame_store'):
+        # Open the store of a video, decoding it on the first run
+        store_dir = os.path.join(cache_dir, get_video_key(video_path))
+        if not os.path.exists(os.path.join(store_dir, 'meta.json')):
+            decode_video(video_path, store_dir)
+        return cls(store_dir)
+
+    def __getstate__(self):
+        return {'store_dir': self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['store_dir'])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        # Zero-copy view of a frame (or a slice of frames)
+        return self.frames[index]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def get_frames(self, writable=False):
+        # Memory map of all frames. Writable maps are copy-on-write, so drawing on them in place
+        # never changes the store
+        if self.shape[0] == 0:
+            return np.zeros(self.shape, dtype=np.uint8)
+        return np.memmap(os.path.join(self.store_dir, 'frames.u8'), dtype=np.uint8,
+                         mode='c' if writable else 'r', shape=self.shape)
+
+    def iter_frames(self):
+        # Yield private copies of the frames one at a time, for single-pass runs that draw on them
+        for frame in self.frames:
+            yield np.array(frame)
+
+    def get_frame_index(self):
+        # Timestamps of the frames for seeking in the original video, recorded while decoding
+        # (and built once for stores decoded without them)
+        index_path = os.path.join(self.store_dir, 'frame_index.npz')
+        if not os.path.exists(index_path):
+            FrameIndex.from_video(self.video_path).save(index_path)
+        return FrameIndex.load(index_path)
+
+    def get_plane(self, name, convert):
+        # Lazily derived plane with one converted image per frame. It is built on first use, saved
+        # next to the frames and memory-mapped by every later call, process and run
+        path = os.path.join(self.store_dir, f'{name}.npy')
+        if name not in self.planes:
+            if not os.path.exists(path):
+                with profiler.stage(f'frame_store_{name}'):
+                    sample = convert(self.frames[0])
+                    tmp_path = f'{path}.{os.getpid()}.tmp'
+                    plane = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=sample.dtype, shape=(len(self),) + sample.shape)
+                    for frame_num, frame in enumerate(self.frames):
+                        plane[frame_num] = convert(frame)
+                    plane.flush()
+                    del plane
+                    os.replace(tmp_path, path)
+            self.planes[name] = np.load(path, mmap_mode='r')
+        return self.planes[name]
+
+    def get_gray(self):
+        # Grayscale frames, as used by the optical flow rotation check
+        return self.get_plane('gray', lambda frame: cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+    def get_pyramid(self, level=1):
+        # Frames downscaled level times by cv2.pyrDown (half the width and height per level)
+        def convert(frame):
+            for _ in range(level):
+                frame = cv2.pyrDown(frame)
+            return frame
+        return self.get_plane(f'pyramid_{level}', convert)
@@ -0,0 +1,202 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def get_peak_rss_mb():
+    # Peak resident set size of the process so far (ru_maxrss is in KB on Linux, bytes on macOS)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+def get_rss_mb():
+    # Current resident set size of the process from /proc/self/statm, None where it does not exist
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+class NullStage:
+    # Shared no-op context manager returned while profiling is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    def __init__(self, profiler, name):
+        # Context manager adding its wall and CPU time to a named stage. CPU time is that of the thread
+        # running the stage, so the decode, inference, render and writer threads running at the same
+        # time are not counted (nor the internal worker threads of OpenCV and torch)
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_stage_time(self.name, time.perf_counter() - self.wall_start, time.thread_time() - self.cpu_start)
+        return False
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        # Cumulative-ready bucket counts plus sum, count and max of the observed values
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def get_quantile(self, q):
+        # Upper bucket bound below which a share q of the values falls
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.get_quantile(0.5),
+            'p95': self.get_quantile(0.95),
+            'max': round(self.max, 6),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ('+Inf',), self.counts)}
+        }
+
+class Profiler:
+    def __init__(self, enabled=False):
+        # Run-wide stage timers, counters, gauges and latency histograms. While disabled every
+        # call returns right away, so the instrumentation can stay in the hot paths
+        self.enabled = enabled
+        self.lock = threading.Lock()  # Decode and inference threads of the pipeline record concurrently
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.perf_counter()
+        self.stages = {}  # name -> {'calls', 'wall', 'cpu'}
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name):
+        # Context manager timing a block as part of a named stage
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def add_stage_time(self, name, wall, cpu):
+        # Stage totals plus a histogram of the wall time of every call
+        with self.lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            stage['calls'] += 1
+            stage['wall'] += wall
+            stage['cpu'] += cpu
+        self.observe(f'{name}_latency', wall)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def set_gauges(self, prefix, values):
+        # Numeric entries of a stats dict (e.g. DetectionCache.get_stats) as gauges
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.set_gauge(f'{prefix}_{key}', value)
+
+    def observe(self, name, value):
+        # Add a value (seconds) to a latency histogram
+        if self.enabled:
+            with self.lock:
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram()
+                self.histograms[name].observe(value)
+
+    def get_report(self):
+        # Machine-readable summary of the run
+        return {
+            'wall_time': round(time.perf_counter() - self.start_time, 6),
+            'peak_rss_mb': round(get_peak_rss_mb(), 1),
+            'stages': {name: {'calls': stage['calls'], 'wall': round(stage['wall'], 6), 'cpu': round(stage['cpu'], 6)}
+                       for name, stage in sorted(self.stages.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': dict(sorted(self.gauges.items())),
+            'histograms': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+        }
+
+    def get_prometheus_text(self, prefix='beyblade'):
+        # The report in the Prometheus text exposition format
+        lines = [f'# TYPE {prefix}_wall_seconds gauge',
+                 f'{prefix}_wall_seconds {time.perf_counter() - self.start_time:.6f}',
+                 f'# TYPE {prefix}_peak_rss_bytes gauge',
+                 f'{prefix}_peak_rss_bytes {int(get_peak_rss_mb() * 1024 * 1024)}']
+
+        for metric, key in (('stage_calls_total', 'calls'), ('stage_wall_seconds_total', 'wall'), ('stage_cpu_seconds_total', 'cpu')):
+            lines.append(f'# TYPE {prefix}_{metric} counter')
+            for name, stage in sorted(self.stages.items()):
+                lines.append(f'{prefix}_{metric}{{stage="{name}"}} {stage[key]}')
+
+        for name, value in sorted(self.counters.items()):
+            lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {value}']
+        for name, value in sorted(self.gauges.items()):
+            lines += [f'# TYPE {prefix}_{name} gauge', f'{prefix}_{name} {value}']
+
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {prefix}_{name}_seconds histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_{name}_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_{name}_seconds_sum {histogram.sum}')
+            lines.append(f'{prefix}_{name}_seconds_count {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self, report_path, prometheus_path=None):
+        # Write the JSON report and optionally the Prometheus text file
+        with open(report_path, 'w') as f:
+            json.dump(self.get_report(), f, indent=2)
+        if prometheus_path is not None:
+            with open(prometheus_path, 'w') as f:
+                f.write(self.get_prometheus_text())
+
+# Process-wide profiler shared by all modules, off unless a run enables it
+profiler = Profiler()
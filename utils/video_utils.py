@@ -1,20 +1,200 @@
 import cv2
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .profiler import profiler
 
-def read_video(video_path):
-    # Open the video file and read frames into a list
+def read_video(video_path, frame_index=None):
+    # Open the video file and read frames into a list, recording their timestamps in frame_index
     cap = cv2.VideoCapture(video_path)
     frames = []
     while True:
-        ret, frame = cap.read()
+        with profiler.stage('decode'):
+            ret, frame = cap.read()
         if not ret:
             break
+        profiler.count('frames_decoded')
+        if frame_index is not None:
+            frame_index.add(cap)
         frames.append(frame)
     return frames
 
+def iter_video(video_path, frame_index=None):
+    # Yield the video frames one at a time so only the current frame is held in memory
+    cap = cv2.VideoCapture(video_path)
+    try:
+        while True:
+            with profiler.stage('decode'):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            profiler.count('frames_decoded')
+            if frame_index is not None:
+                frame_index.add(cap)
+            yield frame
+    finally:
+        cap.release()
+
+def iter_chunks(frames, chunk_size):
+    # Group an iterable of frames into lists of at most chunk_size frames
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class VideoWriter:
+    def __init__(self, output_video_path, fps=30):
+        # The underlying writer is opened lazily once the frame size is known
+        self.output_video_path = output_video_path
+        self.fps = fps
+        self.out = None
+
+    def write(self, frame):
+        # Append a single frame to the output video
+        if self.out is None:
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            self.out = cv2.VideoWriter(self.output_video_path, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+        with profiler.stage('encode'):
+            self.out.write(frame)
+        profiler.count('frames_encoded')
+
+    def release(self):
+        # Flush and close the output video
+        if self.out is not None:
+            self.out.release()
+            self.out = None
+
+class AsyncVideoWriter:
+    def __init__(self, output_video_path, fps=30, queue_size=32):
+        # VideoWriter that encodes on a background thread. The bounded queue keeps the producer at
+        # most queue_size frames ahead, and encoder errors are raised on the next write or release
+        self.video_writer = VideoWriter(output_video_path, fps)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.encode, daemon=True)
+        self.thread.start()
+
+    def encode(self):
+        # Encoder thread: write frames until the end marker, draining the queue after an error
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.video_writer.write(frame)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, frame):
+        # Queue a frame for encoding, the frame must not be modified afterwards
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def release(self):
+        # Encode the queued frames and close the output video
+        self.queue.put(None)
+        self.thread.join()
+        self.video_writer.release()
+        if self.error is not None:
+            raise self.error
+
+class LiveCapture:
+    def __init__(self, source, realtime=None):
+        # Capture a stream (URL, camera index or file) in a background thread that only keeps
+        # the newest frame, so a slow consumer skips frames instead of falling behind.
+        # Local files stand in for a live stream and are played at wall-clock speed
+        self.cap = cv2.VideoCapture(source)
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = self.is_file if realtime is None else realtime
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.condition = threading.Condition()
+        self.latest = None  # (frame_num, timestamp, capture_time, frame) of the newest frame
+        self.captured = 0  # Frames read from the source
+        self.overwritten = 0  # Frames replaced by a newer one before they were read
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.capture, daemon=True)
+        self.thread.start()
+
+    def capture(self):
+        # Capture thread: read frames and time-stamp them
+        start = time.monotonic()
+        while not self.stopped:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            frame_num = self.captured
+            self.captured += 1
+
+            if self.is_file:
+                # Files are time-stamped from their frame rate and optionally paced to it
+                timestamp = frame_num / self.fps
+                if self.realtime:
+                    delay = start + timestamp - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            else:
+                timestamp = time.monotonic() - start
+
+            with self.condition:
+                if self.latest is not None:
+                    self.overwritten += 1
+                self.latest = (frame_num, timestamp, time.monotonic(), frame)
+                self.condition.notify()
+
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+
+    def read(self):
+        # Wait for the newest frame, or return None once the stream has ended
+        with self.condition:
+            while self.latest is None and not self.finished:
+                self.condition.wait()
+            latest, self.latest = self.latest, None
+            return latest
+
+    def release(self):
+        # Stop the capture thread and close the source
+        self.stopped = True
+        self.thread.join(timeout=1)
+        self.cap.release()
+
+def render_frames(frames, draw_frame, video_writer, workers=4, chunk_size=16):
+    # Draw frames in place on worker threads, one chunk per task since a single frame only takes
+    # a fraction of a millisecond, and hand the finished chunks to the writer in order. With an
+    # AsyncVideoWriter, encoding overlaps with drawing. draw_frame(frame_num, frame) draws one frame
+    def draw_chunk(start_frame, chunk):
+        for frame_num, frame in enumerate(chunk, start_frame):
+            draw_frame(frame_num, frame)
+        return chunk
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        start_frame = 0
+        for chunk in iter_chunks(frames, chunk_size):
+            futures.append(executor.submit(draw_chunk, start_frame, chunk))
+            start_frame += len(chunk)
+            # Keep at most one chunk per worker in flight so memory stays bounded for streamed frames
+            while len(futures) > workers or (futures and futures[0].done()):
+                for frame in futures.pop(0).result():
+                    video_writer.write(frame)
+        for future in futures:
+            for frame in future.result():
+                video_writer.write(frame)
+    return start_frame
+
 def save_video(ouput_video_frames, output_video_path):
     # Save the list of frames as a video file
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out = cv2.VideoWriter(output_video_path, fourcc, 30, (ouput_video_frames[0].shape[1], ouput_video_frames[0].shape[0]))
+    out = VideoWriter(output_video_path, 30)
     for frame in ouput_video_frames:
         out.write(frame)
     out.release()